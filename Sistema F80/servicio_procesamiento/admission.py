@@ -0,0 +1,138 @@
+"""
+Control de admision de frames a la cola de inferencia.
+
+Antes de despachar un frame se revisa, en un solo script de Lua sobre el broker, la
+profundidad de `inference_queue` y cuantos frames de la camara siguen en vuelo (despachados
+y sin terminar su inferencia). Si la cola esta llena o la camara ya tiene trabajo pendiente
+el frame se omite; como el siguiente ciclo toma el frame mas reciente de la camara, los
+frames de una camara atrasada se juntan en uno solo en lugar de acumularse.
+
+Ademas cada tarea lleva `expires` = tiempo de captura + `max_frame_age`: Celery descarta
+los frames que llegan al worker despues de ese limite, asi que la latencia queda acotada
+aunque el sistema este saturado. El contador en vuelo se libera al terminar
+perform_inference o cuando Celery revoca la tarea por expirada; tiene TTL para que un
+worker que muere no deje bloqueada a su camara.
+"""
+import json
+import time
+from datetime import datetime, timezone
+
+import redis
+
+from pyinstaller_utils import resource_path
+
+INFERENCE_QUEUE = "inference_queue"
+INFLIGHT_PREFIX = "admission:inflight:"
+CONFIG = None
+CONTROLLER = None
+
+# KEYS: cola, contador de la camara. ARGV: max profundidad, max en vuelo, ttl.
+# Regresa el numero en vuelo si se admite, -1 si la cola esta llena, -2 si la camara esta ocupada.
+_ADMIT = """
+local max_depth = tonumber(ARGV[1])
+if max_depth > 0 and redis.call('LLEN', KEYS[1]) >= max_depth then
+    return -1
+end
+local inflight = redis.call('INCR', KEYS[2])
+local max_inflight = tonumber(ARGV[2])
+if max_inflight > 0 and inflight > max_inflight then
+    redis.call('DECR', KEYS[2])
+    return -2
+end
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return inflight
+"""
+_RELEASE = """
+local inflight = redis.call('DECR', KEYS[1])
+if inflight <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return inflight
+"""
+REASONS = {-1: "queue_full", -2: "camera_busy"}
+
+
+class AdmissionController:
+    def __init__(self, client, max_queue_depth=16, max_inflight_per_camera=1, max_frame_age=20.0,
+                 inflight_ttl=120, enabled=True):
+        self.client = client
+        self.max_queue_depth = int(max_queue_depth)
+        self.max_inflight_per_camera = int(max_inflight_per_camera)
+        self.max_frame_age = float(max_frame_age)
+        self.inflight_ttl = int(inflight_ttl)
+        self.enabled = bool(enabled)
+        self._admit = client.register_script(_ADMIT)
+        self._release = client.register_script(_RELEASE)
+
+    def admit(self, camera_id, queue=INFERENCE_QUEUE):
+        """
+        Regresa (admitido, motivo). Si Redis no responde se admite el frame: sin broker
+        tampoco se puede encolar, y el error se reporta al despachar.
+        """
+        if not self.enabled:
+            return True, None
+        try:
+            result = self._admit(
+                keys=[queue, INFLIGHT_PREFIX + str(camera_id)],
+                args=[self.max_queue_depth, self.max_inflight_per_camera, self.inflight_ttl],
+            )
+        except redis.RedisError as e:
+            print(f"Error en el control de admision, se admite el frame: {e}")
+            return True, None
+        if result < 0:
+            return False, REASONS[result]
+        return True, None
+
+    def release(self, camera_id):
+        if not self.enabled:
+            return
+        try:
+            self._release(keys=[INFLIGHT_PREFIX + str(camera_id)])
+        except redis.RedisError as e:
+            print(f"Error liberando el frame en vuelo de la camara {camera_id}: {e}")
+
+    def inflight(self, camera_id):
+        return int(self.client.get(INFLIGHT_PREFIX + str(camera_id)) or 0)
+
+    def expires(self, capture_ts):
+        """Fecha limite para `expires` de Celery, o None si no hay limite de antiguedad."""
+        if self.max_frame_age <= 0 or capture_ts is None:
+            return None
+        return datetime.fromtimestamp(float(capture_ts) + self.max_frame_age, timezone.utc)
+
+    def is_stale(self, capture_ts, now=None):
+        if self.max_frame_age <= 0 or capture_ts is None:
+            return False
+        return (now or time.time()) - float(capture_ts) > self.max_frame_age
+
+
+def load_resources():
+    """Carga la seccion "admission" de config_general.json y crea el controlador una sola vez."""
+    global CONFIG, CONTROLLER
+    if CONFIG is None:
+        try:
+            config_path = resource_path("configs/config_general.json")
+            with open(config_path, 'r') as f:
+                CONFIG = json.load(f).get("admission", {})
+        except Exception as e:
+            print(f"Error cargando el config de admision: {e}")
+            CONFIG = {}
+    if CONTROLLER is None:
+        CONTROLLER = AdmissionController(redis.Redis(host='localhost', port=6379, db=0), **CONFIG)
+    return CONTROLLER
+
+
+def admit(camera_id):
+    return load_resources().admit(camera_id)
+
+
+def release(camera_id):
+    load_resources().release(camera_id)
+
+
+def expires(capture_ts):
+    return load_resources().expires(capture_ts)
+
+
+def is_stale(capture_ts):
+    return load_resources().is_stale(capture_ts)
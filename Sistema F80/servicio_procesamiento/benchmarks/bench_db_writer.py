@@ -0,0 +1,135 @@
+"""
+Benchmark del guardado de resultados en PostgreSQL.
+
+Compara el esquema anterior de save_to_db (una conexion nueva y un INSERT de una fila
+por resultado) contra workers.db_writer.ResultWriter (pool de conexiones e INSERT de
+varias filas por lote) con varios hilos productores, como varios procesos de camara.
+Usa una tabla propia (`results_bench` por defecto) con las mismas columnas que
+`results`; se crea al inicio y se borra al final.
+
+Uso (desde servicio_procesamiento, con un PostgreSQL local):
+    python -m benchmarks.bench_db_writer --resultados 2000 --productores 8
+    python -m benchmarks.bench_db_writer --host localhost --database PerfectBlend --user postgres --password ecn
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import psycopg2
+
+from workers.db_writer import RESULT_COLUMNS, ResultWriter, result_row
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id SERIAL PRIMARY KEY,
+        timestamp TIMESTAMPTZ,
+        camera_id TEXT,
+        f10 DOUBLE PRECISION, f20 DOUBLE PRECISION, f30 DOUBLE PRECISION, f40 DOUBLE PRECISION,
+        f50 DOUBLE PRECISION, f60 DOUBLE PRECISION, f70 DOUBLE PRECISION, f80 DOUBLE PRECISION,
+        f90 DOUBLE PRECISION, f100 DOUBLE PRECISION,
+        f10_ajst DOUBLE PRECISION, f20_ajst DOUBLE PRECISION, f30_ajst DOUBLE PRECISION,
+        f40_ajst DOUBLE PRECISION, f50_ajst DOUBLE PRECISION, f60_ajst DOUBLE PRECISION,
+        f70_ajst DOUBLE PRECISION, f80_ajst DOUBLE PRECISION, f90_ajst DOUBLE PRECISION,
+        f100_ajst DOUBLE PRECISION,
+        simulation BOOLEAN,
+        og_img_path TEXT,
+        seg_img_path TEXT
+    )
+"""
+
+
+def make_results(n, n_cameras=8, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime.now(timezone.utc)
+    rows = []
+    for i in range(n):
+        fs = np.sort(rng.uniform(1, 60, size=10)).tolist()
+        results = {
+            "capture_time": (start + timedelta(milliseconds=i)).isoformat(),
+            "cam_id": f"camera_{i % n_cameras}",
+            "Fs": fs,
+            "Fs_ajust": fs,
+            "sim": True,
+        }
+        rows.append(result_row(results, f"og_{i}.jpeg", f"seg_{i}.jpeg"))
+    return rows
+
+
+def legacy_insert(db_params, table, row):
+    conn = psycopg2.connect(**db_params)
+    try:
+        cur = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(RESULT_COLUMNS))
+        cur.execute(f"INSERT INTO {table} ({', '.join(RESULT_COLUMNS)}) VALUES ({placeholders});", row)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def run_producers(rows, n_producers, write):
+    chunks = [rows[i::n_producers] for i in range(n_producers)]
+    threads = [threading.Thread(target=lambda c=c: [write(r) for r in c]) for c in chunks]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return start
+
+
+def count_rows(db_params, table):
+    with psycopg2.connect(**db_params) as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {table}")
+        return cur.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--database", default="PerfectBlend")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="ecn")
+    parser.add_argument("--tabla", default="results_bench")
+    parser.add_argument("--resultados", type=int, default=2000)
+    parser.add_argument("--productores", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    db_params = {"host": args.host, "port": args.port, "database": args.database,
+                 "user": args.user, "password": args.password}
+    rows = make_results(args.resultados)
+    with psycopg2.connect(**db_params) as conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {args.tabla}")
+        cur.execute(CREATE_TABLE.format(table=args.tabla))
+
+    try:
+        start = run_producers(rows, args.productores, lambda r: legacy_insert(db_params, args.tabla, r))
+        t_legacy = time.perf_counter() - start
+        n_legacy = count_rows(db_params, args.tabla)
+
+        writer = ResultWriter(db_params, table=args.tabla, batch_size=args.batch_size,
+                              flush_interval=args.flush_interval, pool_max=args.productores,
+                              stats_interval=0)
+        start = run_producers(rows, args.productores, writer.write)
+        writer.close()
+        t_writer = time.perf_counter() - start
+        n_writer = count_rows(db_params, args.tabla) - n_legacy
+        stats = writer.stats()
+    finally:
+        with psycopg2.connect(**db_params) as conn, conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {args.tabla}")
+
+    print(f"{args.resultados} resultados, {args.productores} productores")
+    print(f"  conexion + INSERT por fila: {t_legacy:7.2f} s  {n_legacy / t_legacy:8.0f} filas/s  ({n_legacy} filas)")
+    print(f"  ResultWriter:               {t_writer:7.2f} s  {n_writer / t_writer:8.0f} filas/s  ({n_writer} filas)")
+    print(f"  lotes: {stats['batches']}, flush promedio {stats['avg_flush_ms']} ms, "
+          f"maximo {stats['max_flush_ms']} ms, {stats['insert_rows_per_s']} filas/s dentro del INSERT")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark de la de-duplicacion de detecciones entre recortes traslapados.
+
+Genera un frame denso de 1920x592 con particulas vistas por uno o varios recortes (las
+que caen en franjas de traslape aparecen duplicadas con ruido) y aplica a cada recorte el
+NMS del modelo (IoU TILE_NMS_IOU, como MODEL.predict). Sobre esas detecciones compara
+la de-duplicacion actual, un NMS global de cv2 con NMS_THRESHOLD, contra
+workers.dedup.seam_deduplicate en tiempo y en detecciones conservadas.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.bench_dedup --particulas 1000 2000 4000 8000
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from workers.dedup import seam_deduplicate
+
+CONF = 0.3
+NMS_THRESHOLD = 0.3
+TILE_NMS_IOU = 0.7
+SLICE = 640
+OVERLAP = 0.2
+
+
+def make_tiled_detections(n_particles, width=1920, height=592, seed=0):
+    rng = np.random.default_rng(seed)
+    step = int(SLICE * (1 - OVERLAP))
+    coords = [(x, y) for y in range(0, height, step) for x in range(0, width, step)]
+    centers = rng.uniform([0, 0], [width, height], size=(n_particles, 2))
+    half = rng.uniform(3, 10, size=(n_particles, 2))
+    particles = np.concatenate([centers - half, centers + half], axis=1)
+    particle_scores = rng.uniform(CONF + 0.05, 1.0, size=n_particles)
+
+    boxes, scores = [], []
+    for x1, y1 in coords:
+        x2, y2 = min(x1 + SLICE, width), min(y1 + SLICE, height)
+        inside = (particles[:, 0] >= x1) & (particles[:, 2] <= x2) & (particles[:, 1] >= y1) & (particles[:, 3] <= y2)
+        tile_boxes = particles[inside] + rng.normal(0, 0.7, size=(inside.sum(), 4))
+        tile_scores = (particle_scores[inside] + rng.normal(0, 0.02, size=inside.sum())).astype(np.float32)
+        xywh = tile_boxes.astype(np.int32)
+        xywh[:, 2:] -= xywh[:, :2]
+        # NMS del modelo dentro del recorte.
+        keep = cv2.dnn.NMSBoxes(xywh, tile_scores, CONF, TILE_NMS_IOU)
+        keep = np.asarray(keep, dtype=np.int64).flatten()
+        boxes.append(tile_boxes[keep])
+        scores.append(tile_scores[keep])
+    return np.concatenate(boxes).astype(np.int32), np.concatenate(scores)
+
+
+def _median_time(fn, repetitions):
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return np.median(times), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--particulas", type=int, nargs="+", default=[1000, 2000, 4000, 8000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'particulas':>10} {'detecciones':>11} {'NMS cv2 ms':>10} {'seam ms':>8} {'acel.':>6} {'iguales':>8}")
+    for n in args.particulas:
+        boxes, scores = make_tiled_detections(n)
+        xywh = boxes.copy()
+        xywh[:, 2:] -= xywh[:, :2]
+
+        def global_nms():
+            idx = cv2.dnn.NMSBoxes(xywh, scores, CONF, NMS_THRESHOLD)
+            return np.asarray(idx, dtype=np.int64).flatten()
+
+        def seam():
+            return seam_deduplicate(boxes, scores, CONF, NMS_THRESHOLD)
+
+        t_nms, ref = _median_time(global_nms, args.repeticiones)
+        t_seam, got = _median_time(seam, args.repeticiones)
+        same = set(ref.tolist()) == set(got.tolist())
+        print(f"{n:>10} {len(boxes):>11} {t_nms * 1000:>10.2f} {t_seam * 1000:>8.2f} {t_nms / t_seam:>6.1f} {str(same):>8}")
+
+
+if __name__ == "__main__":
+    main()
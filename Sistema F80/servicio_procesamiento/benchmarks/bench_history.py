@@ -0,0 +1,105 @@
+"""
+Benchmark del historial por camara en Redis con varios workers de procesamiento.
+
+Lanza N procesos que, igual que process_granulometry, agregan las mediciones de un frame
+al historial de la misma camara y leen la ventana. Compara el esquema anterior (JSON con
+LPUSH, LLEN, LTRIM y LRANGE por separado) contra workers.history.RedisHistory (float32
+binario y un solo script Lua). Reporta latencia por frame, bytes por frame y cuantas
+ventanas leidas no tenian exactamente `window_size` frames una vez lleno el historial.
+
+Requiere un servidor Redis; usa la base --db y borra solo las llaves del benchmark.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.bench_history --workers 1 4 8 --elipses 1000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+import redis
+
+from workers.history import RedisHistory, encode_axes
+
+CAMERA_ID = "bench"
+LEGACY_KEY = f"bench:history:{CAMERA_ID}"
+
+
+def legacy_push_and_window(client, area_ar, window_size):
+    client.lpush(LEGACY_KEY, json.dumps(area_ar))
+    current_size = client.llen(LEGACY_KEY)
+    if current_size < window_size:
+        return None
+    client.ltrim(LEGACY_KEY, 0, window_size - 1)
+    return client.lrange(LEGACY_KEY, 0, -1)
+
+
+def worker(mode, args, n_ellipses, seed, start_evt, out):
+    client = redis.Redis(host=args.host, port=args.port, db=args.db)
+    history = RedisHistory(client, args.ventana, prefix="bench:history:f32:")
+    rng = np.random.default_rng(seed)
+    area_ar = rng.lognormal(3.0, 0.6, size=(n_ellipses, 2)).tolist()
+    latencies, bad = [], 0
+    start_evt.wait()
+    for _ in range(args.frames):
+        start = time.perf_counter()
+        if mode == "anterior":
+            window = legacy_push_and_window(client, area_ar, args.ventana)
+        else:
+            window = history.push_and_window(CAMERA_ID, area_ar)
+            if len(window) < args.ventana:
+                window = None
+        latencies.append(time.perf_counter() - start)
+        if window is not None and len(window) != args.ventana:
+            bad += 1
+    out.put((latencies, bad))
+
+
+def run(mode, n_workers, args):
+    client = redis.Redis(host=args.host, port=args.port, db=args.db)
+    client.delete(LEGACY_KEY, f"bench:history:f32:{CAMERA_ID}")
+    start_evt = mp.Event()
+    out = mp.Queue()
+    procs = [
+        mp.Process(target=worker, args=(mode, args, args.elipses, i, start_evt, out))
+        for i in range(n_workers)
+    ]
+    for p in procs:
+        p.start()
+    time.sleep(0.5)
+    start = time.perf_counter()
+    start_evt.set()
+    results = [out.get() for _ in procs]
+    elapsed = time.perf_counter() - start
+    for p in procs:
+        p.join()
+    client.delete(LEGACY_KEY, f"bench:history:f32:{CAMERA_ID}")
+    latencies = np.concatenate([r[0] for r in results]) * 1000
+    bad = sum(r[1] for r in results)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), len(latencies) / elapsed, bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--ventana", type=int, default=10)
+    parser.add_argument("--elipses", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=200, help="frames por worker")
+    args = parser.parse_args()
+
+    area_ar = np.random.default_rng(0).lognormal(3.0, 0.6, size=(args.elipses, 2)).tolist()
+    print(f"bytes por frame ({args.elipses} elipses): JSON {len(json.dumps(area_ar).encode())}, "
+          f"float32 {len(encode_axes(area_ar))}")
+    print(f"{'workers':>7} {'modo':>8} {'p50 ms':>7} {'p95 ms':>7} {'frames/s':>9} {'ventanas malas':>14}")
+    for n_workers in args.workers:
+        for mode in ("anterior", "lua"):
+            p50, p95, rate, bad = run(mode, n_workers, args)
+            print(f"{n_workers:>7} {mode:>8} {p50:>7.2f} {p95:>7.2f} {rate:>9.0f} {bad:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Micro-benchmark del post-procesamiento de detecciones de perform_inference.
+
+Compara la version anterior (ciclos de Python caja por caja y .tolist() por mascara)
+contra workers.postprocess sobre un frame denso sintetico de 1920x592 y verifica que
+ambas den el mismo resultado.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.bench_postprocess --detecciones 2000 --repeticiones 20
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from workers.postprocess import (
+    merge_tile_detections, select, boxes_xywh, polygon_areas, ellipse_axes,
+)
+
+NMS_THRESHOLD = 0.3
+CONF = 0.3
+
+
+class _Tensor:
+    """Imita lo minimo de un tensor de torch que usa el codigo de inferencia."""
+
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, item):
+        return self.array[item]
+
+    def __float__(self):
+        return float(self.array.reshape(-1)[0])
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Box:
+    def __init__(self, xyxy, conf):
+        self.xyxy = _Tensor(xyxy.reshape(1, 4))
+        self.conf = _Tensor(np.array([conf], dtype=np.float32))
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf):
+        self.xyxy = _Tensor(xyxy)
+        self.conf = _Tensor(conf)
+
+    def __iter__(self):
+        return (_Box(b, c) for b, c in zip(self.xyxy.array, self.conf.array))
+
+
+class _Masks:
+    def __init__(self, xy):
+        self.xy = xy
+
+
+class _Result:
+    def __init__(self, xyxy, conf, polygons):
+        self.boxes = _Boxes(xyxy, conf)
+        self.masks = _Masks(polygons)
+
+
+def make_dense_frame(n_detections, width=1920, height=592, slice_size=640, overlap=0.2, seed=0):
+    """Genera resultados sinteticos por recorte con particulas pequenas (poligonos de ~24 vertices)."""
+    rng = np.random.default_rng(seed)
+    step = int(slice_size * (1 - overlap))
+    coords = [(x, y) for y in range(0, height, step) for x in range(0, width, step)]
+    per_tile = max(1, n_detections // len(coords))
+    results = []
+    for x1, y1 in coords:
+        tw = min(slice_size, width - x1)
+        th = min(slice_size, height - y1)
+        centers = rng.uniform([8, 8], [max(9, tw - 8), max(9, th - 8)], size=(per_tile, 2))
+        radii = rng.uniform(3, 8, size=(per_tile, 2))
+        angles = np.linspace(0, 2 * np.pi, 24, endpoint=False)
+        polygons = []
+        for (cx, cy), (rx, ry) in zip(centers, radii):
+            poly = np.stack([cx + rx * np.cos(angles), cy + ry * np.sin(angles)], axis=1)
+            polygons.append(poly.astype(np.float32))
+        xyxy = np.concatenate([centers - radii, centers + radii], axis=1).astype(np.float32)
+        conf = rng.uniform(CONF, 1.0, size=per_tile).astype(np.float32)
+        results.append(_Result(xyxy, conf, polygons))
+    return results, coords
+
+
+def legacy_postprocess(batch_results, slice_coords, frame_shape):
+    all_boxes = []
+    all_scores = []
+    all_masks = []
+    for result, (x1, y1) in zip(batch_results, slice_coords):
+        if result.masks is not None:
+            for box, mask in zip(result.boxes, result.masks.xy):
+                global_box = [box.xyxy[0][0] + x1, box.xyxy[0][1] + y1, box.xyxy[0][2] + x1, box.xyxy[0][3] + y1]
+                global_mask = mask + [x1, y1]
+                all_boxes.append([int(b) for b in global_box])
+                all_scores.append(float(box.conf))
+                all_masks.append(global_mask.astype(int).tolist())
+
+    boxes_for_nms = [[box[0], box[1], box[2] - box[0], box[3] - box[1]] for box in all_boxes]
+    indices = cv2.dnn.NMSBoxes(boxes_for_nms, all_scores, CONF, NMS_THRESHOLD)
+    indices = indices.flatten() if len(indices) > 0 else []
+    final_masks = [all_masks[i] for i in indices]
+
+    area_ar = []
+    for mask_points in final_masks:
+        if len(mask_points) >= 5:
+            ellipse = cv2.fitEllipse(np.array(mask_points, dtype=np.int32))
+            area_ar.append(ellipse[1])
+
+    overlay = np.zeros(frame_shape, np.uint8)
+    pts_for_poly = [np.array(mask, dtype=np.int32) for mask in final_masks]
+    cv2.fillPoly(overlay, pts_for_poly, (0, 255, 0))
+
+    total_mask_area = 0.0
+    for mask_points in final_masks:
+        total_mask_area += cv2.contourArea(np.array(mask_points, dtype=np.int32))
+    return area_ar, total_mask_area
+
+
+def vectorized_postprocess(batch_results, slice_coords, frame_shape):
+    tiles = [(r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.masks.xy) for r in batch_results]
+    detections = merge_tile_detections(tiles, slice_coords)
+    indices = cv2.dnn.NMSBoxes(boxes_xywh(detections), detections.scores, CONF, NMS_THRESHOLD)
+    indices = indices.flatten() if len(indices) > 0 else []
+    detections = select(detections, indices)
+    area_ar = ellipse_axes(detections).tolist()
+    overlay = np.zeros(frame_shape, np.uint8)
+    cv2.fillPoly(overlay, detections.polygons(), (0, 255, 0))
+    total_mask_area = float(polygon_areas(detections).sum())
+    return area_ar, total_mask_area
+
+
+def _time(fn, repetitions, *args):
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        out = fn(*args)
+        times.append(time.perf_counter() - start)
+    return np.median(times), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detecciones", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    frame_shape = (592, 1920, 3)
+    batch_results, coords = make_dense_frame(args.detecciones)
+    t_legacy, (areas_legacy, total_legacy) = _time(legacy_postprocess, args.repeticiones, batch_results, coords, frame_shape)
+    t_new, (areas_new, total_new) = _time(vectorized_postprocess, args.repeticiones, batch_results, coords, frame_shape)
+
+    same = np.allclose(np.asarray(areas_legacy), np.asarray(areas_new)) and np.isclose(total_legacy, total_new)
+    print(f"Detecciones por frame: {args.detecciones} ({len(areas_new)} despues de NMS)")
+    print(f"Anterior:     {t_legacy * 1000:8.2f} ms")
+    print(f"Vectorizado:  {t_new * 1000:8.2f} ms")
+    print(f"Aceleracion:  {t_legacy / t_new:8.2f}x")
+    print(f"Resultados iguales: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark del pre-procesamiento de frames (CLAHE + correccion de distorsion).
+
+Compara el pre-procesamiento anterior (CLAHE nuevo en cada llamada, split/merge de
+canales y cv2.undistort) contra workers.preprocess.FramePreprocessor (mapas de remap
+precalculados, CLAHE y buffers reutilizados) sobre un frame de 1920x592 y verifica que
+ambos den la misma imagen. Con --calibracion se usa el pickle real de la camara; si no,
+una calibracion sintetica con distorsion radial. Con --modelo (un .onnx) tambien mide el
+modelo sobre los recortes del mismo frame para ver el costo relativo de cada etapa.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.bench_preprocess --repeticiones 50
+    python -m benchmarks.bench_preprocess --calibracion calibracion.pkl --modelo modelo.onnx
+"""
+import argparse
+import pickle
+import time
+
+import cv2
+import numpy as np
+
+from workers.preprocess import FramePreprocessor
+
+WIDTH, HEIGHT = 1920, 592
+SLICE = 640
+OVERLAP = 0.2
+
+
+def legacy_pre_process(frame, mtx, dist, newcameramtx):
+    ycrcb = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb)
+    y, cr, cb = cv2.split(ycrcb)
+    clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
+    y_clahe = clahe.apply(y)
+    merged = cv2.merge((y_clahe, cr, cb))
+    img = cv2.cvtColor(merged, cv2.COLOR_YCrCb2BGR)
+    return cv2.undistort(img, mtx, dist, None, newcameramtx)
+
+
+def synthetic_calibration():
+    mtx = np.array([[1400.0, 0.0, WIDTH / 2], [0.0, 1400.0, HEIGHT / 2], [0.0, 0.0, 1.0]])
+    dist = np.array([-0.3, 0.1, 0.001, 0.001, -0.02])
+    newcameramtx, _ = cv2.getOptimalNewCameraMatrix(mtx, dist, (WIDTH, HEIGHT), 0.5)
+    return mtx, dist, newcameramtx
+
+
+def synthetic_frame(seed=0):
+    # Ruido suavizado: textura parecida a material granular, con gradientes para CLAHE.
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, size=(HEIGHT, WIDTH, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 3)
+
+
+def slice_frame(frame):
+    step = int(SLICE * (1 - OVERLAP))
+    h, w = frame.shape[:2]
+    return [frame[y:y + SLICE, x:x + SLICE] for y in range(0, h, step) for x in range(0, w, step)]
+
+
+def _median_time(fn, repetitions):
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return np.median(times), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=30)
+    parser.add_argument("--calibracion", help="pickle con mtx, dist y newcameramtx")
+    parser.add_argument("--imagen", help="imagen de prueba; por defecto un frame sintetico de 1920x592")
+    parser.add_argument("--modelo", help="modelo .onnx para medir la inferencia sobre los recortes")
+    args = parser.parse_args()
+
+    if args.calibracion:
+        with open(args.calibracion, "rb") as f:
+            cal = pickle.load(f)
+        mtx, dist, newcameramtx = cal["mtx"], cal["dist"], cal["newcameramtx"]
+    else:
+        mtx, dist, newcameramtx = synthetic_calibration()
+    frame = cv2.imread(args.imagen) if args.imagen else synthetic_frame()
+
+    preprocessor = FramePreprocessor(mtx, dist, newcameramtx)
+    start = time.perf_counter()
+    preprocessor(frame)
+    t_first = time.perf_counter() - start
+
+    t_legacy, ref = _median_time(lambda: legacy_pre_process(frame, mtx, dist, newcameramtx), args.repeticiones)
+    t_new, got = _median_time(lambda: preprocessor(frame), args.repeticiones)
+
+    print(f"frame {frame.shape[1]}x{frame.shape[0]}, {args.repeticiones} repeticiones (mediana)")
+    print(f"  pre-procesamiento anterior: {t_legacy * 1000:8.2f} ms")
+    print(f"  FramePreprocessor:          {t_new * 1000:8.2f} ms  (primer frame con mapas: {t_first * 1000:.2f} ms)")
+    print(f"  aceleracion: {t_legacy / t_new:.1f}x, resultados iguales: {np.array_equal(ref, got)}")
+
+    if args.modelo:
+        from workers.onnx_backend import OnnxSegmentationEngine
+
+        engine = OnnxSegmentationEngine(args.modelo, imgsz=SLICE)
+        slices = slice_frame(got)
+        engine.predict(slices)
+        t_model, _ = _median_time(lambda: engine.predict(slices), max(args.repeticiones // 5, 3))
+        print(f"  modelo ({len(slices)} recortes):      {t_model * 1000:8.2f} ms")
+        print(f"  pre-procesamiento / modelo: {t_new / t_model * 100:.1f}% (antes {t_legacy / t_model * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
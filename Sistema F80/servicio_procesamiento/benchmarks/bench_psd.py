@@ -0,0 +1,87 @@
+"""
+Benchmark del calculo de Fs sobre la ventana deslizante del historial.
+
+Simula la secuencia de frames de una camara, cada uno como elemento JSON (formato
+anterior del historial) y como float32 binario (workers.history), y para cada frame una
+vez llena la ventana compara el calculo anterior (decodificar toda la ventana, DataFrame
+de pandas, sort_values e interp1d de scipy) contra workers.psd.PSDWindow, que solo
+procesa el frame que entra y el que sale. Reporta el tiempo por frame y la diferencia maxima entre los Fs.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.bench_psd --ventanas 10 30 --elipses 500 2000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import interp1d
+
+from workers.history import encode_axes
+from workers.psd import PSDWindow
+
+PX_MM = 1.60
+
+
+def legacy_fs(all_data_json, px_mm):
+    combined_ellips_list = []
+    for item_json in all_data_json:
+        area_ar_list = json.loads(item_json)
+        ellipses = [[max(ejes) * px_mm, min(ejes) * px_mm] for ejes in area_ar_list]
+        combined_ellips_list.extend(ellipses)
+    rect_df = pd.DataFrame(combined_ellips_list, columns=["eje_M", "eje_m"])
+    rect_df["ell_vol"] = (4/3 * np.pi * (rect_df["eje_M"] / 2) * np.power((rect_df["eje_m"] / 2), 2))
+    ellips_df = rect_df.sort_values("eje_m")
+    histvalues_vol = ellips_df["ell_vol"] / ellips_df["ell_vol"].sum()*100
+    ellips_df["cumulative"] = np.cumsum(histvalues_vol)
+    psd = interp1d(ellips_df["cumulative"].tolist(), ellips_df["eje_m"].tolist())
+    Fs = psd([10, 20, 30, 40, 50, 60, 70, 80, 90])
+    return np.append(Fs, max(ellips_df["eje_m"]))
+
+
+def make_frames(n_frames, n_ellipses, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n_frames):
+        n = int(rng.integers(n_ellipses // 2, n_ellipses + 1))
+        # Valores representables en float32 para que ambos formatos lleven los mismos ejes.
+        axes = rng.lognormal(mean=3.0, sigma=0.6, size=(n, 2)).astype(np.float32).astype(np.float64)
+        frames.append((json.dumps(axes.tolist()).encode(), encode_axes(axes)))
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ventanas", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--elipses", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--frames", type=int, default=60)
+    args = parser.parse_args()
+
+    print(f"{'ventana':>7} {'elipses':>7} {'anterior ms':>11} {'PSDWindow ms':>12} {'acel.':>6} {'dif. max':>9}")
+    for window_size in args.ventanas:
+        for n_ellipses in args.elipses:
+            frames = make_frames(args.frames + window_size, n_ellipses)
+            window = PSDWindow(PX_MM)
+            history, history_bin = [], []
+            t_legacy, t_new, max_diff = [], [], 0.0
+            for item, item_bin in frames:
+                # Mismo orden que LPUSH + LTRIM + LRANGE: el mas reciente primero.
+                history = [item] + history[:window_size - 1]
+                history_bin = [item_bin] + history_bin[:window_size - 1]
+                if len(history) < window_size:
+                    continue
+                start = time.perf_counter()
+                ref = legacy_fs(history, PX_MM)
+                t_legacy.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                window.sync(history_bin)
+                got = window.fs()
+                t_new.append(time.perf_counter() - start)
+                max_diff = max(max_diff, float(np.abs(ref - got).max()))
+            legacy_ms, new_ms = np.median(t_legacy) * 1000, np.median(t_new) * 1000
+            print(f"{window_size:>7} {n_ellipses:>7} {legacy_ms:>11.2f} {new_ms:>12.2f} {legacy_ms / new_ms:>6.1f} {max_diff:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
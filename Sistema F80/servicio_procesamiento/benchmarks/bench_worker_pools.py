@@ -0,0 +1,161 @@
+"""
+Benchmark de los pools de worker para el trabajo de CPU (ver worker_profiles.py).
+
+Cada "frame" hace el trabajo de CPU de un frame en los workers: pre-procesamiento
+(workers.preprocess.FramePreprocessor sobre un frame de 1920x592), el modelo ONNX sobre
+los recortes si se pasa --modelo, y el calculo de los Fs de una ventana deslizante
+(workers.psd.PSDWindow). El mismo trabajo se corre con cada pool:
+
+    gevent   N greenlets en un proceso, sin limite de hilos (perfil anterior)
+    threads  N hilos en un proceso que comparten un solo modelo con `predict`
+             serializado; ONNX/OpenCV/BLAS usan todos los nucleos
+    prefork  N procesos, cada uno con su modelo y los hilos limitados (perfil de
+             inference_queue)
+
+Cada pool corre en un proceso nuevo para que el monkey-patch de gevent y los limites de
+hilos se apliquen antes de importar numpy/OpenCV, igual que en run.py. Reporta frames
+por segundo; conviene correrlo en una maquina con varios nucleos.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.bench_worker_pools --frames 200
+    python -m benchmarks.bench_worker_pools --pools threads prefork --concurrencia 2 4 8 --modelo modelo.onnx
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+WINDOW = 10
+ELLIPSES = 1000
+STATE = None
+
+
+def _state(model_path):
+    global STATE
+    if STATE is None:
+        import cv2
+        import numpy as np
+
+        from benchmarks.bench_preprocess import slice_frame, synthetic_calibration, synthetic_frame
+        from workers.history import encode_axes
+        from workers.preprocess import FramePreprocessor
+        from workers.psd import PSDWindow
+
+        if os.environ.get("F80_CV_THREADS"):
+            cv2.setNumThreads(int(os.environ["F80_CV_THREADS"]))
+        rng = np.random.default_rng(os.getpid())
+        engine = None
+        if model_path:
+            from workers.onnx_backend import OnnxSegmentationEngine
+
+            engine = OnnxSegmentationEngine(
+                model_path, intra_op_threads=int(os.environ.get("F80_ORT_INTRA_OP_THREADS", 0))
+            )
+        STATE = {
+            "preprocessor": FramePreprocessor(*synthetic_calibration()),
+            "frame": synthetic_frame(),
+            "slice_frame": slice_frame,
+            "engine": engine,
+            "psd": PSDWindow(1.60),
+            "items": [encode_axes(rng.lognormal(3.0, 0.6, size=(ELLIPSES, 2))) for _ in range(WINDOW * 3)],
+            "count": 0,
+        }
+    return STATE
+
+
+def frame_work(i, model_path=None):
+    state = _state(model_path)
+    frame = state["preprocessor"](state["frame"])
+    if state["engine"] is not None:
+        state["engine"].predict(state["slice_frame"](frame))
+    # Cada frame desplaza la ventana un elemento, como process_granulometry.
+    items = state["items"]
+    start = i % (len(items) - WINDOW)
+    with state["psd"].lock:
+        state["psd"].sync(items[start:start + WINDOW])
+        state["psd"].fs()
+    return i
+
+
+def _frame_work_star(args):
+    return frame_work(*args)
+
+
+def run_pool(pool, concurrency, frames, model_path):
+    """Corre `frames` frames (mas un calentamiento por worker) y regresa los fps."""
+    tasks = [(i, model_path) for i in range(frames)]
+    warmup = [(i, model_path) for i in range(concurrency)]
+    if pool == "gevent":
+        from gevent.pool import Pool
+
+        executor = Pool(concurrency)
+        executor.map(_frame_work_star, warmup)
+        start = time.perf_counter()
+        executor.map(_frame_work_star, tasks)
+        return frames / (time.perf_counter() - start)
+    if pool == "threads":
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(_frame_work_star, warmup))
+            start = time.perf_counter()
+            list(executor.map(_frame_work_star, tasks))
+            return frames / (time.perf_counter() - start)
+    import multiprocessing as mp
+
+    with mp.get_context("spawn").Pool(concurrency) as executor:
+        # chunksize=1 y un calentamiento por proceso para no medir la carga de OpenCV/ONNX.
+        executor.map(_frame_work_star, warmup * 2, chunksize=1)
+        start = time.perf_counter()
+        executor.map(_frame_work_star, tasks, chunksize=1)
+        return frames / (time.perf_counter() - start)
+
+
+def _child(args):
+    from worker_profiles import apply_thread_limits, worker_profile
+
+    pool, concurrency, threads = worker_profile("inference_queue", args.concurrencia[0], args.pools[0])
+    if pool == "gevent":
+        from gevent import monkey
+
+        monkey.patch_all()
+    else:
+        apply_thread_limits(threads)
+    fps = run_pool(pool, concurrency, args.frames, args.modelo)
+    print(json.dumps({"pool": pool, "concurrency": concurrency, "threads": threads, "fps": fps}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pools", nargs="+", default=["gevent", "threads", "prefork"])
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--modelo", help="modelo .onnx para incluir la inferencia en cada frame")
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.hijo:
+        _child(args)
+        return
+
+    print(f"{os.cpu_count()} nucleos, {args.frames} frames por prueba"
+          f"{', con modelo' if args.modelo else ', sin modelo'}")
+    print(f"{'pool':>8} {'concurrencia':>12} {'hilos/tarea':>11} {'fps':>8}")
+    for pool in args.pools:
+        for concurrency in args.concurrencia:
+            command = [sys.executable, "-m", "benchmarks.bench_worker_pools", "--hijo", "--pools", pool,
+                       "--concurrencia", str(concurrency), "--frames", str(args.frames)]
+            if args.modelo:
+                command += ["--modelo", args.modelo]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"{pool:>8} {concurrency:>12} error: {result.stderr.strip().splitlines()[-1:]}")
+                continue
+            row = json.loads(result.stdout.strip().splitlines()[-1])
+            threads = row["threads"] if row["threads"] is not None else "-"
+            print(f"{row['pool']:>8} {row['concurrency']:>12} {threads:>11} {row['fps']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Benchmark de reproduccion: pasa una carpeta de imagenes (como las de
+`simulation_source`) por cada etapa del procesamiento y por la cadena completa, sin
+Redis, PostgreSQL ni camaras.
+
+Etapas medidas por separado, frame por frame (la salida de cada una es la entrada de la
+siguiente):
+
+    pre-procesamiento   workers.inference.pre_process_image (decodificar, CLAHE, remap)
+    inferencia          recortes + modelo (workers.inference.slice_frame/predict_slices)
+    post-procesamiento  union de recortes, deduplicacion/NMS y elipses
+    imagenes            overlay de la segmentacion y codificacion JPEG
+    psd                 workers.process.compute_granulometry con historial en memoria
+    guardado            workers.database.persist_result con un sumidero SQLite temporal
+                        y el archivo de imagenes en un directorio temporal
+
+Despues corre la cadena completa con pipeline.StreamingPipeline (los mismos hilos y
+colas acotadas del modo `run.py pipeline`) alimentada con los mismos frames. Con
+--hilos > 1 los hilos comparten un solo modelo con `predict` serializado, asi que solo
+se traslapan la decodificacion y el pre/post-procesamiento. Reporta frames por segundo,
+p50/p95 por etapa y el pico de memoria (RSS) del proceso.
+
+El modelo y la calibracion salen de inference_config.json; --modelo usa un .onnx con el
+backend de onnxruntime y --calibracion un pickle propio. Sin calibracion se usa una
+sintetica.
+
+Uso (desde servicio_procesamiento):
+    python -m benchmarks.replay --carpeta "C:/.../FEEDER 16 13-08" --frames 100
+    python -m benchmarks.replay --carpeta imgs --modelo modelo.onnx --hilos 4 --solo-etapas
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from itertools import cycle, islice
+
+import cv2
+import numpy as np
+
+from pyinstaller_utils import resource_path
+from workers import database, inference, process
+from workers.db_writer import RESULT_COLUMNS
+from workers.history import MemoryHistory
+from workers.image_archive import ImageArchive
+from workers.postprocess import ellipse_axes, merge_tile_detections, select
+
+STAGES = ("pre-procesamiento", "inferencia", "post-procesamiento", "imagenes", "psd", "guardado")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class SqliteResultSink:
+    """
+    Sustituto de workers.db_writer.ResultWriter: junta las filas y las inserta por
+    lotes en una tabla SQLite con las mismas columnas que `results`.
+    """
+
+    def __init__(self, path, batch_size=50):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.batch_size = int(batch_size)
+        self.conn.execute(f"CREATE TABLE results ({', '.join(RESULT_COLUMNS)})")
+        self.sql = f"INSERT INTO results VALUES ({', '.join('?' for _ in RESULT_COLUMNS)})"
+        self.rows = []
+        self.written = 0
+        self.on_commit = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.conn.executemany(self.sql, self.rows)
+            self.conn.commit()
+            self.written += len(self.rows)
+            committed = [dict(zip(RESULT_COLUMNS, row)) for row in self.rows]
+            self.rows = []
+            for callback in self.on_commit:
+                callback(committed)
+
+    def close(self):
+        self.flush()
+
+    def stats(self):
+        return {"rows": self.written}
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB, o None si no se puede medir."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    except Exception:
+        return None
+
+
+def load_frames(folder, n_frames, crop_y=None, crop_x=None):
+    """Frames JPEG (calidad 80, recortados) como los que escribe el proceso de captura."""
+    files = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not files:
+        raise FileNotFoundError(f"No se encontraron imagenes en '{folder}'.")
+    encoded = {}
+    frames = []
+    for path in islice(cycle(files), n_frames):
+        if path not in encoded:
+            img = cv2.imread(path)
+            if crop_y:
+                img = img[crop_y[0]:crop_y[1]]
+            if crop_x:
+                img = img[:, crop_x[0]:crop_x[1]]
+            encoded[path] = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 80])[1].tobytes()
+        frames.append(encoded[path])
+    return frames
+
+
+def setup(args, tmpdir):
+    """Prepara los modulos de los workers con el modelo real y sustitutos locales para Redis y PostgreSQL."""
+    try:
+        with open(resource_path("configs/inference_config.json"), "r") as f:
+            config = json.load(f)
+    except Exception:
+        config = {"CONF": 0.3, "NMS_THRESHOLD": 0.3, "SLICE": 640, "OVERLAP": 0.2}
+    if args.modelo:
+        config.update(MODEL_PATH=args.modelo, BACKEND="onnxruntime")
+    config["BATCH_ENABLED"] = False
+    if args.calibracion or not os.path.exists(config.get("CALIBRATION_PATH", "")):
+        if args.calibracion:
+            with open(args.calibracion, "rb") as f:
+                cal = pickle.load(f)
+            mtx, dist, newcameramtx = cal["mtx"], cal["dist"], cal["newcameramtx"]
+        else:
+            from benchmarks.bench_preprocess import synthetic_calibration
+
+            mtx, dist, newcameramtx = synthetic_calibration()
+        config.update(mtx=mtx, dist=dist, newcameramtx=newcameramtx, CALIBRATION_PATH="")
+    inference.CONFIG = config
+    inference.MODEL = inference.load_model(config)
+    inference.load_resources()
+
+    process_config = process.load_config()
+    if args.ventana:
+        process_config["window_size"] = args.ventana
+
+    database.CONFIG = {"events": {"thumbnails": False}}
+    database.ARCHIVE = ImageArchive(os.path.join(tmpdir, "imgs"))
+    database.WRITER = SqliteResultSink(os.path.join(tmpdir, "results.sqlite"))
+    # SQLite no tiene particiones que crear.
+    database.PARTITIONS_MONTH = date.today().replace(day=1)
+    return MemoryHistory(process_config.get("window_size", 1))
+
+
+def camera_for(process_config, requested):
+    if requested:
+        return requested
+    calibrations = process_config.get("calibrations") or {}
+    return next(iter(calibrations), "replay")
+
+
+def run_stages(frames, camera_id, history):
+    """Corre cada etapa por separado sobre cada frame y regresa sus duraciones (s)."""
+    durations = defaultdict(list)
+    config = inference.CONFIG
+
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        out = fn(*args)
+        durations[stage].append(time.perf_counter() - start)
+        return out
+
+    for jpg in frames:
+        frame = timed("pre-procesamiento", inference.pre_process_image, jpg, config)
+
+        def infer():
+            slices, coords = inference.slice_frame(frame)
+            return inference.predict_slices(slices), coords
+
+        tiles, coords = timed("inferencia", infer)
+
+        def post():
+            detections = merge_tile_detections(tiles, coords)
+            if len(detections) == 0:
+                return None
+            return select(detections, inference.deduplicate(detections))
+
+        detections = timed("post-procesamiento", post)
+        if detections is None:
+            continue
+        area_ar = ellipse_axes(detections).tolist()
+
+        def encode():
+            overlay = frame.copy()
+            res_img = frame.copy()
+            cv2.fillPoly(overlay, detections.polygons(), (0, 255, 0))
+            cv2.addWeighted(overlay, 0.4, res_img, 0.6, 0, res_img)
+            return cv2.imencode(".jpg", res_img)[1].tobytes(), cv2.imencode(".jpg", frame)[1].tobytes()
+
+        seg_jpeg, og_jpeg = timed("imagenes", encode)
+        granulometry = timed("psd", process.compute_granulometry, camera_id, area_ar, history)
+        if granulometry is None:
+            continue
+        results = {
+            "Fs": granulometry[0], "Fs_ajust": granulometry[1], "cam_id": camera_id, "sim": True,
+            "capture_time": datetime.now(timezone.utc).isoformat(),
+        }
+        timed("guardado", database.persist_result, results, og_jpeg, seg_jpeg)
+    return durations
+
+
+def run_chain(frames, camera_id, history, threads):
+    """Cadena completa con los hilos y colas de pipeline.StreamingPipeline."""
+    from metrics import PendingTraces
+    from pipeline import COMMIT_STAGES, PIPELINE_STAGES, StreamingPipeline
+
+    chain = StreamingPipeline([], inference_threads=threads, queue_size=threads * 2, max_frame_age=0)
+    chain.inference, chain.process, chain.database, chain.history = inference, process, database, history
+    chain.pending = PendingTraces(chain.stats)
+    database.WRITER.on_commit.append(chain.pending.on_commit)
+    chain._inference_workers = [chain._start_thread(chain._infer, f"inference-{i}") for i in range(threads)]
+    chain._psd_worker = chain._start_thread(chain._psd, "psd")
+    chain._persist_worker = chain._start_thread(chain._persist, "persist")
+    camera = {"camara_id": camera_id, "simulation": True}
+    start = time.perf_counter()
+    for jpg in frames:
+        capture_ts = time.time()
+        # Cola bloqueante: en la reproduccion no se descartan frames.
+        chain.frames.put((camera, capture_ts, jpg, {"capture": capture_ts, "dispatch": capture_ts}))
+    chain.stop()
+    elapsed = time.perf_counter() - start
+    names = {"inference_queue_wait": "espera inferencia", "inference": "inferencia completa",
+             "processing_queue_wait": "espera psd", "psd": "psd", "database_queue_wait": "espera guardado",
+             "db_write": "guardado (commit)", "end_to_end": "captura a commit"}
+    durations = {names[s]: list(chain.stats.durations.get(s, [])) for s in PIPELINE_STAGES + COMMIT_STAGES if s in names}
+    return elapsed, durations, dict(chain.stats.counters)
+
+
+def print_table(durations, order, fps=True):
+    print(f"  {'etapa':<22} {'frames':>6} {'p50 ms':>9} {'p95 ms':>9}" + (f" {'fps':>8}" if fps else ""))
+    for stage in order:
+        values = durations.get(stage)
+        if not values:
+            continue
+        p50, p95 = np.percentile(values, [50, 95])
+        line = f"  {stage:<22} {len(values):>6} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f}"
+        print(line + (f" {1 / np.mean(values):>8.1f}" if fps else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carpeta", required=True, help="carpeta con imagenes .png/.jpg")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--modelo", help="modelo .onnx (backend onnxruntime); por defecto el de inference_config.json")
+    parser.add_argument("--calibracion", help="pickle con mtx, dist y newcameramtx")
+    parser.add_argument("--camara", help="id de camara para la calibracion de los Fs (process_config.json)")
+    parser.add_argument("--ventana", type=int, help="tamano de la ventana de la PSD (por defecto window_size)")
+    parser.add_argument("--crop-y", type=int, nargs=2)
+    parser.add_argument("--crop-x", type=int, nargs=2)
+    parser.add_argument("--hilos", type=int, default=2, help="hilos de inferencia en la cadena completa")
+    parser.add_argument("--solo-etapas", action="store_true", help="no correr la cadena completa")
+    args = parser.parse_args()
+
+    frames = load_frames(args.carpeta, args.frames, args.crop_y, args.crop_x)
+    rss_start = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Los workers imprimen una linea por frame; solo se muestra el reporte.
+        with contextlib.redirect_stdout(io.StringIO()):
+            history = setup(args, tmpdir)
+            sink = database.WRITER
+            camera_id = camera_for(process.CONFIG, args.camara)
+            # Calentamiento: mapas de remap, sesion del modelo y buffers.
+            run_stages(frames[:2], camera_id, MemoryHistory(history.window_size))
+
+            start = time.perf_counter()
+            stage_durations = run_stages(frames, camera_id, history)
+            stages_elapsed = time.perf_counter() - start
+            if not args.solo_etapas:
+                chain_elapsed, chain_durations, counters = run_chain(
+                    frames, camera_id, MemoryHistory(history.window_size), args.hilos,
+                )
+            if database.WRITER is not None:
+                # La cadena completa ya los cerro al detenerse.
+                database._close_writer()
+            saved = sink.written
+
+    height, width = cv2.imdecode(np.frombuffer(frames[0], np.uint8), cv2.IMREAD_COLOR).shape[:2]
+    print(f"{len(frames)} frames de {width}x{height} desde '{args.carpeta}', camara '{camera_id}', "
+          f"backend {inference.CONFIG.get('BACKEND', 'ultralytics')}, {os.cpu_count()} nucleos")
+    print(f"\nEtapas por separado ({len(frames) / stages_elapsed:.2f} fps secuencial):")
+    print_table(stage_durations, STAGES)
+    if not args.solo_etapas:
+        print(f"\nCadena completa, {args.hilos} hilos de inferencia ({len(frames) / chain_elapsed:.2f} fps):")
+        print_table(chain_durations, ("espera inferencia", "inferencia completa", "espera psd", "psd", "espera guardado",
+                                      "guardado (commit)", "captura a commit"), fps=False)
+        print(f"  contadores: {counters}")
+    print(f"\nFilas guardadas en SQLite: {saved}")
+    rss_end = peak_rss_mb()
+    if rss_end is not None:
+        print(f"Pico de RSS: {rss_end:.0f} MB (antes de cargar el modelo: {rss_start:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
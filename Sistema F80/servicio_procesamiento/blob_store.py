@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import redis
+
+from pyinstaller_utils import resource_path
+
+PREFIX = "blob:"
+# Archivos del almacen en disco: <2 hex>/<32 hex>, o su temporal <32 hex>.<pid>.tmp.
+_BLOB_DIR = re.compile(r"^[0-9a-f]{2}$")
+_BLOB_FILE = re.compile(r"^[0-9a-f]{32}(\.\d+\.tmp)?$")
+CONFIG = None
+STORE = None
+
+
+class RedisBlobStore:
+    """Guarda los blobs como llaves de Redis con expiracion."""
+
+    def __init__(self, ttl, db=2, host="localhost", port=6379):
+        self.ttl = int(ttl)
+        self.client = redis.Redis(host=host, port=port, db=db)
+
+    def put(self, key, data):
+        self.client.set(PREFIX + key, data, ex=self.ttl)
+
+    def get(self, key):
+        return self.client.get(PREFIX + key)
+
+
+class DiskBlobStore:
+    """
+    Guarda los blobs como archivos en disco, repartidos en subcarpetas por los dos
+    primeros caracteres del hash. Los archivos mas viejos que `ttl` se eliminan
+    periodicamente al escribir; solo se tocan los que siguen ese formato de nombre.
+    """
+
+    def __init__(self, ttl, directory):
+        if not directory or not str(directory).strip():
+            raise ValueError("El almacen de blobs en disco necesita un directorio propio ('directorio').")
+        self.ttl = float(ttl)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._last_purge = time.monotonic()
+
+    def _path(self, key):
+        return self.directory / key[:2] / key
+
+    def put(self, key, data):
+        path = self._path(key)
+        if path.exists():
+            os.utime(path)
+        else:
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_name(f"{key}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        if time.monotonic() - self._last_purge > self.ttl / 2:
+            self._purge()
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _purge(self):
+        self._last_purge = time.monotonic()
+        limit = time.time() - self.ttl
+        for path in self.directory.glob("*/*"):
+            if not (_BLOB_DIR.match(path.parent.name) and _BLOB_FILE.match(path.name)
+                    and path.name.startswith(path.parent.name)):
+                continue
+            try:
+                if path.stat().st_mtime < limit:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+def load_resources():
+    """Carga la configuracion del almacen de blobs y crea el backend una sola vez."""
+    global CONFIG, STORE
+    if CONFIG is None:
+        try:
+            config_path = resource_path("configs/config_general.json")
+            with open(config_path, 'r') as f:
+                CONFIG = json.load(f).get("blob_store", {})
+        except Exception as e:
+            print(f"Error cargando el config del almacen de blobs: {e}")
+            CONFIG = {}
+    if STORE is None:
+        ttl = CONFIG.get("ttl", 300)
+        if CONFIG.get("backend", "redis") == "disk":
+            directory = CONFIG.get("directorio")
+            if not directory:
+                raise ValueError("blob_store.directorio no esta configurado para el backend 'disk'.")
+            # Las rutas relativas se toman dentro de shared_resources, no del directorio actual.
+            if not os.path.isabs(directory):
+                directory = resource_path(directory)
+            STORE = DiskBlobStore(ttl, directory)
+        else:
+            STORE = RedisBlobStore(ttl, db=CONFIG.get("redis_db", 2))
+    return STORE
+
+
+def put(data: bytes) -> str:
+    """Guarda `data` y regresa una referencia corta basada en su contenido."""
+    key = hashlib.blake2b(data, digest_size=16).hexdigest()
+    load_resources().put(key, data)
+    return PREFIX + key
+
+
+def get(ref: str) -> bytes:
+    """Regresa los bytes de una referencia. Lanza KeyError si ya expiro o no existe."""
+    if not ref or not ref.startswith(PREFIX):
+        raise KeyError(f"Referencia invalida: {ref}")
+    data = load_resources().get(ref[len(PREFIX):])
+    if data is None:
+        raise KeyError(f"El blob {ref} expiro o no existe.")
+    return data
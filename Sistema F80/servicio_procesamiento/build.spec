@@ -40,6 +40,7 @@ a = Analysis(
         'celery.backends', 'celery.backends.database', 'celery.backends.redis',
         'celery.bin',
         'celery.concurrency', 'celery.concurrency.prefork', 'celery.concurrency.gevent',
+        'celery.concurrency.thread', 'celery.concurrency.solo',
         'celery.contrib', 'celery.contrib.testing',
         'celery.events', 'celery.events.state',
         'celery.fixups', 'celery.fixups.django',
@@ -65,7 +66,18 @@ a = Analysis(
         'workers.inference',
         'workers.process',
         'workers.database',
+        'workers.onnx_backend',
         'pyinstaller_utils',
+        'admission',
+        'blob_store',
+        'db_pool',
+        'db_schema',
+        'latest_cache',
+        'metrics',
+        'pipeline',
+        'result_events',
+        'results_export',
+        'worker_profiles',
         'pandas'
     ],
     hookspath=[],
@@ -1,17 +1,22 @@
-import multiprocessing as mp
+import asyncio
 import threading
-import pickle
-import redis
-import cv2
-import numpy as np
+import time
+import multiprocessing as mp
+from datetime import datetime, timezone
 from pydantic import BaseModel, Extra
 from .proceso_captura import capture_process
+from .frame_buffer import FrameRingBuffer
 import uvicorn
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import Response
-import time
+from fastapi.responses import PlainTextResponse, Response
+from celery_app import celery_app, modo_ingesta
+import admission
+import blob_store
+from metrics import get_recorder, mark, new_trace, render
 camaras = {}
 
+INFERENCE_TASK = 'workers.inference.perform_inference'
+
 class CameraConfig(BaseModel):
     camara_id: str
     url: str
@@ -21,17 +26,52 @@ class CameraConfig(BaseModel):
     crop_y: list = []
     crop_x: list = []
     enabled: bool = True
+    buffer_frames: int = 5
+    buffer_max_bytes: int = 4 * 1024 * 1024
+    captura_bajo_demanda: bool = True
     class Config:
         extra = Extra.ignore
 
 app = FastAPI(title="Servicio de la camara")
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=1)
-    redis_client.ping()
-    print("Conexión a Redis para colas de cámara establecida.")
-except Exception as e:
-    print(f"Error conectando a Redis: {e}")
-    redis_client = None
+
+
+def publish_frames(config, frame_buffer, stop_evt):
+    """
+    Modo "push": cada `intervalo_captura` segundos toma el frame mas reciente de la
+    camara y lo manda directo a la cola de inferencia, sin pasar por Beat ni por HTTP.
+    Si el control de admision no lo admite (cola llena o camara ocupada) el frame se
+    omite y en el siguiente ciclo se manda el mas reciente.
+    """
+    cam_id = config.camara_id
+    recorder = get_recorder()
+    last_seq = 0
+    next_tick = time.monotonic()
+    while not stop_evt.is_set():
+        next_tick = max(next_tick + config.intervalo_captura, time.monotonic())
+        frame = frame_buffer.read_latest(after_seq=last_seq)
+        if frame is not None:
+            seq, capture_ts, jpg_bytes = frame
+            last_seq = seq
+            capture_time = datetime.fromtimestamp(capture_ts, timezone.utc).isoformat()
+            admitted, reason = admission.admit(cam_id)
+            if not admitted:
+                recorder.count_dropped(cam_id, reason)
+            elif admission.is_stale(capture_ts):
+                admission.release(cam_id)
+                recorder.count_dropped(cam_id, "expired")
+            else:
+                try:
+                    image_ref = blob_store.put(jpg_bytes)
+                    trace = mark(new_trace(capture_ts), "dispatch")
+                    celery_app.send_task(
+                        INFERENCE_TASK, args=[cam_id, image_ref, config.simulation, capture_time, trace],
+                        expires=admission.expires(capture_ts),
+                    )
+                    recorder.observe_trace(cam_id, trace, stages=("capture_to_dispatch",))
+                except Exception as e:
+                    admission.release(cam_id)
+                    print(f"[PUBLISHER {cam_id}] Error publicando frame: {e}")
+        stop_evt.wait(max(0.0, next_tick - time.monotonic()))
 
 @app.post("/start_camera")
 def start_camera(config: CameraConfig):
@@ -39,41 +79,24 @@ def start_camera(config: CameraConfig):
     print(f"Procesando solicitud de inicio de cámara {cam_id}...")
     if cam_id in camaras:
         raise HTTPException(status_code=400, detail=f"Camara '{cam_id}' en ejecución.")
-    if not redis_client:
-        raise HTTPException(status_code=500, detail="Servicio de Redis no disponible.")
     
-    q = mp.Queue(maxsize=1)
+    frame_buffer = FrameRingBuffer(slots=config.buffer_frames, max_frame_bytes=config.buffer_max_bytes)
     stop_evt = mp.Event()
-    p = mp.Process(target=capture_process, args=(config.url, q, stop_evt, config.crop_y, config.crop_x, config.simulation, config.simulation_source), daemon=True)
+    frame_request = mp.Event()
+    p = mp.Process(
+        target=capture_process,
+        args=(config.url, frame_buffer, stop_evt, config.crop_y, config.crop_x, config.simulation, config.simulation_source),
+        kwargs={"capture_interval": config.intervalo_captura, "frame_request": frame_request, "on_demand": config.captura_bajo_demanda},
+        daemon=True,
+    )
     p.start()
 
+    publisher = None
+    if modo_ingesta == "push":
+        publisher = threading.Thread(target=publish_frames, args=(config, frame_buffer, stop_evt), daemon=True)
+        publisher.start()
 
-    def dispatch():
-        r = redis.Redis(host="localhost", port=6379, db=1)
-        redis_key = f"camera_queue:{config.camara_id}"
-        while not stop_evt.is_set():
-            try:
-                ts, jpg_bytes = q.get(timeout=1)  
-            except Exception:
-                continue
-            arr = np.frombuffer(jpg_bytes, dtype=np.uint8)
-            frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-            payload = pickle.dumps((ts, frame))
-            try:
-                r.rpush(redis_key, payload)
-                r.ltrim(redis_key, -5, -1)
-                #print("Image pushed to Redis.")
-            except Exception as e:
-                print("Reconnecting to Redis...")
-                r = redis.Redis(host="localhost", port=6379, db=1)
-                print(f"[DISPATCHER {config.camara_id}] Redis push error: {e}")
-                print(f"[DISPATCHER {config.camara_id}] stop.")
-
-
-    dispatch_thread = threading.Thread(target=dispatch, daemon=True)
-    dispatch_thread.start()
-
-    camaras[config.camara_id] = {'proc': p, 'queue': q, 'stop': stop_evt, 'dispatch_thread': dispatch_thread}
+    camaras[config.camara_id] = {'proc': p, 'buffer': frame_buffer, 'stop': stop_evt, 'request': frame_request, 'last_seq': 0, 'publisher': publisher}
     print(f"Camara {cam_id} iniciada correctamente.")
     return {"status": f"Camara {cam_id} iniciada correctamente."}
 
@@ -88,25 +111,80 @@ async def get_frame(camera_id: str):
     if camera_id not in camaras:
         raise HTTPException(status_code=404, detail=f"Camara '{camera_id}' no se encontró.")
     
-    redis_key = f"camera_queue:{camera_id}"
-    payload = redis_client.lpop(redis_key)
+    info = camaras[camera_id]
+    frame = info['buffer'].read_latest(after_seq=info['last_seq'])
     
 
-    if payload is None:
-        time.sleep(1)
-        payload = redis_client.lpop(redis_key)
-        if payload is None:
+    if frame is None:
+        # Se le pide un frame al proceso de captura y se espera hasta 1 segundo.
+        info['request'].set()
+        deadline = time.monotonic() + 1.0
+        while frame is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            frame = info['buffer'].read_latest(after_seq=info['last_seq'])
+        if frame is None:
             print("No hay frames en la cola")
             raise HTTPException(status_code=404, detail="No hay frames en la cola.")
 
 
-    capture_time, frame = pickle.loads(payload)
-    
-    _, buffer = cv2.imencode(".jpg", frame)
+    seq, capture_ts, jpg_bytes = frame
+    info['last_seq'] = seq
+    capture_time = datetime.fromtimestamp(capture_ts, timezone.utc).isoformat()
     
     headers = {"capture-time": capture_time}
     
-    return Response(content=buffer.tobytes(), media_type="image/jpeg", headers=headers)
+    return Response(content=jpg_bytes, media_type="image/jpeg", headers=headers)
+
+@app.get("/status")
+def get_cameras_status():
+    """
+    Regresa, por camara, si el proceso de captura sigue vivo, cuantos frames ha
+    escrito y su uso de CPU.
+    """
+    return {
+        cam_id: {
+            "alive": info['proc'].is_alive(),
+            "frames": info['buffer'].write_seq,
+            "cpu_percent": round(info['buffer'].cpu_percent, 1),
+        }
+        for cam_id, info in camaras.items()
+    }
+
+def _camera_metric_lines():
+    now = time.time()
+    gauges = {
+        "f80_camera_alive": ("Proceso de captura vivo", lambda info: int(info['proc'].is_alive())),
+        "f80_camera_cpu_percent": ("Uso de CPU del proceso de captura", lambda info: info['buffer'].cpu_percent),
+        "f80_camera_capture_seconds": ("Lectura, recorte y codificacion del ultimo frame", lambda info: info['buffer'].capture_seconds),
+        "f80_camera_frame_age_seconds": ("Antiguedad del ultimo frame del buffer", lambda info: _frame_age(info, now)),
+    }
+    lines = [
+        "# HELP f80_camera_frames_total Frames escritos en el buffer de la camara",
+        "# TYPE f80_camera_frames_total counter",
+    ]
+    lines.extend(f'f80_camera_frames_total{{camera="{cam_id}"}} {info["buffer"].write_seq}' for cam_id, info in camaras.items())
+    for metric, (help_text, value) in gauges.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f'{metric}{{camera="{cam_id}"}} {value(info)}' for cam_id, info in camaras.items())
+    return lines
+
+def _frame_age(info, now):
+    capture_ts = info['buffer'].latest_capture_ts()
+    return now - capture_ts if capture_ts is not None else float("nan")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Metricas de las camaras (frames, CPU, tiempo de captura y antiguedad del ultimo frame)
+    junto con las colas y los histogramas de latencia del pipeline guardados en Redis.
+    """
+    lines = _camera_metric_lines()
+    try:
+        return render(get_recorder().client, lines)
+    except Exception as e:
+        print(f"No se pudieron leer las metricas de Redis: {e}")
+        return "\n".join(lines) + "\n"
 
 @app.post("/stop_camera/{camera_id}")
 def stop_camera_process(cam_id, timeout=5):
@@ -114,13 +192,12 @@ def stop_camera_process(cam_id, timeout=5):
     if not info:
         return
     info['stop'].set()
-    info['dispatch_thread'].join(timeout)
+    if info['publisher'] is not None:
+        info['publisher'].join(timeout)
     info['proc'].join(timeout)
     if info['proc'].is_alive():
         info['proc'].terminate()
-    #Clear queue
-    while not info["queue"].empty():
-        info["queue"].get()
+    info['buffer'].close()
     del camaras[cam_id]
 
 if __name__ == "__main__":
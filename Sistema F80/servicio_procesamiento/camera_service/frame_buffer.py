@@ -0,0 +1,126 @@
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Encabezado: numero de frames escritos (u64), % de CPU del proceso de captura (f64) y
+# segundos que tomo leer y codificar el ultimo frame (f64). Se reservan 64 bytes para
+# campos futuros.
+_HEADER = struct.Struct("<Q")
+_CPU = struct.Struct("<d")
+_CPU_OFFSET = 8
+_CAPTURE_SECONDS_OFFSET = 16
+_HEADER_SIZE = 64
+# Encabezado de cada slot: secuencia (u64), tiempo de captura epoch (f64), longitud (u32).
+_SLOT = struct.Struct("<QdI")
+_SLOT_HEADER_SIZE = 32
+
+
+class FrameRingBuffer:
+    """
+    Buffer circular en memoria compartida con los ultimos N frames de una camara.
+
+    Lo escribe un solo proceso (el de captura) y lo lee la API de camaras. Cada
+    slot guarda los bytes JPEG tal como salen del proceso de captura junto con
+    su tiempo de captura, de modo que la API los sirve sin decodificar ni volver
+    a codificar. La lectura usa el numero de secuencia del slot antes y despues
+    de copiar los datos para descartar lecturas a medio escribir.
+    """
+
+    def __init__(self, slots=5, max_frame_bytes=4 * 1024 * 1024, name=None):
+        self.slots = int(slots)
+        self.max_frame_bytes = int(max_frame_bytes)
+        self.slot_size = _SLOT_HEADER_SIZE + self.max_frame_bytes
+        size = _HEADER_SIZE + self.slots * self.slot_size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            # Con el metodo "fork" el hijo hereda el objeto tal cual; solo el proceso que
+            # creo el bloque lo borra.
+            self._owner_pid = os.getpid()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self._owner_pid = None
+
+    def __reduce__(self):
+        # Al pasarlo a otro proceso solo viaja el nombre; el hijo se adjunta al mismo bloque.
+        return (FrameRingBuffer, (self.slots, self.max_frame_bytes, self.shm.name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _slot_offset(self, seq):
+        return _HEADER_SIZE + (seq % self.slots) * self.slot_size
+
+    @property
+    def write_seq(self):
+        return _HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    @property
+    def cpu_percent(self):
+        return _CPU.unpack_from(self.shm.buf, _CPU_OFFSET)[0]
+
+    def set_cpu_percent(self, value):
+        _CPU.pack_into(self.shm.buf, _CPU_OFFSET, float(value))
+
+    @property
+    def capture_seconds(self):
+        return _CPU.unpack_from(self.shm.buf, _CAPTURE_SECONDS_OFFSET)[0]
+
+    def set_capture_seconds(self, value):
+        _CPU.pack_into(self.shm.buf, _CAPTURE_SECONDS_OFFSET, float(value))
+
+    def write(self, data, capture_ts=None):
+        """Escribe un frame codificado. Regresa False si no cabe en el slot."""
+        length = len(data)
+        if length > self.max_frame_bytes:
+            return False
+        if capture_ts is None:
+            capture_ts = time.time()
+        buf = self.shm.buf
+        seq = self.write_seq + 1
+        offset = self._slot_offset(seq)
+        # Se invalida el slot mientras se escribe.
+        _SLOT.pack_into(buf, offset, 0, 0.0, 0)
+        start = offset + _SLOT_HEADER_SIZE
+        buf[start:start + length] = data
+        _SLOT.pack_into(buf, offset, seq, capture_ts, length)
+        _HEADER.pack_into(buf, 0, seq)
+        return True
+
+    def read_latest(self, after_seq=0, retries=3):
+        """
+        Regresa (seq, capture_ts, bytes) del frame mas reciente, o None si no hay
+        un frame mas nuevo que `after_seq`.
+        """
+        buf = self.shm.buf
+        for _ in range(retries):
+            seq = self.write_seq
+            if seq == 0 or seq <= after_seq:
+                return None
+            offset = self._slot_offset(seq)
+            slot_seq, capture_ts, length = _SLOT.unpack_from(buf, offset)
+            if slot_seq != seq:
+                continue
+            start = offset + _SLOT_HEADER_SIZE
+            data = bytes(buf[start:start + length])
+            if _SLOT.unpack_from(buf, offset)[0] == seq:
+                return seq, capture_ts, data
+        return None
+
+    def latest_capture_ts(self):
+        """Tiempo de captura del frame mas reciente (sin copiar la imagen), o None."""
+        seq = self.write_seq
+        if seq == 0:
+            return None
+        slot_seq, capture_ts, _ = _SLOT.unpack_from(self.shm.buf, self._slot_offset(seq))
+        return capture_ts if slot_seq == seq else None
+
+    def close(self):
+        try:
+            self.shm.close()
+            if self._owner_pid == os.getpid():
+                self.shm.unlink()
+        except Exception:
+            pass
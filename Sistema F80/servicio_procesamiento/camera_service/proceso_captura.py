@@ -2,8 +2,8 @@ import os
 import time
 import cv2
 import multiprocessing as mp
-from datetime import datetime, timezone
 from itertools import cycle
+from .frame_buffer import FrameRingBuffer
 
 os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = (
     "rtsp_transport;tcp"
@@ -36,9 +36,43 @@ def _safe_crop(frame, crop_y, crop_x):
         x1 = min(w, crop_x[1])
     return frame[y0:y1, x0:x1]
 
-def capture_process(url, queue: mp.Queue, stop_event: mp.Event, crop_y=None, crop_x=None, simulation = False, simulation_source = "", reconnect_delay=3):
+def _frame_due(next_capture, frame_request):
+    """Indica si toca decodificar un frame: se cumplio el intervalo o un consumidor pidio uno."""
+    if frame_request is not None and frame_request.is_set():
+        return True
+    return time.monotonic() >= next_capture
+
+class _CpuMeter:
+    """Mide el uso de CPU del proceso de captura y lo publica en el buffer compartido."""
+
+    def __init__(self, frame_buffer, period=5.0):
+        self.frame_buffer = frame_buffer
+        self.period = period
+        self._wall = time.monotonic()
+        self._cpu = time.process_time()
+
+    def tick(self):
+        wall = time.monotonic()
+        elapsed = wall - self._wall
+        if elapsed < self.period:
+            return
+        cpu = time.process_time()
+        self.frame_buffer.set_cpu_percent((cpu - self._cpu) / elapsed * 100.0)
+        self._wall, self._cpu = wall, cpu
+
+def capture_process(url, frame_buffer: FrameRingBuffer, stop_event: mp.Event, crop_y=None, crop_x=None, simulation = False, simulation_source = "", reconnect_delay=3,
+                    capture_interval=1.0, frame_request: mp.Event = None, on_demand=True):
+    """
+    Captura frames de una camara (RTSP o carpeta de simulacion) y los escribe en `frame_buffer`.
+
+    Con `on_demand` activo el stream se mantiene drenado con `grab()` y solo se hace
+    `retrieve()`, recorte y codificacion JPEG cada `capture_interval` segundos o cuando
+    un consumidor activa `frame_request`. Sin `on_demand` se procesa cada frame del stream.
+    """
     cap = None
     image_files_cycle = None
+    cpu_meter = _CpuMeter(frame_buffer)
+    next_capture = 0.0
     if simulation:
         image_files = [os.path.join(simulation_source, f) for f in os.listdir(simulation_source) if f.endswith(('.png', '.jpg', '.jpeg'))]
         if not image_files:
@@ -46,27 +80,32 @@ def capture_process(url, queue: mp.Queue, stop_event: mp.Event, crop_y=None, cro
         image_files_cycle = cycle(image_files)
 
     while not stop_event.is_set():
+        cpu_meter.tick()
         if simulation:
             try:
+                if on_demand and not _frame_due(next_capture, frame_request):
+                    wait = max(0.0, min(next_capture - time.monotonic(), 0.1))
+                    if frame_request is not None:
+                        frame_request.wait(wait)
+                    else:
+                        time.sleep(wait)
+                    continue
+                if frame_request is not None:
+                    frame_request.clear()
+                next_capture = time.monotonic() + capture_interval
                 image_path = next(image_files_cycle)
                 if stop_event.is_set():
                     break
+                ts = time.time()
                 frame = cv2.imread(image_path)
                 if frame is not None:
                     ok, jpg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
                     if not ok:
                         continue
                     data = jpg.tobytes()
-                    ts = datetime.now(timezone.utc).isoformat()
-                try:
-                    if queue.full():
-                        try:
-                            queue.get_nowait()
-                        except Exception:
-                            pass
-                    queue.put_nowait((ts, data))
-                except Exception:
-                    pass
+                    frame_buffer.set_capture_seconds(time.time() - ts)
+                    if not frame_buffer.write(data, ts):
+                        print(f"[SIMULATION {simulation_source}] Frame de {len(data)} bytes no cabe en el buffer.")
                 time.sleep(0.001)
             except Exception as e:
                 print(f"[SIMULATION {simulation_source}] ERROR: {e}")
@@ -78,28 +117,33 @@ def capture_process(url, queue: mp.Queue, stop_event: mp.Event, crop_y=None, cro
                     if not cap.isOpened():
                         time.sleep(reconnect_delay)
                         continue
-                ret, frame = cap.read()
-                if not ret or frame is None:
+                # grab() lee el siguiente frame del stream y bloquea hasta que llega,
+                # por lo que el ciclo queda al ritmo de la camara sin necesidad de sleep.
+                if not cap.grab():
                     cap.release()
                     cap = None
                     time.sleep(reconnect_delay)
                     continue
+                if on_demand and not _frame_due(next_capture, frame_request):
+                    continue
+                if frame_request is not None:
+                    frame_request.clear()
+                next_capture = time.monotonic() + capture_interval
+                # El tiempo de captura es el del frame recien leido con grab().
+                ts = time.time()
+                ret, frame = cap.retrieve()
+                if not ret or frame is None:
+                    continue
                 frame = _safe_crop(frame, crop_y or [], crop_x or [])
                 ok, jpg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
                 if not ok:
                     continue
                 data = jpg.tobytes()
-                ts = datetime.now(timezone.utc).isoformat()
-                try:
-                    if queue.full():
-                        try:
-                            queue.get_nowait()
-                        except Exception:
-                            pass
-                    queue.put_nowait((ts, data))
-                except Exception:
-                    pass
-                time.sleep(0.001)
+                frame_buffer.set_capture_seconds(time.time() - ts)
+                if not frame_buffer.write(data, ts):
+                    print(f"[CAPTURE {url}] Frame de {len(data)} bytes no cabe en el buffer.")
+                if not on_demand:
+                    time.sleep(0.001)
             except Exception as e:
                 print(f"[CAPTURE {url}] ERROR: {e}, reintentando en {reconnect_delay}s")
                 try:
@@ -114,4 +158,5 @@ def capture_process(url, queue: mp.Queue, stop_event: mp.Event, crop_y=None, cro
             cap.release()
         except:
             pass
+    frame_buffer.close()
     print(f"[CAPTURE {url}] stop_event set - proceso detenido.")
@@ -3,11 +3,13 @@ import json
 from pyinstaller_utils import resource_path 
 
 frecuencia_camaras = 30.0 
+modo_ingesta = "poll"
 try:
     config_path = resource_path("configs/config_general.json")
     with open(config_path, 'r') as f:
         config_data = json.load(f)
         frecuencia_camaras = config_data.get("frecuencia_camaras", 30.0)
+        modo_ingesta = config_data.get("modo_ingesta", "poll")
         
 except Exception as e:
     print(f"No se pudo cargar config_general.json, usando frecuencia por defecto. Error: {e}")
@@ -27,14 +29,21 @@ celery_app = Celery(
 celery_app.conf.task_routes = {
     'workers.inference.perform_inference': {'queue': 'inference_queue'},
     'workers.process.process_granulometry': {'queue': 'processing_queue'},
-    'workers.database.save_to_db': {'queue': 'processing_queue'},
+    'workers.database.save_to_db': {'queue': 'database_queue'},
     'tasks.initialize_cameras': {'queue': 'camaras_queue'},
     'tasks.request_cameras': {'queue': 'camaras_queue'},
 }
 
-celery_app.conf.beat_schedule = {
-    'poll-cameras-every-3-seconds': {
+# Los procesos hijos del pool prefork cargan el modelo y lo calientan en
+# worker_process_init (ver workers.inference). Con el limite por defecto de Celery (4 s)
+# el hijo se mata y se vuelve a crear antes de terminar.
+celery_app.conf.worker_proc_alive_timeout = 180.0
+
+# En modo "push" el servicio de camaras publica los frames por su cuenta, cada camara
+# con su propio intervalo_captura, y Beat solo se usa para inicializar las camaras.
+celery_app.conf.beat_schedule = {}
+if modo_ingesta == "poll":
+    celery_app.conf.beat_schedule['poll-cameras-every-3-seconds'] = {
         'task': 'tasks.request_cameras',
         'schedule': frecuencia_camaras, 
-    },
-}
\ No newline at end of file
+    }
\ No newline at end of file
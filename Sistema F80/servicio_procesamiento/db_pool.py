@@ -0,0 +1,63 @@
+import threading
+from contextlib import contextmanager
+
+from psycopg2 import pool as pg_pool
+
+DB_KEYS = ["host", "port", "database", "user", "password"]
+
+
+class PoolTimeout(Exception):
+    """No se libero ninguna conexion del pool dentro del tiempo de espera."""
+
+
+def connection_params(config):
+    """Solo los parametros de conexion de db_config.json (el archivo trae mas secciones)."""
+    return {key: config[key] for key in DB_KEYS if key in config}
+
+
+class BlockingConnectionPool:
+    """
+    Pool de conexiones psycopg2 compartido por los hilos de un proceso.
+
+    A diferencia de ThreadedConnectionPool, cuando todas las conexiones estan ocupadas
+    `getconn` espera hasta `timeout` segundos a que se libere una en lugar de lanzar
+    PoolError. Las conexiones van en autocommit, asi que una consulta de lectura no deja
+    transacciones abiertas, y las que fallan se cierran en vez de regresar al pool.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=5.0, **params):
+        self.timeout = float(timeout)
+        self._pool = pg_pool.ThreadedConnectionPool(int(minconn), int(maxconn), **params)
+        self._slots = threading.BoundedSemaphore(int(maxconn))
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No hay conexiones libres despues de {self.timeout} s")
+        try:
+            conn = self._pool.getconn()
+            conn.autocommit = True
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        self._pool.closeall()
@@ -0,0 +1,166 @@
+"""
+Esquema de la tabla `results`: particionada por mes sobre `timestamp`, con un indice
+cubriente en (camera_id, timestamp DESC) que incluye los Fs, para que las consultas por
+camara y rango de tiempo lean solo las particiones del rango y no toquen el heap.
+
+`migrate()` (python run.py migrate_db) crea la tabla o convierte la tabla plana anterior:
+la renombra a `results_legacy`, crea la particionada con las particiones que cubren sus
+datos y copia las filas. Las filas con `timestamp` nulo o que no se puede convertir se
+quedan solo en `results_legacy`, que se conserva para borrarla a mano despues de
+verificar la copia. `ensure_partitions()` crea las particiones de los meses siguientes y
+la llama el worker de base de datos al cambiar de mes.
+
+Si la particion por defecto ya tiene filas del mes de una particion nueva, PostgreSQL no
+deja crearla; `create_partition()` separa la particion por defecto, crea la del mes, le
+mueve esas filas y vuelve a unir la particion por defecto.
+"""
+import json
+from datetime import date
+
+import psycopg2
+
+from db_pool import connection_params
+from pyinstaller_utils import resource_path
+
+TABLE = "results"
+F_COLUMNS = ["f10", "f20", "f30", "f40", "f50", "f60", "f70", "f80", "f90", "f100"]
+F_AJST_COLUMNS = [f"{c}_ajst" for c in F_COLUMNS]
+
+CREATE_PARTITIONED = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        id BIGSERIAL,
+        timestamp TIMESTAMPTZ NOT NULL,
+        camera_id TEXT NOT NULL,
+        {", ".join(f"{c} DOUBLE PRECISION" for c in F_COLUMNS + F_AJST_COLUMNS)},
+        simulation BOOLEAN,
+        og_img_path TEXT,
+        seg_img_path TEXT,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+"""
+DEFAULT_PARTITION = f"{TABLE}_default"
+CREATE_DEFAULT_PARTITION = f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"
+CREATE_INDEX = f"""
+    CREATE INDEX IF NOT EXISTS {TABLE}_camera_ts_idx ON {TABLE} (camera_id, timestamp DESC)
+    INCLUDE ({", ".join(F_COLUMNS + F_AJST_COLUMNS)}, simulation)
+"""
+# Convierte el timestamp de la tabla anterior (de cualquier tipo) o regresa NULL si no se puede.
+CREATE_TIMESTAMP_CAST = """
+    CREATE OR REPLACE FUNCTION pg_temp.f80_to_timestamptz(value text) RETURNS timestamptz
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        RETURN value::timestamptz;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END
+    $$
+"""
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month_start):
+    return f"{TABLE}_{month_start:%Y_%m}"
+
+
+def create_partition(cur, month_start):
+    """
+    Crea la particion del mes si falta. Si la particion por defecto tiene filas de ese
+    mes, las mueve a la particion nueva (en la misma transaccion).
+    """
+    month_start = month_start.replace(day=1)
+    name = partition_name(month_start)
+    if _table_kind(cur, name) is not None:
+        return
+    bounds = (month_start, _add_months(month_start, 1))
+    create = f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)"
+    if _table_kind(cur, DEFAULT_PARTITION) is not None:
+        cur.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s)", bounds
+        )
+        if cur.fetchone()[0]:
+            cur.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+            cur.execute(create, bounds)
+            cur.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+                bounds,
+            )
+            moved = cur.rowcount
+            cur.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+            print(f"Se movieron {moved} filas de '{DEFAULT_PARTITION}' a '{name}'.")
+            return
+    cur.execute(create, bounds)
+
+
+def ensure_partitions(conn, months_ahead=2, today=None):
+    """Crea (si faltan) las particiones del mes actual y de los `months_ahead` siguientes."""
+    current = (today or date.today()).replace(day=1)
+    with conn.cursor() as cur:
+        for i in range(months_ahead + 1):
+            create_partition(cur, _add_months(current, i))
+    conn.commit()
+
+
+def _table_kind(cur, name):
+    """'p' si es particionada, 'r' si es una tabla normal, None si no existe."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def migrate(config=None, months_ahead=2):
+    if config is None:
+        with open(resource_path("configs/db_config.json"), "r") as f:
+            config = json.load(f)
+    conn = psycopg2.connect(**connection_params(config))
+    try:
+        with conn.cursor() as cur:
+            kind = _table_kind(cur, TABLE)
+            if kind == "p":
+                print(f"La tabla '{TABLE}' ya esta particionada.")
+            elif kind is None:
+                cur.execute(CREATE_PARTITIONED)
+                print(f"Se creo la tabla particionada '{TABLE}'.")
+            else:
+                if _table_kind(cur, f"{TABLE}_legacy") is not None:
+                    raise RuntimeError(f"Ya existe '{TABLE}_legacy'; revisela y borrela antes de migrar.")
+                cur.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy")
+                cur.execute(CREATE_PARTITIONED)
+                cur.execute(CREATE_TIMESTAMP_CAST)
+                legacy_ts = "pg_temp.f80_to_timestamptz(\"timestamp\"::text)"
+                cur.execute(f"SELECT min({legacy_ts}), max({legacy_ts}) FROM {TABLE}_legacy")
+                oldest, newest = cur.fetchone()
+                if oldest is not None:
+                    month = oldest.date().replace(day=1)
+                    while month <= newest.date():
+                        create_partition(cur, month)
+                        month = _add_months(month, 1)
+                rest = ["camera_id"] + F_COLUMNS + F_AJST_COLUMNS + ["simulation", "og_img_path", "seg_img_path"]
+                cur.execute(
+                    f"INSERT INTO {TABLE} (id, timestamp, {', '.join(rest)}) "
+                    f"SELECT id, {legacy_ts}, {', '.join(rest)} FROM {TABLE}_legacy WHERE {legacy_ts} IS NOT NULL"
+                )
+                copied = cur.rowcount
+                cur.execute(f"SELECT count(*) FROM {TABLE}_legacy WHERE {legacy_ts} IS NULL")
+                skipped = cur.fetchone()[0]
+                if skipped:
+                    print(f"{skipped} filas con timestamp nulo o invalido se quedaron solo en '{TABLE}_legacy'.")
+                cur.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+                    f"COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+                )
+                print(f"Se copiaron {copied} filas de '{TABLE}_legacy' a la tabla particionada.")
+            cur.execute(CREATE_DEFAULT_PARTITION)
+            cur.execute(CREATE_INDEX)
+        conn.commit()
+        ensure_partitions(conn, months_ahead)
+        print(f"Esquema de '{TABLE}' listo.")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,90 @@
+"""
+Cache en Redis del ultimo resultado guardado de cada camara.
+
+El escritor de resultados (workers.db_writer) lo actualiza despues de cada commit con
+las filas que regresa el INSERT, y la API responde /results/latest/all leyendo el hash
+en lugar de correr DISTINCT ON sobre toda la tabla. Una fila solo reemplaza a la de su
+camara si no es mas vieja, asi que dos workers que guardan fuera de orden no dejan un
+resultado viejo en el cache.
+
+La llave `results:latest:seeded` indica que el cache ya se lleno desde la DB; si no
+existe (Redis se reinicio o nunca se lleno) la API consulta la DB y lo vuelve a llenar.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+LATEST_KEY = "results:latest"
+LATEST_TS_KEY = "results:latest:ts"
+SEEDED_KEY = "results:latest:seeded"
+
+# ARGV[1] = "1" si la llamada llena el cache desde la DB; despues tercias (camara, ts, json).
+_UPDATE = """
+local updated = 0
+for i = 2, #ARGV, 3 do
+    local current = tonumber(redis.call('HGET', KEYS[2], ARGV[i]))
+    if not current or tonumber(ARGV[i + 1]) >= current then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+        updated = updated + 1
+    end
+end
+if ARGV[1] == '1' then
+    redis.call('SET', KEYS[3], '1')
+end
+return updated
+"""
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _epoch(timestamp):
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return 0.0
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return 0.0
+
+
+def _update_args(rows, seeded):
+    args = ["1" if seeded else "0"]
+    for row in rows:
+        args.extend([row["camera_id"], repr(_epoch(row["timestamp"])), json.dumps(row, default=json_default)])
+    return args
+
+
+class LatestResultCache:
+    """
+    Acceso al cache con un cliente de Redis sincrono (workers) o de redis.asyncio (API);
+    con el cliente asincrono los metodos regresan corutinas.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._update = client.register_script(_UPDATE)
+
+    def update(self, rows, seeded=False):
+        """Guarda las filas (dicts con las columnas de results) que sean las mas nuevas de su camara."""
+        return self._update(keys=[LATEST_KEY, LATEST_TS_KEY, SEEDED_KEY], args=_update_args(rows, seeded))
+
+    async def read_all(self):
+        """
+        Ultimo resultado de cada camara ordenado por camara, o None si el cache no se ha
+        llenado desde la DB (solo con cliente asincrono).
+        """
+        async with self.client.pipeline(transaction=True) as pipe:
+            seeded, values = await pipe.exists(SEEDED_KEY).hvals(LATEST_KEY).execute()
+        if not seeded:
+            return None
+        rows = [json.loads(value) for value in values]
+        rows.sort(key=lambda row: row["camera_id"])
+        return rows
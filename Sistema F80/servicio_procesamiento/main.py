@@ -1,28 +1,107 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from celery.result import AsyncResult
-import psycopg2
 import psycopg2.extras
 from celery_app import celery_app
 import uvicorn
 import json
 from pyinstaller_utils import resource_path
+from db_pool import BlockingConnectionPool, PoolTimeout, connection_params
+from db_schema import F_COLUMNS
+from results_export import FORMATS, STREAMS, fetch_chunks
+from latest_cache import LatestResultCache
+from result_events import ResultBroadcaster
+import metrics
+import redis.asyncio as aioredis
 
 app = FastAPI(title="F80 - Perfect Blend API")
+DB_POOL = None
+DB_POOL_LOCK = threading.Lock()
+LATEST_CACHE = None
+BROADCASTER = None
+SSE_KEEPALIVE_S = 15.0
+AGGREGATE_BUCKETS = ("minute", "hour", "day", "week", "month")
 
 def get_db_connection_details():
     config_path = resource_path("configs/db_config.json")
     with open(config_path, 'r') as f:
         return json.load(f)
 
-def get_db():
-    conn = None
+def create_db_pool():
+    """
+    Crea el pool de conexiones del proceso con la seccion "api_pool" de db_config.json,
+    si no existe. Las consultas lo llaman desde varios hilos del threadpool a la vez.
+    """
+    global DB_POOL
+    with DB_POOL_LOCK:
+        if DB_POOL is None:
+            DB_POOL = _new_db_pool()
+    return DB_POOL
+
+def _new_db_pool():
+    db_config = get_db_connection_details()
+    pool_config = db_config.get("api_pool", {})
+    pool = BlockingConnectionPool(
+        pool_config.get("min_size", 1),
+        pool_config.get("max_size", 10),
+        timeout=pool_config.get("timeout", 5.0),
+        **connection_params(db_config),
+    )
+    print("Pool de conexiones de la API creado.")
+    return pool
+
+@app.on_event("startup")
+def open_db_pool():
     try:
-        db_config = get_db_connection_details()
-        conn = psycopg2.connect(**db_config)
-        yield conn
-    finally:
-        if conn:
-            conn.close()
+        create_db_pool()
+    except Exception as e:
+        # La API arranca aunque la DB no este disponible; se reintenta en la primera consulta.
+        print(f"Error creando el pool de conexiones de la API: {e}")
+
+@app.on_event("startup")
+async def open_redis():
+    global LATEST_CACHE, BROADCASTER
+    client = aioredis.Redis(host='localhost', port=6379, db=0)
+    LATEST_CACHE = LatestResultCache(client)
+    BROADCASTER = ResultBroadcaster(client)
+    BROADCASTER.start()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    if DB_POOL is not None:
+        DB_POOL.closeall()
+
+@app.on_event("shutdown")
+async def close_redis():
+    if BROADCASTER is not None:
+        await BROADCASTER.stop()
+    if LATEST_CACHE is not None:
+        await LATEST_CACHE.client.aclose()
+
+def _fetch_all(sql, params=None):
+    if DB_POOL is None:
+        create_db_pool()
+    with DB_POOL.connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+async def fetch_all(sql, params=None):
+    """
+    Corre la consulta con una conexion del pool en el threadpool de la API, para que
+    psycopg2 no bloquee el event loop mientras espera a PostgreSQL.
+    """
+    try:
+        return await run_in_threadpool(_fetch_all, sql, params)
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos ocupada: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
 @app.get("/status/{task_id}")
 async def get_task_status(task_id: str):
@@ -48,42 +127,218 @@ async def get_task_result(task_id: str):
     return {"task_id": task_id, "status": "SUCCESS", "result": task_result.result}
 
 @app.get("/results/{camera_id}")
-async def get_results_for_camera(camera_id: str, limit: int = 10, db=Depends(get_db)):
+async def get_results_for_camera(camera_id: str, limit: int = 10):
+    results = await fetch_all(
+        """
+        SELECT * FROM results 
+        WHERE camera_id = %s 
+        ORDER BY timestamp DESC 
+        LIMIT %s;
+        """,
+        (camera_id, limit)
+    )
+    if not results:
+        raise HTTPException(status_code=404, detail=f"No hay resultados para '{camera_id}'")
+    return results
+
+@app.get("/results/latest/all")
+async def get_latest_results_for_all_cameras():
+    """
+    Ultimo resultado de cada camara desde el cache en Redis que actualiza el escritor de
+    resultados. Si el cache no esta lleno o Redis no responde se consulta la DB y se
+    vuelve a llenar el cache con esas filas.
+    """
     try:
-        with db.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT * FROM results 
-                WHERE camera_id = %s 
-                ORDER BY timestamp DESC 
-                LIMIT %s;
-                """,
-                (camera_id, limit)
-            )
-            results = cur.fetchall()
-            if not results:
-                raise HTTPException(status_code=404, detail=f"No hay resultados para '{camera_id}'")
-            return results
+        results = await LATEST_CACHE.read_all()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        print(f"Error leyendo el cache de ultimos resultados: {e}")
+        results = None
+    if results is None:
+        results = await fetch_all(
+            """
+            SELECT DISTINCT ON (camera_id) *
+            FROM results
+            ORDER BY camera_id, timestamp DESC;
+            """
+        )
+        try:
+            await LATEST_CACHE.update(results, seeded=True)
+        except Exception as e:
+            print(f"Error llenando el cache de ultimos resultados: {e}")
+    if not results:
+        raise HTTPException(status_code=404, detail="No hay resultados en la base de datos.")
+    return results
+
+@app.get("/results/{camera_id}/aggregate")
+async def get_aggregated_results(
+    camera_id: str,
+    bucket: str = "hour",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    campos: List[str] = Query(default=F_COLUMNS),
+    ajustado: bool = False,
+):
+    """
+    Promedio, minimo y maximo de los Fs por intervalo (`bucket`: minute, hour, day, week
+    o month) entre `desde` y `hasta` (por defecto las ultimas 24 horas), calculados en la
+    DB. Solo se leen las particiones del rango, por el indice (camera_id, timestamp).
+    """
+    if bucket not in AGGREGATE_BUCKETS:
+        raise HTTPException(status_code=422, detail=f"bucket debe ser uno de {AGGREGATE_BUCKETS}")
+    invalid = [c for c in campos if c not in F_COLUMNS]
+    if invalid:
+        raise HTTPException(status_code=422, detail=f"Campos invalidos: {invalid}")
+    hasta = hasta or datetime.now(timezone.utc)
+    desde = desde or hasta - timedelta(hours=24)
+    # Los nombres de columna salen de F_COLUMNS, no del texto del usuario.
+    columns = [f"{c}_ajst" if ajustado else c for c in campos]
+    aggregates = ", ".join(
+        f"avg({col}) AS {name}_avg, min({col}) AS {name}_min, max({col}) AS {name}_max"
+        for name, col in zip(campos, columns)
+    )
+    return await fetch_all(
+        f"""
+        SELECT date_trunc(%s, timestamp) AS bucket, count(*) AS n, {aggregates}
+        FROM results
+        WHERE camera_id = %s AND timestamp >= %s AND timestamp < %s
+        GROUP BY 1
+        ORDER BY 1;
+        """,
+        (bucket, camera_id, desde, hasta)
+    )
+
+@app.get("/results/{camera_id}/export")
+async def export_results(camera_id: str, desde: datetime, hasta: Optional[datetime] = None, formato: str = "csv"):
+    """
+    Exporta los resultados de una camara entre `desde` y `hasta` (por defecto ahora) como
+    csv, ndjson o arrow (Arrow IPC stream). Las filas salen de un cursor del lado del
+    servidor por bloques, asi que la memoria de la API no crece con el rango pedido.
+    """
+    if formato not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"formato debe ser uno de {tuple(FORMATS)}")
+    if formato == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="El formato arrow requiere pyarrow instalado.")
+    hasta = hasta or datetime.now(timezone.utc)
+
+    def open_export():
+        if DB_POOL is None:
+            create_db_pool()
+        conn = DB_POOL.getconn()
+        try:
+            columns, chunks = fetch_chunks(conn, (camera_id, desde, hasta))
+        except Exception:
+            DB_POOL.putconn(conn, close=True)
+            raise
+        return conn, columns, chunks
 
-@app.get("/results/latest/all")
-async def get_latest_results_for_all_cameras(db=Depends(get_db)):
     try:
-        with db.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT DISTINCT ON (camera_id) *
-                FROM results
-                ORDER BY camera_id, timestamp DESC;
-                """
-            )
-            results = cur.fetchall()
-            if not results:
-                raise HTTPException(status_code=404, detail="No hay resultados en la base de datos.")
-            return results
+        conn, columns, chunks = await run_in_threadpool(open_export)
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos ocupada: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
+    def body():
+        try:
+            yield from STREAMS[formato](columns, chunks)
+        finally:
+            chunks.close()
+            # El pool hace rollback de la transaccion del cursor si quedo abierta.
+            DB_POOL.putconn(conn)
+
+    media_type, extension = FORMATS[formato]
+    filename = f"results_{camera_id}_{desde:%Y%m%d%H%M}_{hasta:%Y%m%d%H%M}.{extension}"
+    return StreamingResponse(
+        body(), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def _wanted(item, camera_id, thumbnails):
+    item_camera, full, light = item
+    if camera_id is not None and item_camera != camera_id:
+        return None
+    return full if thumbnails else light
+
+@app.websocket("/ws/results")
+async def results_websocket(websocket: WebSocket, camera_id: Optional[str] = None, thumbnails: bool = False):
+    """
+    Envia cada resultado nuevo en cuanto se guarda: {"result": fila, "thumbnail": ...}.
+    Con `camera_id` solo los de esa camara; con `thumbnails=true` incluye la miniatura
+    de la imagen segmentada si el worker la genera.
+
+    Tambien se lee el socket mientras se espera el siguiente resultado, para detectar a
+    los clientes que se desconectan aunque su camara no tenga resultados nuevos.
+    """
+    await websocket.accept()
+    queue = BROADCASTER.subscribe()
+    receiver = asyncio.ensure_future(websocket.receive())
+    getter = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                # Los mensajes del cliente se ignoran.
+                receiver = asyncio.ensure_future(websocket.receive())
+            if getter.done():
+                text = _wanted(getter.result(), camera_id, thumbnails)
+                if text is not None:
+                    await websocket.send_text(text)
+            else:
+                getter.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in (receiver, getter):
+            if task is not None and not task.done():
+                task.cancel()
+        BROADCASTER.unsubscribe(queue)
+
+@app.get("/stream/results")
+async def results_event_stream(request: Request, camera_id: Optional[str] = None, thumbnails: bool = False):
+    """Mismos mensajes que /ws/results como Server-Sent Events."""
+    queue = BROADCASTER.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    # Comentario SSE para que proxies y navegadores no cierren la conexion.
+                    yield ": keepalive\n\n"
+                    continue
+                text = _wanted(item, camera_id, thumbnails)
+                if text is not None:
+                    yield f"data: {text}\n\n"
+        finally:
+            BROADCASTER.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metricas en formato de texto de Prometheus: profundidad de las colas de Celery,
+    histogramas de latencia por etapa y camara, y los clientes de /ws y /stream.
+    """
+    extra = [
+        "# HELP f80_api_stream_clients Clientes conectados a /ws/results y /stream/results",
+        "# TYPE f80_api_stream_clients gauge",
+        f"f80_api_stream_clients {BROADCASTER.client_count if BROADCASTER else 0}",
+        "# HELP f80_api_results_broadcast_total Resultados recibidos del canal de Redis",
+        "# TYPE f80_api_results_broadcast_total counter",
+        f"f80_api_results_broadcast_total {BROADCASTER.messages if BROADCASTER else 0}",
+    ]
+    try:
+        return await run_in_threadpool(metrics.render, metrics.get_recorder().client, extra)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"No se pudieron leer las metricas de Redis: {e}")
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
\ No newline at end of file
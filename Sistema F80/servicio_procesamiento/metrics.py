@@ -0,0 +1,290 @@
+"""
+Metricas de latencia por etapa del pipeline, compartidas entre procesos por Redis.
+
+Cada frame lleva un diccionario `trace` con el tiempo epoch en que paso por cada etapa
+(captura, despacho, inicio/fin de inferencia, inicio/fin de PSD, guardado y commit en la
+DB). Cada worker registra en histogramas por camara las duraciones de las etapas que ya
+conoce, en un solo pipeline de Redis por tarea. Las APIs leen los histogramas y la
+profundidad de las colas de Celery y los exponen en formato de texto de Prometheus.
+
+Los workers de inferencia publican ademas si ya terminaron su warm-up (una llave por
+proceso con TTL que renueva un hilo), expuesta como el gauge f80_worker_ready.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import redis
+
+# Limites superiores (segundos) de los buckets de los histogramas; el ultimo es +Inf.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+HIST_PREFIX = "metrics:hist:"
+HIST_INDEX = "metrics:hist:index"
+DROPPED_KEY = "metrics:dropped"
+READY_PREFIX = "metrics:ready:"
+READY_TTL = 60
+QUEUES = ("camaras_queue", "inference_queue", "processing_queue", "database_queue")
+RECORDER = None
+
+# metrica -> (etapa inicial, etapa final) del trace
+STAGES = {
+    "capture_to_dispatch": ("capture", "dispatch"),
+    "inference_queue_wait": ("dispatch", "inference_start"),
+    "inference": ("inference_start", "inference_end"),
+    "processing_queue_wait": ("inference_end", "process_start"),
+    "psd": ("process_start", "process_end"),
+    "database_queue_wait": ("process_end", "db_start"),
+    "db_write": ("db_start", "db_commit"),
+    "end_to_end": ("capture", "db_commit"),
+}
+STAGE_HELP = {
+    "capture_to_dispatch": "Desde la captura hasta que el frame se envia a inference_queue (buffer de camara + polling)",
+    "inference_queue_wait": "Espera en el broker antes de la inferencia",
+    "inference": "Tarea perform_inference",
+    "processing_queue_wait": "Espera en el broker antes del calculo de PSD",
+    "psd": "Tarea process_granulometry",
+    "database_queue_wait": "Espera en el broker antes de save_to_db",
+    "db_write": "Desde save_to_db hasta el commit del lote en PostgreSQL",
+    "end_to_end": "Desde la captura hasta el commit en PostgreSQL",
+    "poll_fetch": "Peticion HTTP del frame al servicio de camaras",
+}
+
+
+def get_recorder():
+    """Registrador del proceso; el cliente de Redis (db0, el broker) se conecta en el primer uso."""
+    global RECORDER
+    if RECORDER is None:
+        RECORDER = MetricsRecorder(redis.Redis(host="localhost", port=6379, db=0))
+    return RECORDER
+
+
+def new_trace(capture_time=None):
+    """Trace nuevo; `capture_time` es el epoch o el ISO 8601 del header capture-time."""
+    trace = {}
+    if isinstance(capture_time, str):
+        try:
+            capture_time = datetime.fromisoformat(capture_time).timestamp()
+        except ValueError:
+            capture_time = None
+    if capture_time is not None:
+        trace["capture"] = float(capture_time)
+    return trace
+
+
+def mark(trace, stage, ts=None):
+    """Registra el tiempo de una etapa en el trace (si hay trace) y lo regresa."""
+    if trace is not None:
+        trace[stage] = time.time() if ts is None else ts
+    return trace
+
+
+def stage_durations(trace, stages=None):
+    """Duraciones (s) de las etapas del trace que tienen sus dos marcas."""
+    durations = {}
+    for name, (start, end) in STAGES.items():
+        if stages is not None and name not in stages:
+            continue
+        if start in trace and end in trace:
+            durations[name] = max(trace[end] - trace[start], 0.0)
+    return durations
+
+
+def _bucket_index(value):
+    for i, upper in enumerate(BUCKETS):
+        if value <= upper:
+            return i
+    return len(BUCKETS)
+
+
+class MetricsRecorder:
+    """Acumula observaciones en histogramas de Redis (un hash por metrica y camara)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def observe_many(self, camera_id, observations):
+        if not observations:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for name, value in observations.items():
+            key = f"{HIST_PREFIX}{name}:{camera_id}"
+            pipe.sadd(HIST_INDEX, f"{name}|{camera_id}")
+            pipe.hincrby(key, f"b{_bucket_index(value)}", 1)
+            pipe.hincrbyfloat(key, "sum", value)
+            pipe.hincrby(key, "count", 1)
+        pipe.execute()
+
+    def count_dropped(self, camera_id, reason):
+        """Cuenta un frame descartado por el control de admision (ver admission)."""
+        try:
+            self.client.hincrby(DROPPED_KEY, f"{camera_id}|{reason}", 1)
+        except Exception as e:
+            print(f"Error registrando metricas: {e}")
+
+    def observe_trace(self, camera_id, trace, stages=None, extra=None):
+        """Registra las etapas del trace (todas o solo `stages`) mas observaciones extra."""
+        observations = stage_durations(trace or {}, stages)
+        observations.update(extra or {})
+        try:
+            self.observe_many(camera_id, observations)
+        except Exception as e:
+            # Las metricas nunca deben tumbar una tarea del pipeline.
+            print(f"Error registrando metricas: {e}")
+
+
+class PendingTraces:
+    """
+    Traces de resultados que esperan el commit del escritor de la DB, con la ruta de la
+    imagen original como llave (es unica y viene en la fila que regresa el INSERT).
+    """
+
+    def __init__(self, recorder, max_pending=1000):
+        self.recorder = recorder
+        self.max_pending = int(max_pending)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key, camera_id, trace):
+        with self._lock:
+            self._pending[str(key)] = (camera_id, trace)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+
+    def on_commit(self, rows):
+        now = time.time()
+        with self._lock:
+            entries = [self._pending.pop(row.get("og_img_path"), None) for row in rows]
+        for entry in entries:
+            if entry is None:
+                continue
+            camera_id, trace = entry
+            trace["db_commit"] = now
+            self.recorder.observe_trace(camera_id, trace, stages=("db_write", "end_to_end"))
+
+
+class ReadinessReporter:
+    """
+    Publica en Redis si el worker de este proceso esta listo. La llave expira si el
+    proceso muere; mientras vive, un hilo la renueva cada tercio del TTL.
+    """
+
+    def __init__(self, client, name, ttl=READY_TTL):
+        self.client = client
+        self.key = READY_PREFIX + name
+        self.ttl = int(ttl)
+        self.ready = False
+        self._failing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set(self, ready):
+        self.ready = bool(ready)
+        self._publish()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="readiness", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            self._publish()
+
+    def _publish(self):
+        try:
+            self.client.set(self.key, int(self.ready), ex=self.ttl)
+            self._failing = False
+        except Exception as e:
+            # Solo se reporta el primer error de una racha para no llenar el log.
+            if not self._failing:
+                print(f"Error publicando el estado del worker: {e}")
+            self._failing = True
+
+    def clear(self):
+        self._stop.set()
+        try:
+            self.client.delete(self.key)
+        except Exception:
+            pass
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_histograms(client):
+    """Histogramas de Redis en formato de texto de Prometheus."""
+    members = sorted(m.decode() if isinstance(m, bytes) else m for m in client.smembers(HIST_INDEX))
+    pipe = client.pipeline(transaction=False)
+    for member in members:
+        name, camera_id = member.split("|", 1)
+        pipe.hgetall(f"{HIST_PREFIX}{name}:{camera_id}")
+    values = pipe.execute()
+
+    by_metric = OrderedDict()
+    for member, fields in zip(members, values):
+        name, camera_id = member.split("|", 1)
+        fields = {k.decode() if isinstance(k, bytes) else k: v for k, v in fields.items()}
+        by_metric.setdefault(name, []).append((camera_id, fields))
+
+    lines = []
+    for name, series in by_metric.items():
+        metric = f"f80_{name}_seconds"
+        lines.append(f"# HELP {metric} {STAGE_HELP.get(name, name)}")
+        lines.append(f"# TYPE {metric} histogram")
+        for camera_id, fields in series:
+            label = f'camera="{_escape(camera_id)}"'
+            cumulative = 0
+            for i, upper in enumerate(BUCKETS + (float("inf"),)):
+                cumulative += int(fields.get(f"b{i}", 0))
+                le = "+Inf" if upper == float("inf") else repr(upper)
+                lines.append(f'{metric}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{label}}} {float(fields.get('sum', 0))}")
+            lines.append(f"{metric}_count{{{label}}} {int(fields.get('count', 0))}")
+    return lines
+
+
+def render_queue_depths(client, queues=QUEUES):
+    """Numero de tareas esperando en cada cola de Celery (listas del broker Redis)."""
+    pipe = client.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+    depths = pipe.execute()
+    lines = [
+        "# HELP f80_queue_depth Tareas esperando en la cola de Celery",
+        "# TYPE f80_queue_depth gauge",
+    ]
+    lines.extend(f'f80_queue_depth{{queue="{queue}"}} {depth}' for queue, depth in zip(queues, depths))
+    return lines
+
+
+def render_dropped(client):
+    lines = [
+        "# HELP f80_frames_dropped_total Frames descartados por camara y motivo (cola llena, camara ocupada, expirado)",
+        "# TYPE f80_frames_dropped_total counter",
+    ]
+    counts = client.hgetall(DROPPED_KEY)
+    for field in sorted(counts):
+        camera_id, reason = (field.decode() if isinstance(field, bytes) else field).split("|", 1)
+        lines.append(f'f80_frames_dropped_total{{camera="{_escape(camera_id)}",reason="{reason}"}} {int(counts[field])}')
+    return lines
+
+
+def render_readiness(client):
+    """1 si el worker termino su warm-up, 0 si fallo; los procesos muertos expiran solos."""
+    keys = sorted(k.decode() if isinstance(k, bytes) else k for k in client.scan_iter(f"{READY_PREFIX}*"))
+    values = client.mget(keys) if keys else []
+    lines = [
+        "# HELP f80_worker_ready Worker de inferencia listo (modelo cargado y warm-up completo)",
+        "# TYPE f80_worker_ready gauge",
+    ]
+    for key, value in zip(keys, values):
+        if value is not None:
+            lines.append(f'f80_worker_ready{{worker="{_escape(key[len(READY_PREFIX):])}"}} {int(value)}')
+    return lines
+
+
+def render(client, extra_lines=()):
+    """Texto completo para /metrics: colas, histogramas del pipeline y lineas propias de cada API."""
+    lines = (render_queue_depths(client) + render_dropped(client) + render_readiness(client)
+             + render_histograms(client) + list(extra_lines))
+    return "\n".join(lines) + "\n"
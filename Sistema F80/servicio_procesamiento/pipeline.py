@@ -0,0 +1,306 @@
+"""
+Modo pipeline de un solo proceso para instalaciones de una sola maquina
+(python run.py pipeline).
+
+Corre captura, inferencia, PSD y guardado sin Celery, Beat ni la API de camaras. Cada
+camara captura en su propio proceso (camera_service.proceso_captura) sobre su buffer de
+memoria compartida. El resto son hilos del mismo proceso unidos por colas acotadas:
+
+    despacho (un hilo por camara) -> inferencia (N hilos) -> PSD -> guardado
+
+Las etapas son las mismas funciones que usan las tareas de Celery
+(workers.inference.infer_frame, workers.process.compute_granulometry y
+workers.database.persist_result). Los frames y las imagenes pasan por referencia entre
+etapas, sin serializarse ni pasar por el broker. El historial de cada camara vive en
+memoria (workers.history.MemoryHistory). El modelo es uno solo y su `predict` esta
+serializado (ver workers.inference.MODEL_LOCK y OnnxSegmentationEngine), asi que con
+varios hilos de inferencia lo que se traslapa es la decodificacion del JPEG, el
+pre-procesamiento y el post-procesamiento de cada frame.
+
+La contrapresion es la misma idea que en admission: cada camara tiene a lo mas un frame
+en espera o en inferencia. Si sigue ocupada o la cola de inferencia esta llena, el frame
+se omite y en el siguiente ciclo se toma el mas reciente. Los frames con mas de
+`max_frame_age` segundos no se procesan.
+"""
+import json
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from metrics import PendingTraces, mark, new_trace, stage_durations
+from pyinstaller_utils import resource_path
+
+PIPELINE_STAGES = ("capture_to_dispatch", "inference_queue_wait", "inference", "processing_queue_wait", "psd",
+                   "database_queue_wait")
+# Se miden al hacer commit el lote del escritor (ver metrics.PendingTraces).
+COMMIT_STAGES = ("db_write", "end_to_end")
+_STOP = object()
+
+
+class StageStats:
+    """Duraciones recientes de cada etapa y contadores del pipeline, para el reporte periodico."""
+
+    def __init__(self, keep=1000):
+        self.durations = defaultdict(lambda: deque(maxlen=keep))
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def observe(self, trace, stages):
+        with self.lock:
+            for name, value in stage_durations(trace, stages).items():
+                self.durations[name].append(value)
+
+    def observe_trace(self, camera_id, trace, stages=None, extra=None):
+        """Misma interfaz que metrics.MetricsRecorder, para usarse con PendingTraces."""
+        self.observe(trace, stages)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def report(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            lines = [f"[PIPELINE] {self.counters['saved'] / elapsed:.2f} resultados/s, contadores: {dict(self.counters)}"]
+            for name in PIPELINE_STAGES + COMMIT_STAGES:
+                values = self.durations.get(name)
+                if values:
+                    p50, p95 = np.percentile(values, [50, 95])
+                    lines.append(f"[PIPELINE]   {name:<22} p50 {p50 * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+class StreamingPipeline:
+    def __init__(self, cameras, inference_threads=2, queue_size=4, max_frame_age=20.0, stats_interval=60.0):
+        self.cameras = [camera for camera in cameras if camera.get("enabled", True)]
+        self.inference_threads = int(inference_threads)
+        self.max_frame_age = float(max_frame_age)
+        self.stats_interval = float(stats_interval)
+        self.frames = queue.Queue(maxsize=int(queue_size))
+        self.inferred = queue.Queue(maxsize=int(queue_size))
+        self.processed = queue.Queue(maxsize=int(queue_size))
+        self.stop_evt = mp.Event()
+        self.stats = StageStats()
+        self._busy = set()
+        self._busy_lock = threading.Lock()
+        self._captures = []
+        self._threads = []
+
+    # --- Recursos ---
+
+    def load_resources(self):
+        """Carga modelo, configs, historial en memoria y escritor de resultados una sola vez."""
+        from workers import database, inference, process
+        from workers.history import MemoryHistory
+
+        inference.warmup()
+        if inference.MODEL is None:
+            raise RuntimeError("No se pudo cargar el modelo de inferencia.")
+        process_config = process.load_config()
+        if not process_config:
+            raise RuntimeError("No se pudo cargar el config del procesamiento.")
+        database.load_resources()
+        if database.WRITER is None or database.ARCHIVE is None:
+            raise RuntimeError("No se pudo preparar el guardado de resultados.")
+        try:
+            database.LATEST_CACHE.client.ping()
+        except Exception:
+            # Sin Redis no hay cache de ultimos resultados ni eventos en vivo para la API.
+            database.WRITER.on_commit.clear()
+            print("[PIPELINE] Redis no disponible: los resultados solo se guardan en PostgreSQL.")
+        # db_write y end_to_end del pipeline se miden al commit, en sus propias estadisticas.
+        self.pending = PendingTraces(self.stats)
+        database.WRITER.on_commit.append(self.pending.on_commit)
+        self.inference, self.process, self.database = inference, process, database
+        self.history = MemoryHistory(process_config.get("window_size", 1))
+
+    # --- Etapas ---
+
+    def _admit(self, cam_id):
+        with self._busy_lock:
+            if cam_id in self._busy:
+                return False
+            self._busy.add(cam_id)
+            return True
+
+    def _release(self, cam_id):
+        with self._busy_lock:
+            self._busy.discard(cam_id)
+
+    def _dispatch(self, camera, frame_buffer):
+        cam_id = camera["camara_id"]
+        interval = float(camera.get("intervalo_captura", 1.0))
+        last_seq = 0
+        next_tick = time.monotonic()
+        while not self.stop_evt.is_set():
+            next_tick = max(next_tick + interval, time.monotonic())
+            frame = frame_buffer.read_latest(after_seq=last_seq)
+            if frame is not None:
+                seq, capture_ts, jpg_bytes = frame
+                last_seq = seq
+                if not self._admit(cam_id):
+                    self.stats.count("camera_busy")
+                else:
+                    trace = mark(new_trace(capture_ts), "dispatch")
+                    try:
+                        self.frames.put_nowait((camera, capture_ts, jpg_bytes, trace))
+                    except queue.Full:
+                        self._release(cam_id)
+                        self.stats.count("queue_full")
+            self.stop_evt.wait(max(0.0, next_tick - time.monotonic()))
+
+    def _infer(self):
+        while True:
+            item = self.frames.get()
+            if item is _STOP:
+                return
+            camera, capture_ts, jpg_bytes, trace = item
+            cam_id = camera["camara_id"]
+            try:
+                mark(trace, "inference_start")
+                if self.max_frame_age > 0 and trace["inference_start"] - capture_ts > self.max_frame_age:
+                    self.stats.count("expired")
+                    continue
+                result = self.inference.infer_frame(cam_id, jpg_bytes)
+                mark(trace, "inference_end")
+                if result is None:
+                    self.stats.count("no_detections")
+                    continue
+                self.inferred.put((camera, capture_ts, result, trace))
+            except Exception as e:
+                self.stats.count("errors")
+                print(f"[PIPELINE] Error en la inferencia de la camara {cam_id}: {e}")
+            finally:
+                self._release(cam_id)
+
+    def _psd(self):
+        while True:
+            item = self.inferred.get()
+            if item is _STOP:
+                self.processed.put(_STOP)
+                return
+            camera, capture_ts, result, trace = item
+            cam_id = camera["camara_id"]
+            mark(trace, "process_start")
+            try:
+                granulometry = self.process.compute_granulometry(cam_id, result["area_ar"], self.history)
+            except Exception as e:
+                self.stats.count("errors")
+                print(f"[PIPELINE] Error calculando la granulometria de la camara {cam_id}: {e}")
+                continue
+            mark(trace, "process_end")
+            if granulometry is None:
+                continue
+            self.processed.put((camera, capture_ts, result, granulometry, trace))
+
+    def _persist(self):
+        while True:
+            item = self.processed.get()
+            if item is _STOP:
+                return
+            camera, capture_ts, result, (fs_list, fs_ajust_list), trace = item
+            mark(trace, "db_start")
+            results = {
+                "Fs": fs_list,
+                "Fs_ajust": fs_ajust_list,
+                "cam_id": camera["camara_id"],
+                "sim": camera.get("simulation", True),
+                "capture_time": datetime.fromtimestamp(capture_ts, timezone.utc).isoformat(),
+            }
+            try:
+                # Crea las particiones del mes siguiente cuando cambia el mes (una vez al mes).
+                self.database.maybe_ensure_partitions()
+                self.database.persist_result(results, result["og_jpeg"], result["seg_jpeg"], trace, self.pending)
+            except Exception as e:
+                self.stats.count("errors")
+                print(f"[PIPELINE] Error guardando el resultado de la camara {camera['camara_id']}: {e}")
+                continue
+            self.stats.observe(trace, PIPELINE_STAGES)
+            self.stats.count("saved")
+
+    # --- Ciclo de vida ---
+
+    def _start_thread(self, target, name, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def start(self):
+        from camera_service.frame_buffer import FrameRingBuffer
+        from camera_service.proceso_captura import capture_process
+
+        for camera in self.cameras:
+            frame_buffer = FrameRingBuffer(
+                slots=camera.get("buffer_frames", 5), max_frame_bytes=camera.get("buffer_max_bytes", 4 * 1024 * 1024),
+            )
+            proc = mp.Process(
+                target=capture_process,
+                args=(camera["url"], frame_buffer, self.stop_evt, camera.get("crop_y", []), camera.get("crop_x", []),
+                      camera.get("simulation", True), camera.get("simulation_source", "")),
+                kwargs={"capture_interval": camera.get("intervalo_captura", 1.0),
+                        "on_demand": camera.get("captura_bajo_demanda", True)},
+                daemon=True,
+            )
+            proc.start()
+            self._captures.append((proc, frame_buffer))
+            self._start_thread(self._dispatch, f"dispatch-{camera['camara_id']}", camera, frame_buffer)
+        self._inference_workers = [self._start_thread(self._infer, f"inference-{i}") for i in range(self.inference_threads)]
+        self._psd_worker = self._start_thread(self._psd, "psd")
+        self._persist_worker = self._start_thread(self._persist, "persist")
+        print(f"[PIPELINE] {len(self.cameras)} camaras, {self.inference_threads} hilos de inferencia.")
+
+    def stop(self, timeout=10.0):
+        """Detiene la captura, vacia las etapas en orden y cierra el escritor."""
+        self.stop_evt.set()
+        for thread in self._threads[:len(self.cameras)]:
+            thread.join(timeout)
+        for _ in self._inference_workers:
+            self.frames.put(_STOP)
+        for thread in self._inference_workers:
+            thread.join(timeout)
+        self.inferred.put(_STOP)
+        self._psd_worker.join(timeout)
+        self._persist_worker.join(timeout)
+        for proc, frame_buffer in self._captures:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+            frame_buffer.close()
+        self.database._close_writer()
+        print(self.stats.report())
+
+    def run_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(self.stats_interval)
+                print(self.stats.report())
+        except KeyboardInterrupt:
+            print("[PIPELINE] Deteniendo...")
+        finally:
+            self.stop()
+
+
+def load_config():
+    """Camaras de camera_config.json y seccion "pipeline" de config_general.json."""
+    with open(resource_path("configs/camera_config.json"), 'r') as f:
+        cameras = json.load(f)["camera_list"]
+    with open(resource_path("configs/config_general.json"), 'r') as f:
+        general = json.load(f)
+    config = dict(general.get("pipeline", {}))
+    config.setdefault("max_frame_age", general.get("admission", {}).get("max_frame_age", 20.0))
+    return cameras, config
+
+
+def run():
+    cameras, config = load_config()
+    pipeline = StreamingPipeline(cameras, **config)
+    pipeline.load_resources()
+    pipeline.run_forever()
@@ -16,34 +16,41 @@ pause
 echo.
 
 :: --- Paso 1: API de la Camara ---
-echo [1/5] Iniciando API de la Camara... Presiona Ctrl+C para detenerla y continuar.
+echo [1/6] Iniciando API de la Camara... Presiona Ctrl+C para detenerla y continuar.
 python run.py camera
 echo API de Camara detenida.
 echo.
 
 :: --- Paso 2: Worker de la Cola de Camaras ---
-echo [2/5] Iniciando Worker de Camaras...
+echo [2/6] Iniciando Worker de Camaras...
 python run.py worker camaras_queue 1
 echo Worker de Camaras crasheo o fue detenido.
 pause
 echo.
 
 :: --- Paso 3: Worker de la Cola de Inferencia ---
-echo [3/5] Iniciando Worker de Inferencia...
-python run.py worker inference_queue 4
+echo [3/6] Iniciando Worker de Inferencia...
+python run.py worker inference_queue
 echo Worker de Inferencia crasheo o fue detenido.
 pause
 echo.
 
 :: --- Paso 4: Worker de la Cola de Procesamiento ---
-echo [4/5] Iniciando Worker de Procesamiento...
+echo [4/6] Iniciando Worker de Procesamiento...
 python run.py worker processing_queue 2
 echo Worker de Procesamiento crasheo o fue detenido.
 pause
 echo.
 
-:: --- Paso 5: Celery Beat ---
-echo [5/5] Iniciando Celery Beat...
+:: --- Paso 5: Worker de la Cola de Base de Datos ---
+echo [5/6] Iniciando Worker de Base de Datos...
+python run.py worker database_queue
+echo Worker de Base de Datos crasheo o fue detenido.
+pause
+echo.
+
+:: --- Paso 6: Celery Beat ---
+echo [6/6] Iniciando Celery Beat...
 python run.py beat
 echo Celery Beat crasheo o fue detenido.
 pause
@@ -0,0 +1,146 @@
+"""
+Publicacion en vivo de los resultados guardados.
+
+El worker de procesamiento publica cada resultado en el canal de Redis `results:new`
+despues del commit en la DB (un mensaje JSON {"result": fila, "thumbnail": jpeg base64
+o null}). La API mantiene una sola suscripcion al canal y reparte cada mensaje a todos
+los clientes conectados por WebSocket o SSE, asi que la carga sobre Redis y PostgreSQL
+no crece con el numero de pantallas.
+"""
+import asyncio
+import base64
+import json
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from latest_cache import json_default
+
+CHANNEL = "results:new"
+REDUCED_READ_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def make_thumbnail(jpeg_bytes, scale=4, quality=70):
+    """
+    Miniatura JPEG en base64. Se decodifica directamente a 1/scale del tamano (el
+    decodificador JPEG se salta los coeficientes que no necesita), sin redimensionar.
+    """
+    flag = REDUCED_READ_FLAGS.get(int(scale), cv2.IMREAD_REDUCED_COLOR_4)
+    img = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), flag)
+    if img is None:
+        return None
+    _, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return base64.b64encode(buffer.tobytes()).decode("ascii")
+
+
+class ResultPublisher:
+    """
+    Publica en Redis las filas que regresa el escritor de resultados. Las miniaturas se
+    registran al guardar el resultado con la ruta de la imagen original como llave y se
+    adjuntan al publicar la fila correspondiente.
+    """
+
+    def __init__(self, client, max_pending_thumbnails=1000):
+        self.client = client
+        self.max_pending_thumbnails = int(max_pending_thumbnails)
+        self._thumbnails = OrderedDict()
+
+    def attach_thumbnail(self, og_img_path, thumbnail):
+        self._thumbnails[str(og_img_path)] = thumbnail
+        # Filas que nunca llegaron a la DB no deben acumular miniaturas.
+        while len(self._thumbnails) > self.max_pending_thumbnails:
+            self._thumbnails.popitem(last=False)
+
+    def publish(self, rows):
+        pipe = self.client.pipeline(transaction=False)
+        for row in rows:
+            thumbnail = self._thumbnails.pop(row.get("og_img_path"), None)
+            pipe.publish(CHANNEL, json.dumps({"result": row, "thumbnail": thumbnail}, default=json_default))
+        pipe.execute()
+
+
+class ResultBroadcaster:
+    """
+    Suscripcion unica al canal de resultados dentro de la API. Cada cliente recibe una
+    cola acotada; si un cliente no consume a tiempo se descartan sus mensajes mas viejos
+    en lugar de frenar a los demas.
+
+    Los mensajes se reparten como tuplas (camera_id, json completo, json sin miniatura)
+    ya serializadas, para no volver a serializar por cada cliente.
+    """
+
+    def __init__(self, client, queue_size=100, reconnect_delay=1.0):
+        self.client = client
+        self.queue_size = int(queue_size)
+        self.reconnect_delay = float(reconnect_delay)
+        self._clients = set()
+        self._task = None
+        self.messages = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._clients.discard(queue)
+
+    def _fan_out(self, item):
+        for queue in list(self._clients):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+    @staticmethod
+    def _prepare(data):
+        text = data.decode() if isinstance(data, bytes) else data
+        message = json.loads(text)
+        light = json.dumps({"result": message["result"]})
+        return message["result"].get("camera_id"), text, light
+
+    async def _run(self):
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                print(f"Suscrito al canal de resultados '{CHANNEL}'.")
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        item = self._prepare(message["data"])
+                    except Exception as e:
+                        print(f"Mensaje de resultados invalido: {e}")
+                        continue
+                    self.messages += 1
+                    self._fan_out(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error en la suscripcion de resultados, reintentando: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,125 @@
+"""
+Exportacion por streaming de resultados historicos.
+
+Las filas se leen con un cursor del lado del servidor (cursor con nombre de psycopg2)
+en bloques de `CHUNK_ROWS` y cada bloque se serializa y se envia antes de leer el
+siguiente, asi que la memoria de la API no depende del tamano de la exportacion.
+Formatos: CSV, NDJSON y Arrow IPC (stream de record batches, requiere pyarrow).
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from db_schema import F_AJST_COLUMNS, F_COLUMNS
+from latest_cache import json_default
+
+CHUNK_ROWS = 5000
+# formato -> (media type, extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+EXPORT_SQL = """
+    SELECT * FROM results
+    WHERE camera_id = %s AND timestamp >= %s AND timestamp < %s
+    ORDER BY timestamp
+"""
+
+
+def fetch_chunks(conn, params, chunk_rows=CHUNK_ROWS):
+    """
+    Regresa (columnas, generador de bloques de filas) usando un cursor con nombre. La
+    conexion se pasa a modo transaccional mientras dura el cursor.
+    """
+    conn.autocommit = False
+    cur = conn.cursor(name="results_export")
+    cur.itersize = chunk_rows
+    cur.execute(EXPORT_SQL, params)
+    first = cur.fetchmany(chunk_rows)
+    columns = [d[0] for d in cur.description]
+
+    def chunks():
+        try:
+            rows = first
+            while rows:
+                yield rows
+                rows = cur.fetchmany(chunk_rows)
+        finally:
+            cur.close()
+            conn.rollback()
+
+    return columns, chunks()
+
+
+def _cell(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def csv_stream(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows([_cell(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_stream(columns, chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(columns, row)), default=json_default) + "\n" for row in rows).encode()
+
+
+class _Collector:
+    """Archivo de solo escritura que junta los bytes que escribe pyarrow hasta vaciarlo."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _arrow_schema(pa, columns):
+    # Tipos fijos por columna: un bloque con una columna toda en NULL no debe cambiar el esquema.
+    known = {"id": pa.int64(), "timestamp": pa.timestamp("us", tz="UTC"), "simulation": pa.bool_()}
+    known.update({c: pa.float64() for c in F_COLUMNS + F_AJST_COLUMNS})
+    return pa.schema([(c, known.get(c, pa.string())) for c in columns])
+
+
+def arrow_stream(columns, chunks):
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa, columns)
+    sink = _Collector()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+    yield sink.drain()
+    for rows in chunks:
+        data = {c: [row[i] for row in rows] for i, c in enumerate(columns)}
+        writer.write_batch(pa.RecordBatch.from_pydict(data, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+STREAMS = {"csv": csv_stream, "ndjson": ndjson_stream, "arrow": arrow_stream}
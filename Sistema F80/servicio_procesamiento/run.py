@@ -1,5 +1,3 @@
-from gevent import monkey
-monkey.patch_all()
 import sys
 import os
 import subprocess
@@ -10,6 +8,23 @@ def apply_gevent_patch():
     from gevent import monkey
     monkey.patch_all()
 
+def prepare_worker_process():
+    """
+    Elige el pool del worker segun sus colas (ver worker_profiles.py) y, antes de que se
+    importe cualquier otra cosa, aplica el monkey-patch de gevent (solo pools de gevent)
+    o limita los hilos de ONNX/OpenCV/BLAS (pools de CPU). Regresa (pool, concurrencia).
+    """
+    from worker_profiles import POOL_ENV_VAR, apply_thread_limits, worker_profile
+    concurrency = sys.argv[3] if len(sys.argv) > 3 else None
+    pool = sys.argv[4] if len(sys.argv) > 4 else None
+    pool, concurrency, threads = worker_profile(sys.argv[2], concurrency, pool)
+    os.environ[POOL_ENV_VAR] = pool
+    if pool == "gevent":
+        apply_gevent_patch()
+    else:
+        apply_thread_limits(threads)
+    return pool, concurrency
+
 
 def fix_paths():
     """Modifica el path de Python para encontrar los módulos."""
@@ -35,14 +50,27 @@ def run_camera_service():
     print("Iniciando servicio de camara en el puerto 8001...")
     uvicorn.run("camera_service.camera_api:app", host="0.0.0.0", port=8001)
 
-def run_celery_worker_entrypoint():
+def run_migrate_db():
+    """Crea o migra la tabla results al esquema particionado (ver db_schema.py)."""
+    from db_schema import migrate
+    migrate()
+
+def run_pipeline_service():
+    """Corre captura, inferencia, PSD y guardado en un solo proceso, sin Celery (ver pipeline.py)."""
+    from pipeline import run
+    print("Iniciando pipeline de un solo proceso...")
+    run()
+
+def run_celery_worker_entrypoint(pool, concurrency):
     """Punto de entrada REAL para el worker de Celery."""
     from celery_app import celery_app
     queue_name = sys.argv[2]
-    concurrency = int(sys.argv[3])
+    # Los workers usan esto para saber que recursos precargar al arrancar.
+    os.environ["F80_WORKER_QUEUES"] = queue_name
+    print(f"Worker de '{queue_name}': pool {pool}, concurrencia {concurrency}")
     argv = [
         'worker', f'--hostname={queue_name}@%h', f'--queues={queue_name}',
-        '--loglevel=INFO', f'--concurrency={concurrency}', '--pool=gevent'
+        '--loglevel=INFO', f'--concurrency={concurrency}', f'--pool={pool}'
     ]
     celery_app.worker_main(argv)
 
@@ -53,22 +81,25 @@ def run_celery_beat_entrypoint():
     celery_app.start(argv)
 
 if __name__ == '__main__':
+    service = sys.argv[1] if len(sys.argv) > 1 else None
+    if service == 'worker_entry':
+        # Antes de importar multiprocessing, que ya importa threading.
+        worker_pool = prepare_worker_process()
     import multiprocessing as mp
     mp.freeze_support()
-    service = sys.argv[1] if len(sys.argv) > 1 else None
 
     if service and '_entry' in service:
         fix_paths()
         
         if service == 'worker_entry':
-            run_celery_worker_entrypoint()
+            run_celery_worker_entrypoint(*worker_pool)
         elif service == 'beat_entry':
             run_celery_beat_entrypoint()
     
     else:
         if not service:
             print("Error: Especifique el servicio a ejecutar.")
-            print("Opciones: api, camera, worker, beat")
+            print("Opciones: api, camera, worker, beat, migrate_db, pipeline")
             sys.exit(1)
 
         command = [sys.executable]
@@ -79,15 +110,22 @@ if __name__ == '__main__':
         elif service == 'camera':
             fix_paths()
             run_camera_service()
+        elif service == 'migrate_db':
+            fix_paths()
+            run_migrate_db()
+        elif service == 'pipeline':
+            fix_paths()
+            run_pipeline_service()
         elif service == 'worker':
-            if len(sys.argv) < 4:
-                print("Uso: python run.py worker <nombre_cola> <concurrencia>")
+            if len(sys.argv) < 3:
+                print("Uso: python run.py worker <nombre_cola> [concurrencia] [pool]")
+                print("Sin concurrencia ni pool se usa el perfil de la cola (ver worker_profiles.py).")
                 sys.exit(1)
 
             if getattr(sys, 'frozen', False):
-                command = [sys.executable, 'worker_entry', sys.argv[2], sys.argv[3]]
+                command = [sys.executable, 'worker_entry'] + sys.argv[2:5]
             else:
-                command = [sys.executable, __file__, 'worker_entry', sys.argv[2], sys.argv[3]]
+                command = [sys.executable, __file__, 'worker_entry'] + sys.argv[2:5]
 
             subprocess.run(command)
 
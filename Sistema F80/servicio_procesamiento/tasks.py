@@ -1,14 +1,20 @@
 import requests
-import base64
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from requests.adapters import HTTPAdapter
 from celery import signals
 from celery_app import celery_app
 from pyinstaller_utils import resource_path
+import admission
+import blob_store
+from metrics import get_recorder, mark, new_trace
 from workers.inference import perform_inference
 import time
 config_file = resource_path("configs/camera_config.json")
 config = None
+HTTP_SESSION = None
+POLL_EXECUTOR = None
 
 @signals.beat_init.connect
 def on_beat_init(sender, **kwargs):
@@ -63,26 +69,89 @@ def initialize_cameras():
     except Exception as e:
         print(f"Ocurrio un error inicializando camaras: {e}")
 
+def get_poll_resources():
+    """
+    Crea una sola vez la sesion HTTP (con conexiones persistentes) y el pool de hilos
+    que se usan para pedir los frames a todas las camaras al mismo tiempo.
+    """
+    global HTTP_SESSION, POLL_EXECUTOR
+    n_cameras = max(1, len(config["camera_list"]))
+    if HTTP_SESSION is None:
+        HTTP_SESSION = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=n_cameras)
+        HTTP_SESSION.mount("http://", adapter)
+        HTTP_SESSION.mount("https://", adapter)
+    if POLL_EXECUTOR is None:
+        POLL_EXECUTOR = ThreadPoolExecutor(max_workers=n_cameras, thread_name_prefix="poll")
+    return HTTP_SESSION, POLL_EXECUTOR
+
+def fetch_frame(session, camera_service_url, cam_id, timeout):
+    return session.get(f"{camera_service_url}/get_frame/{cam_id}", timeout=timeout)
+
 @celery_app.task
 def request_cameras():
-
+    """
+    Pide el ultimo frame de las camaras en paralelo y despacha la inferencia de cada una
+    en cuanto llega su respuesta. El ciclo completo tiene un limite de `poll_deadline`
+    segundos; las camaras que no respondan a tiempo se omiten. Solo se piden frames de
+    las camaras que admite el control de admision (ver admission): si la cola de
+    inferencia esta llena o la camara sigue procesando su frame anterior, se espera al
+    siguiente ciclo y se toma el frame mas reciente.
+    """
     CAMERA_SERVICE_URL = config["url"]
     CAMERAS_dict = config["camera_list"]
+    timeout = config.get("poll_timeout", 2.0)
+    deadline = config.get("poll_deadline", timeout + 0.5)
 
     print("Haciendo request de las camaras")
+    session, executor = get_poll_resources()
+    recorder = get_recorder()
+    futures = {}
     for camera in CAMERAS_dict:
-        #print(camera)
         cam_id = camera["camara_id"]
-        sim = camera["simulation"]
-        try:
-            frame_response = requests.get(f"{CAMERA_SERVICE_URL}/get_frame/{cam_id}", timeout=2)
-            if frame_response.status_code == 200:
-                image_bytes = frame_response.content
-                base64_image = base64.b64encode(image_bytes).decode("utf-8")
-                capture_time = frame_response.headers.get("capture-time")
-                perform_inference.delay(cam_id, base64_image, sim, capture_time)
-        except requests.exceptions.RequestException as e:
-            print(f"Error polling camera {cam_id}: {e}")
-
-
-
+        admitted, reason = admission.admit(cam_id)
+        if not admitted:
+            print(f"Frame de la camara {cam_id} omitido ({reason})")
+            recorder.count_dropped(cam_id, reason)
+            continue
+        futures[executor.submit(fetch_frame, session, CAMERA_SERVICE_URL, cam_id, timeout)] = camera
+    dispatched = set()
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            camera = futures[future]
+            cam_id = camera["camara_id"]
+            sim = camera["simulation"]
+            try:
+                frame_response = future.result()
+                if frame_response.status_code == 200:
+                    capture_time = frame_response.headers.get("capture-time")
+                    trace = new_trace(capture_time)
+                    if admission.is_stale(trace.get("capture")):
+                        recorder.count_dropped(cam_id, "expired")
+                        continue
+                    image_ref = blob_store.put(frame_response.content)
+                    mark(trace, "dispatch")
+                    perform_inference.apply_async(
+                        (cam_id, image_ref, sim, capture_time, trace),
+                        expires=admission.expires(trace.get("capture")),
+                    )
+                    dispatched.add(future)
+                    recorder.observe_trace(
+                        cam_id, trace, stages=("capture_to_dispatch",),
+                        extra={"poll_fetch": frame_response.elapsed.total_seconds()},
+                    )
+            except requests.exceptions.RequestException as e:
+                print(f"Error polling camera {cam_id}: {e}")
+            except Exception as e:
+                # Un error de Redis o del broker con una camara no debe saltarse a las demas.
+                print(f"Error despachando el frame de la camara {cam_id}: {e}")
+    except FuturesTimeoutError:
+        pending = [futures[f]["camara_id"] for f in futures if not f.done()]
+        for f in futures:
+            f.cancel()
+        print(f"Ciclo de polling excedio {deadline}s, sin respuesta de: {pending}")
+    finally:
+        # Las camaras admitidas que no llegaron a despachar liberan su lugar.
+        for future, camera in futures.items():
+            if future not in dispatched:
+                admission.release(camera["camara_id"])
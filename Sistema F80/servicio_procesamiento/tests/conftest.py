@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los modulos del servicio se importan como en run.py, desde servicio_procesamiento.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+
+from workers.dedup import grouped_nms, seam_deduplicate
+
+CONF = 0.25
+NMS_THRESHOLD = 0.3
+TILE_NMS_IOU = 0.7
+
+
+def _xywh(boxes):
+    xywh = np.asarray(boxes, dtype=np.float64).copy()
+    xywh[:, 2:] -= xywh[:, :2]
+    return xywh
+
+
+def _nms(boxes, scores, iou):
+    idx = cv2.dnn.NMSBoxes(_xywh(boxes).tolist(), list(map(float, scores)), CONF, iou)
+    return np.asarray(idx, dtype=np.int64).flatten()
+
+
+def _tile_nms(tiles):
+    """NMS del modelo dentro de cada recorte; regresa las detecciones de todos juntos."""
+    boxes, scores = [], []
+    for tile_boxes, tile_scores in tiles:
+        keep = _nms(tile_boxes, tile_scores, TILE_NMS_IOU)
+        boxes.extend(np.asarray(tile_boxes)[keep])
+        scores.extend(np.asarray(tile_scores)[keep])
+    return np.asarray(boxes, dtype=np.float64), np.asarray(scores, dtype=np.float32)
+
+
+def test_seam_boxes_match_tile_then_global_nms():
+    # Tres cajas en la franja de traslape x=[512, 640) entre dos recortes de 640 px.
+    # Scores C > B > A; IoU(C, B) = 0.33, IoU(B, A) = 0.8, IoU(C, A) = 0.17.
+    c = [580, 100, 640, 120]
+    b = [520, 100, 620, 120]
+    a = [520, 100, 600, 120]
+    tile_0 = ([c, b, a], [0.9, 0.8, 0.7])
+    # El recorte vecino ve las mismas particulas con un poco de ruido.
+    tile_1 = ([[581, 100, 640, 121], [521, 101, 620, 120], [520, 100, 601, 120]], [0.88, 0.79, 0.69])
+    boxes, scores = _tile_nms([tile_0, tile_1])
+
+    expected = boxes[_nms(boxes, scores, NMS_THRESHOLD)]
+    got = boxes[seam_deduplicate(boxes, scores, CONF, NMS_THRESHOLD)]
+
+    np.testing.assert_array_equal(got, expected)
+    # Solo sobrevive C: B lo suprime C y A lo suprime B dentro del recorte.
+    np.testing.assert_array_equal(got, [c])
+
+
+def test_grouped_nms_matches_global_nms():
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(0, 400, size=(60, 2))
+    # Varias copias ruidosas de cada particula, como las que dejan los recortes traslapados.
+    centers = np.repeat(centers, 3, axis=0) + rng.normal(0, 2, size=(180, 2))
+    half = rng.uniform(3, 12, size=(180, 2))
+    boxes = np.concatenate([centers - half, centers + half], axis=1)
+    scores = rng.uniform(0.1, 1.0, size=180).astype(np.float32)
+
+    expected = _nms(boxes, scores, NMS_THRESHOLD)
+    got = grouped_nms(_xywh(boxes), scores, CONF, NMS_THRESHOLD)
+
+    np.testing.assert_array_equal(got, expected)
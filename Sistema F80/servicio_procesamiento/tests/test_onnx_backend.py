@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+from onnx import TensorProto, helper, numpy_helper
+
+from workers.onnx_backend import STRIDES, OnnxSegmentationEngine
+
+IMGSZ = 64
+N_CLASSES = 1
+N_MASKS = 32
+
+
+def _dynamic_seg_model(path):
+    """
+    Modelo con las salidas de un YOLO-seg exportado con `dynamic=True`: lote, anclas y
+    tamano de los prototipos simbolicos. Los pesos son cero, asi que no detecta nada.
+    """
+    channels = 4 + N_CLASSES + N_MASKS
+    nodes, initializers, heads = [], [], []
+    for stride in STRIDES:
+        weight = numpy_helper.from_array(np.zeros((channels, 3, stride, stride), np.float32), f"w{stride}")
+        initializers.append(weight)
+        nodes.append(helper.make_node("Conv", ["images", f"w{stride}"], [f"c{stride}"], strides=[stride, stride]))
+        nodes.append(helper.make_node("Reshape", [f"c{stride}", "head_shape"], [f"h{stride}"]))
+        heads.append(f"h{stride}")
+    initializers.append(numpy_helper.from_array(np.array([0, channels, -1], np.int64), "head_shape"))
+    nodes.append(helper.make_node("Concat", heads, ["output0"], axis=2))
+    initializers.append(numpy_helper.from_array(np.zeros((N_MASKS, 3, 4, 4), np.float32), "wp"))
+    nodes.append(helper.make_node("Conv", ["images", "wp"], ["output1"], strides=[4, 4]))
+
+    graph = helper.make_graph(
+        nodes, "seg",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, "height", "width"])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", channels, "anchors"]),
+         helper.make_tensor_value_info("output1", TensorProto.FLOAT, ["batch", N_MASKS, "mask_h", "mask_w"])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def test_dynamic_axes_model(tmp_path):
+    path = str(tmp_path / "seg_dynamic.onnx")
+    _dynamic_seg_model(path)
+
+    engine = OnnxSegmentationEngine(path, imgsz=IMGSZ, max_batch=4)
+
+    assert engine.dynamic_batch
+    assert engine.output_shapes == [(4 + N_CLASSES + N_MASKS, 64 + 16 + 4), (N_MASKS, 16, 16)]
+    assert engine.n_classes == N_CLASSES
+    tiles = [np.zeros((IMGSZ, IMGSZ, 3), np.uint8) for _ in range(6)]
+    assert engine.predict(tiles) == [None] * 6
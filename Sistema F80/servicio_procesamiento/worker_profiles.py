@@ -0,0 +1,84 @@
+"""
+Perfiles de los workers de Celery por cola.
+
+Las colas de camaras y de base de datos esperan casi todo el tiempo por red (HTTP,
+Redis, PostgreSQL) y usan el pool de gevent con muchos greenlets. La inferencia (OpenCV
++ ONNX) y el calculo de la PSD son trabajo de CPU: con gevent todo corre en un solo
+nucleo y un frame bloquea a los demas greenlets, asi que usan un pool de procesos del
+tamano de los nucleos, con los hilos de ONNX/OpenCV/BLAS de cada proceso limitados para
+no sobresuscribir el CPU. Windows no soporta el pool prefork de Celery; ahi se usa el
+pool de hilos. Los hilos de un proceso comparten un solo modelo con `predict`
+serializado (ver workers.inference.MODEL_LOCK), asi que el pool de hilos usa pocas
+tareas concurrentes, que solo traslapan el pre/post-procesamiento, y le deja todos los
+nucleos a los hilos internos de onnxruntime/OpenCV.
+
+Este modulo no importa Celery ni gevent: run.py lo consulta antes de decidir si aplica
+el monkey-patch de gevent.
+"""
+import os
+import sys
+
+CPU_COUNT = os.cpu_count() or 1
+
+# cola -> (pool, concurrencia por defecto; None = numero de nucleos)
+WORKER_PROFILES = {
+    "camaras_queue": ("gevent", 4),
+    "inference_queue": ("prefork", None),
+    "processing_queue": ("prefork", 2),
+    "database_queue": ("gevent", 20),
+}
+DEFAULT_PROFILE = ("gevent", 4)
+# Concurrencia por defecto del pool de hilos: el modelo compartido corre un lote a la vez.
+THREADS_CONCURRENCY = 2
+CPU_POOLS = ("prefork", "threads", "solo")
+# Variables de entorno que limitan los hilos de las librerias numericas de cada proceso.
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "F80_ORT_INTRA_OP_THREADS", "F80_CV_THREADS")
+# Pool elegido por run.py, para que los modulos de los workers sepan como corren.
+POOL_ENV_VAR = "F80_WORKER_POOL"
+
+
+def native_pool(pool):
+    """El pool prefork no existe en Windows; ahi se cambia por el de hilos."""
+    if pool == "prefork" and sys.platform == "win32":
+        return "threads"
+    return pool
+
+
+def worker_profile(queues, concurrency=None, pool=None):
+    """
+    Regresa (pool, concurrencia, hilos por tarea) para un worker que consume `queues`
+    (nombres separados por comas). Si alguna cola es de CPU el worker usa el perfil de
+    CPU; `concurrency` y `pool` explicitos tienen prioridad sobre el perfil.
+    """
+    profiles = [WORKER_PROFILES.get(q.strip(), DEFAULT_PROFILE) for q in queues.split(",") if q.strip()]
+    profile_pool, profile_concurrency = next(
+        (p for p in profiles if p[0] in CPU_POOLS), profiles[0] if profiles else DEFAULT_PROFILE
+    )
+    pool = native_pool(pool or profile_pool)
+    if pool == "threads":
+        concurrency = int(concurrency or THREADS_CONCURRENCY)
+    else:
+        concurrency = int(concurrency or profile_concurrency or CPU_COUNT)
+    if pool == "solo":
+        concurrency = 1
+    if pool == "prefork":
+        # Un modelo por proceso: los nucleos se reparten entre los procesos.
+        threads = max(1, CPU_COUNT // concurrency)
+    elif pool in CPU_POOLS:
+        # Un solo modelo compartido por el proceso: sus hilos internos usan todos los nucleos.
+        threads = CPU_COUNT
+    else:
+        threads = None
+    return pool, concurrency, threads
+
+
+def apply_thread_limits(threads):
+    """
+    Limita los hilos de OpenMP/BLAS, onnxruntime (ver workers.inference.load_model) y
+    OpenCV de cada proceso. Se llama antes de importar numpy/onnxruntime; los valores ya
+    definidos en el entorno tienen prioridad.
+    """
+    if not threads:
+        return
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
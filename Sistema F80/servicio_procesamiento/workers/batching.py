@@ -0,0 +1,80 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class InferenceBatcher:
+    """
+    Agrupa los recortes (slices) de frames de varias camaras en un solo lote
+    para el modelo.
+
+    Cada task de inferencia entrega sus recortes con `submit()` y se queda
+    esperando su parte del resultado. Un hilo despachador junta las solicitudes
+    que llegan dentro de una ventana corta (`max_wait_ms`) o hasta completar
+    `max_batch_size` recortes, ejecuta una sola pasada del modelo y regresa a
+    cada camara los resultados de sus propios recortes, en el mismo orden.
+
+    Solo sirve cuando varias tasks corren a la vez en el mismo proceso (pools de
+    hilos o gevent, o el modo pipeline). En el pool prefork cada proceso corre una
+    task a la vez, asi que nunca se forma un lote entre camaras y solo se agregaria
+    la espera de `max_wait_ms`; ahi no se usa (ver workers.inference.load_resources).
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=50):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms) / 1000.0)
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, slices):
+        """Encola los recortes de un frame y regresa un Future con sus resultados."""
+        future = Future()
+        if not slices:
+            future.set_result([])
+            return future
+        self._pending.put((list(slices), future))
+        return future
+
+    def predict(self, slices):
+        """Version bloqueante de `submit()`."""
+        return self.submit(slices).result()
+
+    def _collect(self):
+        first = self._pending.get()
+        batch = [first]
+        n_slices = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n_slices < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_slices += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            all_slices = []
+            for slices, _ in batch:
+                all_slices.extend(slices)
+            try:
+                results = list(self.predict_fn(all_slices))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for slices, future in batch:
+                end = start + len(slices)
+                future.set_result(results[start:end])
+                start = end
+            print(f"Lote de inferencia: {len(batch)} frames, {len(all_slices)} recortes.")
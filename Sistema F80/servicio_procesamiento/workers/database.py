@@ -1,16 +1,30 @@
 import json
-import psycopg2
-import base64
+from datetime import date
+from celery import signals
 from celery_app import celery_app
-from pathlib import Path
-import cv2
-import numpy as np
 from pyinstaller_utils import resource_path
+import blob_store
+import redis
+from latest_cache import LatestResultCache
+from metrics import PendingTraces, get_recorder, mark
+from db_schema import ensure_partitions
+from result_events import ResultPublisher, make_thumbnail
+from .db_writer import result_row, writer_from_config
+from .image_archive import ImageArchive
 CONFIG = None
+WRITER = None
+ARCHIVE = None
+LATEST_CACHE = None
+PUBLISHER = None
+PENDING_TRACES = None
+PARTITIONS_MONTH = None
 
 def load_resources():
-    """Carga la configuración desde el JSON."""
-    global CONFIG
+    """
+    Carga la configuración desde el JSON y crea el escritor de resultados y el archivo
+    de imagenes del proceso.
+    """
+    global CONFIG, WRITER, ARCHIVE, LATEST_CACHE, PUBLISHER, PENDING_TRACES
     if CONFIG is None:
         try:
             config_path = resource_path("configs/db_config.json")
@@ -20,92 +34,105 @@ def load_resources():
         except Exception as e:
             print(f"Error cargando el config de la base de datos: {e}")
             CONFIG = {}
+    if LATEST_CACHE is None:
+        # El cliente se conecta en el primer uso; si Redis no esta, la actualizacion y la
+        # publicacion fallan despues del commit sin afectar el guardado.
+        client = redis.Redis(host='localhost', port=6379, db=0)
+        LATEST_CACHE = LatestResultCache(client)
+        PUBLISHER = ResultPublisher(client)
+        PENDING_TRACES = PendingTraces(get_recorder())
+    if WRITER is None and CONFIG:
+        try:
+            WRITER = writer_from_config(
+                CONFIG, on_commit=[LATEST_CACHE.update, PUBLISHER.publish, PENDING_TRACES.on_commit]
+            )
+            print("Pool de conexiones a PostgreSQL creado.")
+        except Exception as e:
+            print(f"Error creando el pool de conexiones a PostgreSQL: {e}")
+            WRITER = None
+    if ARCHIVE is None and CONFIG:
+        try:
+            ARCHIVE = ImageArchive(CONFIG.get("imgs_route"), **CONFIG.get("archive", {}))
+        except Exception as e:
+            print(f"Error preparando el archivo de imagenes: {e}")
+            ARCHIVE = None
+    if WRITER is not None:
+        maybe_ensure_partitions()
+
+def maybe_ensure_partitions():
+    """
+    Una vez al mes por proceso, crea las particiones de `results` de los meses siguientes
+    para que los resultados nunca caigan en la particion por defecto.
+    """
+    global PARTITIONS_MONTH
+    month = date.today().replace(day=1)
+    if PARTITIONS_MONTH == month:
+        return
+    PARTITIONS_MONTH = month
+    try:
+        conn = WRITER.pool.getconn()
+    except Exception as e:
+        print(f"No se pudieron crear las particiones de results: {e}")
+        return
+    try:
+        ensure_partitions(conn, CONFIG.get("schema", {}).get("months_ahead", 2))
+    except Exception as e:
+        conn.rollback()
+        print(f"No se pudieron crear las particiones de results (¿falta 'run.py migrate_db'?): {e}")
+    finally:
+        WRITER.pool.putconn(conn)
+
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def _close_writer(**kwargs):
+    # Escribe las imagenes y resultados que sigan pendientes antes de que termine el worker.
+    global WRITER, ARCHIVE
+    if ARCHIVE is not None:
+        ARCHIVE.close()
+        ARCHIVE = None
+    if WRITER is not None:
+        WRITER.close()
+        print(f"Escritor de resultados cerrado: {WRITER.stats()}")
+        WRITER = None
+
+def persist_result(results, og_image_bytes, inference_bytes, trace=None, pending=None):
+    """
+    Etapa de guardado: encola las imagenes en el archivo y la fila en el escritor de
+    resultados. Con `trace` se registran las metricas del frame al hacer commit, en
+    `pending` (un metrics.PendingTraces registrado en el escritor) o por defecto en las
+    de Redis. La usan save_to_db y el modo pipeline de run.py.
+    """
+    og_path, seg_path = ARCHIVE.save(results.get("cam_id"), results.get("capture_time"), og_image_bytes, inference_bytes)
+    events_config = CONFIG.get("events", {})
+    if events_config.get("thumbnails", False):
+        PUBLISHER.attach_thumbnail(og_path, make_thumbnail(inference_bytes, events_config.get("thumbnail_scale", 4)))
+
+    if trace is not None:
+        (pending or PENDING_TRACES).add(og_path, results.get("cam_id"), trace)
+    WRITER.write(result_row(results, str(og_path), str(seg_path)))
 
 @celery_app.task(name="workers.database.save_to_db")
 def save_to_db(results):
     """
-        Se conecta a la DB y guarda los resultados que recibe como argumento
+        Encola las imagenes en el archivo (se escriben tal cual, sin recodificar) y deja la
+        fila del resultado en el buffer del escritor, que la inserta en la DB junto con las
+        demas en el siguiente lote (ver workers.db_writer y workers.image_archive).
     """
 
+    trace = mark(results.get("trace") or {}, "db_start")
     load_resources()
     if not CONFIG:
         return {"error": "Modulo de base de datos no configurado."}
+    if WRITER is None or ARCHIVE is None:
+        return {"status": "Database save attempt failed."}
     
-    og_image_bytes = base64.b64decode(results["img_original"])
-    inference_bytes = base64.b64decode(results["img_result"])
-    frame = cv2.imdecode(np.frombuffer(og_image_bytes, np.uint8), cv2.IMREAD_COLOR)
-    frame_segmented = cv2.imdecode(np.frombuffer(inference_bytes, np.uint8), cv2.IMREAD_COLOR)
-    capture_time_safe = results.get("capture_time", "unknown_time").replace(":", "-").replace("+", "_")
-    filename_seg = f"img_{capture_time_safe}_camera_{results.get('cam_id')}_segmented.jpeg"
-    filename_og = f"img_{capture_time_safe}_camera_{results.get('cam_id')}_original.jpeg"
-    directorio = Path(CONFIG.get("imgs_route"))
-    s_seg = cv2.imwrite(directorio / filename_seg, frame_segmented)
-    s_og = cv2.imwrite(directorio / filename_og, frame)
-    if s_seg and s_og:
-        print("Se guardaron las imagenes correctamente.")
-
-    fs_values = results.get("Fs", [])
-    Fs_formateado = {
-        "f10": fs_values[0] if len(fs_values) > 0 else None,
-        "f20": fs_values[1] if len(fs_values) > 1 else None,
-        "f30": fs_values[2] if len(fs_values) > 2 else None,
-        "f40": fs_values[3] if len(fs_values) > 3 else None,
-        "f50": fs_values[4] if len(fs_values) > 4 else None,
-        "f60": fs_values[5] if len(fs_values) > 5 else None,
-        "f70": fs_values[6] if len(fs_values) > 6 else None,
-        "f80": fs_values[7] if len(fs_values) > 7 else None,
-        "f90": fs_values[8] if len(fs_values) > 8 else None,
-        "f100": fs_values[9] if len(fs_values) > 9 else None,
-    }
-
-    fs_ajst_values = results.get("Fs_ajust", [])
-    Fs_ajst_formateado = {
-        "f10": fs_ajst_values[0] if len(fs_ajst_values) > 0 else None,
-        "f20": fs_ajst_values[1] if len(fs_ajst_values) > 1 else None,
-        "f30": fs_ajst_values[2] if len(fs_ajst_values) > 2 else None,
-        "f40": fs_ajst_values[3] if len(fs_ajst_values) > 3 else None,
-        "f50": fs_ajst_values[4] if len(fs_ajst_values) > 4 else None,
-        "f60": fs_ajst_values[5] if len(fs_ajst_values) > 5 else None,
-        "f70": fs_ajst_values[6] if len(fs_ajst_values) > 6 else None,
-        "f80": fs_ajst_values[7] if len(fs_ajst_values) > 7 else None,
-        "f90": fs_ajst_values[8] if len(fs_ajst_values) > 8 else None,
-        "f100": fs_ajst_values[9] if len(fs_ajst_values) > 9 else None,
-    }
-    conn = None
     try:
-        db_keys = ["host", "port", "database", "user", "password"]
-        db_connection_params = {key: CONFIG[key] for key in db_keys if key in CONFIG}
-        conn = psycopg2.connect(**db_connection_params)
-        cur = conn.cursor()
-        sql = """
-            INSERT INTO results (
-                timestamp, camera_id, f10, f20, f30, f40, f50, f60, f70, f80, f90, f100, f10_ajst, f20_ajst, f30_ajst, f40_ajst,
-                f50_ajst, f60_ajst, f70_ajst, f80_ajst, f90_ajst, f100_ajst, simulation, og_img_path, seg_img_path
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """
-        data_to_insert = (
-            results.get("capture_time"),
-            results.get("cam_id"),
-            *list(Fs_formateado.values()),
-            *list(Fs_ajst_formateado.values()),
-            results["sim"],
-            str(directorio / filename_og),
-            str(directorio / filename_seg)
-        )
-        #print(data_to_insert)
-        cur.execute(sql, data_to_insert)
-        conn.commit()
-        cur.close()
-        print(f"Resultado guardado en la base de datos para la camara: {results.get('cam_id')}")
-
-    except Exception as error:
-        print(f"Error conectando o guardando en PostgreSQL: {error}")
-        if conn is not None:
-            conn.close()
+        og_image_bytes = blob_store.get(results["img_original"])
+        inference_bytes = blob_store.get(results["img_result"])
+    except KeyError as e:
+        print(f"No se pudieron leer las imagenes del resultado: {e}")
         return {"status": "Database save attempt failed."}
-    finally:
-        if conn is not None:
-            conn.close()
-
-    return {"status": "Database save attempt complete."}
-
+    get_recorder().observe_trace(results.get("cam_id"), trace, stages=("database_queue_wait",))
+    persist_result(results, og_image_bytes, inference_bytes, trace)
+    print(f"Resultado en cola para la base de datos de la camara: {results.get('cam_id')}")
+    return {"status": "Database save attempt queued."}
@@ -0,0 +1,239 @@
+"""
+Escritor de resultados a PostgreSQL con pool de conexiones y escritura por lotes.
+
+`save_to_db` solo arma la fila y la deja en el buffer del escritor; un hilo de fondo
+la inserta junto con las demas en un INSERT de varias filas cuando el buffer llega a
+`batch_size` filas o pasan `flush_interval` segundos. Las conexiones se toman de un
+pool por proceso del worker en lugar de abrir una conexion por resultado.
+
+Despues de cada commit se llama a los `on_commit` con las filas insertadas tal como
+quedaron en la tabla (INSERT ... RETURNING *), por ejemplo para actualizar el cache
+de ultimos resultados.
+"""
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor, execute_values
+
+from db_pool import connection_params
+
+RESULT_COLUMNS = (
+    "timestamp", "camera_id",
+    "f10", "f20", "f30", "f40", "f50", "f60", "f70", "f80", "f90", "f100",
+    "f10_ajst", "f20_ajst", "f30_ajst", "f40_ajst", "f50_ajst",
+    "f60_ajst", "f70_ajst", "f80_ajst", "f90_ajst", "f100_ajst",
+    "simulation", "og_img_path", "seg_img_path",
+)
+# Errores de conexion o del servidor: el lote completo se puede reintentar mas tarde.
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, pg_pool.PoolError)
+
+
+def _padded(values, n=10):
+    values = list(values or [])[:n]
+    return values + [None] * (n - len(values))
+
+
+def result_row(results, og_img_path, seg_img_path):
+    """Fila de la tabla results (en el orden de RESULT_COLUMNS) a partir de un resultado."""
+    return (
+        results.get("capture_time"),
+        results.get("cam_id"),
+        *_padded(results.get("Fs")),
+        *_padded(results.get("Fs_ajust")),
+        results["sim"],
+        og_img_path,
+        seg_img_path,
+    )
+
+
+class ResultWriter:
+    """
+    Buffer de filas con un hilo que las inserta por lotes.
+
+    Un lote que falla se reintenta hasta `max_retries` veces con espera creciente,
+    descartando la conexion usada (puede haber quedado rota). Si sigue fallando, el lote
+    se parte a la mitad hasta aislar las filas que el servidor rechaza, que se descartan;
+    asi una fila mala no bloquea a las demas. Si el error es de conexion, las filas
+    regresan al buffer para el siguiente flush mientras quepan en `max_buffer`. Las filas
+    descartadas se cuentan en `stats()["rows_dropped"]`.
+    """
+
+    def __init__(self, db_params, table="results", batch_size=50, flush_interval=1.0,
+                 pool_min=1, pool_max=4, max_retries=3, retry_delay=0.5, max_buffer=5000,
+                 stats_interval=60.0, on_commit=()):
+        self.table = table
+        self.on_commit = list(on_commit)
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.max_retries = int(max_retries)
+        self.retry_delay = float(retry_delay)
+        self.max_buffer = int(max_buffer)
+        self.stats_interval = float(stats_interval)
+        self.pool = pg_pool.ThreadedConnectionPool(int(pool_min), int(pool_max), **db_params)
+        self.sql = f"INSERT INTO {table} ({', '.join(RESULT_COLUMNS)}) VALUES %s RETURNING *"
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches = 0
+        self.failed_attempts = 0
+        self.flush_seconds = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._started = time.monotonic()
+
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        """Agrega una fila al buffer; despierta al hilo si ya se junto un lote completo."""
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.popleft()
+                self.rows_dropped += 1
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        return len(self._buffer)
+
+    def _run(self):
+        last_stats = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                print(f"Escritor de resultados: {self.stats()}")
+
+    def _take(self):
+        with self._lock:
+            rows = list(self._buffer)
+            self._buffer.clear()
+        return rows
+
+    def _requeue(self, rows):
+        with self._lock:
+            room = max(self.max_buffer - len(self._buffer), 0)
+            keep = rows[len(rows) - room:] if room < len(rows) else rows
+            self.rows_dropped += len(rows) - len(keep)
+            self._buffer.extendleft(reversed(keep))
+
+    def _insert(self, rows):
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                inserted = execute_values(cur, self.sql, rows, page_size=self.batch_size, fetch=True)
+            conn.commit()
+            return inserted
+        except Exception:
+            broken = True
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken)
+
+    def _salvage(self, rows):
+        """
+        Inserta un lote que sigue fallando partiendolo a la mitad hasta aislar las filas
+        rechazadas, que se descartan. Si hay un error de conexion, las filas que faltan
+        regresan al buffer. Regresa las filas insertadas.
+        """
+        inserted = []
+        chunks = [rows]
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                inserted.extend(self._insert(chunk))
+            except CONNECTION_ERRORS as e:
+                remaining = chunk + [row for rest in reversed(chunks) for row in rest]
+                print(f"Error de conexion guardando resultados, {len(remaining)} filas regresan al buffer: {e}")
+                self._requeue(remaining)
+                break
+            except Exception as e:
+                if len(chunk) == 1:
+                    with self._lock:
+                        self.rows_dropped += 1
+                    print(f"Resultado de la camara {chunk[0][1]} ({chunk[0][0]}) descartado: {e}")
+                    continue
+                middle = len(chunk) // 2
+                chunks.append(chunk[middle:])
+                chunks.append(chunk[:middle])
+        return inserted
+
+    def flush(self):
+        """Inserta todo lo que hay en el buffer. Regresa el numero de filas escritas."""
+        with self._flush_lock:
+            rows = self._take()
+            if not rows:
+                return 0
+            start = time.perf_counter()
+            for attempt in range(self.max_retries + 1):
+                try:
+                    inserted = self._insert(rows)
+                    break
+                except Exception as e:
+                    self.failed_attempts += 1
+                    print(f"Error guardando lote de {len(rows)} resultados (intento {attempt + 1}): {e}")
+                    if attempt == self.max_retries or self._stop.is_set():
+                        inserted = self._salvage(rows)
+                        break
+                    time.sleep(self.retry_delay * 2 ** attempt)
+            if not inserted:
+                return 0
+            elapsed = time.perf_counter() - start
+            self.rows_written += len(inserted)
+            self.batches += 1
+            self.flush_seconds += elapsed
+            self.last_flush_ms = elapsed * 1000
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        for callback in self.on_commit:
+            try:
+                callback(inserted)
+            except Exception as e:
+                print(f"Error en {getattr(callback, '__qualname__', callback)} despues del commit: {e}")
+        return len(inserted)
+
+    def stats(self):
+        """Metricas del escritor: filas, lotes, latencia de flush y filas por segundo."""
+        uptime = time.monotonic() - self._started
+        return {
+            "rows_written": self.rows_written,
+            "rows_pending": self.pending(),
+            "rows_dropped": self.rows_dropped,
+            "batches": self.batches,
+            "failed_attempts": self.failed_attempts,
+            "avg_flush_ms": round(self.flush_seconds * 1000 / self.batches, 2) if self.batches else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "rows_per_s": round(self.rows_written / uptime, 2) if uptime > 0 else 0.0,
+            "insert_rows_per_s": round(self.rows_written / self.flush_seconds, 1) if self.flush_seconds else 0.0,
+        }
+
+    def close(self):
+        """Detiene el hilo, escribe lo pendiente y cierra las conexiones del pool."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self.pool.closeall()
+
+
+def writer_from_config(config, on_commit=()):
+    """Crea el ResultWriter con la conexion de db_config.json y su seccion "writer"."""
+    return ResultWriter(connection_params(config), on_commit=on_commit, **config.get("writer", {}))
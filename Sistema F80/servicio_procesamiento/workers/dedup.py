@@ -0,0 +1,111 @@
+"""
+De-duplicacion de detecciones de recortes traslapados.
+
+El resultado es exactamente el del NMS global de cv2.dnn.NMSBoxes sobre todas las cajas,
+pero sin comparar todas contra todas: un barrido ordenado por x encuentra solo los pares
+de cajas que se intersectan, y el NMS corre por separado en cada grupo de cajas unidas
+por un traslape mayor al umbral. Fuera de las franjas de traslape entre recortes casi
+todas las cajas quedan solas y se conservan sin compararse.
+"""
+import cv2
+import numpy as np
+
+
+def _intersecting_pairs(x1, y1, x2, y2):
+    """Pares (i, j) de cajas que se intersectan, con barrido ordenado por x1."""
+    n = len(x1)
+    order = np.argsort(x1, kind="stable")
+    xs = x1[order]
+    lo = np.arange(1, n + 1)
+    hi = np.searchsorted(xs, x2[order], side="left")
+    counts = np.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    p = np.repeat(np.arange(n), counts)
+    starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    q = np.arange(total) - np.repeat(starts, counts) + np.repeat(lo, counts)
+    i, j = order[p], order[q]
+    keep = (np.minimum(y2[i], y2[j]) > np.maximum(y1[i], y1[j]))
+    return i[keep], j[keep]
+
+
+def _components(n, i, j):
+    """Componentes conexas (union-find) del grafo con aristas (i, j)."""
+    parent = list(range(n))
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+    groups = {}
+    for a in range(n):
+        groups.setdefault(find(a), []).append(a)
+    return groups.values()
+
+
+def grouped_nms(boxes_xywh, scores, score_threshold, nms_threshold):
+    """
+    Mismo resultado que cv2.dnn.NMSBoxes, pero solo compara cajas conectadas por un
+    traslape mayor a `nms_threshold`. La supresion voraz solo se propaga por esas
+    conexiones, asi que correr NMS por componente da exactamente la seleccion global.
+    Regresa los indices conservados ordenados por score descendente.
+    """
+    boxes_xywh = np.asarray(boxes_xywh)
+    scores = np.asarray(scores, dtype=np.float32)
+    candidates = np.flatnonzero(scores > score_threshold)
+    if len(candidates) == 0:
+        return np.empty(0, np.int64)
+
+    b = boxes_xywh[candidates].astype(np.float64)
+    x1, y1 = b[:, 0], b[:, 1]
+    x2, y2 = x1 + b[:, 2], y1 + b[:, 3]
+    i, j = _intersecting_pairs(x1, y1, x2, y2)
+
+    inter = (np.minimum(x2[i], x2[j]) - np.maximum(x1[i], x1[j])) * (np.minimum(y2[i], y2[j]) - np.maximum(y1[i], y1[j]))
+    area = b[:, 2] * b[:, 3]
+    union = area[i] + area[j] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(union > 0, inter / union, 0.0)
+    # Mismo redondeo que OpenCV: 1.f - (float)jaccardDistance.
+    overlap = np.float32(1.0) - (1.0 - iou).astype(np.float32)
+    linked = overlap > np.float32(nms_threshold)
+    i, j = i[linked], j[linked]
+    # NMSBoxes considera traslape total entre dos cajas de area cero; se agrupan juntas.
+    empty = np.flatnonzero(area <= 0)
+    if len(empty) > 1:
+        i = np.concatenate([i, empty[:-1]])
+        j = np.concatenate([j, empty[1:]])
+
+    kept = []
+    for members in _components(len(candidates), i, j):
+        if len(members) == 1:
+            kept.append(members[0])
+            continue
+        members = np.asarray(members)
+        idx = cv2.dnn.NMSBoxes(b[members].tolist(), scores[candidates[members]].tolist(), score_threshold, nms_threshold)
+        if len(idx) > 0:
+            kept.extend(members[np.asarray(idx).flatten()].tolist())
+
+    kept = candidates[np.asarray(kept, dtype=np.int64)]
+    # Orden por score descendente, estable por indice como NMSBoxes.
+    kept.sort()
+    return kept[np.argsort(-scores[kept], kind="stable")]
+
+
+def seam_deduplicate(boxes, scores, score_threshold, nms_threshold):
+    """
+    De-duplica detecciones (x1, y1, x2, y2) de recortes traslapados con el mismo
+    resultado que un NMS global de cv2 (ver `grouped_nms`). Regresa los indices
+    conservados ordenados por score descendente.
+    """
+    xywh = np.asarray(boxes).copy()
+    xywh[:, 2:] -= xywh[:, :2]
+    return grouped_nms(xywh, scores, score_threshold, nms_threshold)
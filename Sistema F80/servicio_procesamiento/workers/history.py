@@ -0,0 +1,75 @@
+"""
+Historial por camara de las mediciones de elipses, guardado en una lista de Redis.
+
+Cada elemento es un frame: los ejes de sus elipses como arreglo float32 (n, 2) en
+binario. Agregar el frame, recortar la lista al tamano de la ventana y leer la ventana
+se hace en un solo script Lua, asi que es una sola ida y vuelta a Redis y dos workers
+que procesan la misma camara nunca ven una ventana a medio actualizar. MemoryHistory
+guarda la misma ventana en memoria para el modo pipeline de un solo proceso.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+HISTORY_DTYPE = np.dtype("<f4")
+
+_PUSH_AND_WINDOW = """
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+return redis.call('LRANGE', KEYS[1], 0, -1)
+"""
+
+
+def encode_axes(area_ar):
+    """Ejes de las elipses de un frame -> bytes float32 (n, 2)."""
+    return np.asarray(area_ar, dtype=HISTORY_DTYPE).reshape(-1, 2).tobytes()
+
+
+def decode_axes(item):
+    """Bytes de un elemento del historial -> arreglo float64 (n, 2) con los ejes."""
+    return np.frombuffer(item, dtype=HISTORY_DTYPE).reshape(-1, 2).astype(np.float64)
+
+
+class RedisHistory:
+    """
+    Ventana deslizante de los ultimos `window_size` frames de cada camara.
+    Las llaves son `history:f32:<camara>`; el formato JSON anterior usaba `history:<camara>`.
+    """
+
+    def __init__(self, client, window_size, prefix="history:f32:"):
+        self.client = client
+        self.window_size = int(window_size)
+        self.prefix = prefix
+        self._push_and_window = client.register_script(_PUSH_AND_WINDOW)
+
+    def key(self, camera_id):
+        return f"{self.prefix}{camera_id}"
+
+    def push_and_window(self, camera_id, area_ar):
+        """
+        Agrega las mediciones del frame y regresa la ventana resultante (elementos
+        crudos, el mas reciente primero). Puede tener menos de `window_size` frames
+        mientras se llena el historial.
+        """
+        return self._push_and_window(
+            keys=[self.key(camera_id)], args=[encode_axes(area_ar), self.window_size],
+        )
+
+
+class MemoryHistory:
+    """Misma ventana que RedisHistory, en memoria del proceso (modo pipeline de run.py)."""
+
+    def __init__(self, window_size):
+        self.window_size = int(window_size)
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def push_and_window(self, camera_id, area_ar):
+        item = encode_axes(area_ar)
+        with self._lock:
+            window = self._windows.get(camera_id)
+            if window is None:
+                window = self._windows[camera_id] = deque(maxlen=self.window_size)
+            window.appendleft(item)
+            return list(window)
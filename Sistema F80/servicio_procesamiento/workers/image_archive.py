@@ -0,0 +1,157 @@
+"""
+Archivo en disco de las imagenes original y segmentada de cada resultado.
+
+Los JPEG se guardan tal como llegan del almacen de blobs, sin decodificar ni volver a
+codificar, en `<imgs_route>/<camara>/<AAAA-MM-DD>/`. La ruta se calcula al momento (la
+necesita la fila de la DB) y la escritura la hace un hilo de fondo. Opcionalmente se
+borran las carpetas de dias con mas de `retention_days` dias y, si el archivo pasa de
+`max_gb`, las carpetas de los dias mas viejos.
+
+Varios procesos (o greenlets) escriben en la misma raiz, asi que el tamano del archivo
+se vuelve a medir en disco en cada purga en lugar de llevar la cuenta por proceso.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def _capture_day(capture_time):
+    try:
+        return datetime.fromisoformat(capture_time).date()
+    except (TypeError, ValueError):
+        return date.today()
+
+
+def _dir_size(path):
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+class ImageArchive:
+    """Escritura asincrona de imagenes ya codificadas, repartidas por camara y dia."""
+
+    def __init__(self, root, retention_days=0, max_gb=0, queue_size=256, purge_interval=600):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.retention_days = int(retention_days)
+        self.max_bytes = int(float(max_gb) * 1024 ** 3)
+        self.purge_interval = float(purge_interval)
+        self.files_written = 0
+        self.write_errors = 0
+        # (camara, dia) -> bytes en disco segun la ultima medicion (ver purge).
+        self._usage = {}
+        self._queue = queue.Queue(maxsize=int(queue_size))
+        self._thread = threading.Thread(target=self._run, name="image-archive", daemon=True)
+        self._thread.start()
+
+    def paths_for(self, camera_id, capture_time):
+        """Rutas (original, segmentada) del resultado; no toca el disco."""
+        day = _capture_day(capture_time).strftime(DAY_FORMAT)
+        safe_time = str(capture_time or "unknown_time").replace(":", "-").replace("+", "_")
+        directory = self.root / str(camera_id) / day
+        return (
+            directory / f"img_{safe_time}_camera_{camera_id}_original.jpeg",
+            directory / f"img_{safe_time}_camera_{camera_id}_segmented.jpeg",
+        )
+
+    def save(self, camera_id, capture_time, og_bytes, seg_bytes):
+        """
+        Encola las dos imagenes para escribirlas y regresa sus rutas. Si la cola esta
+        llena espera a que el hilo avance en lugar de descartar imagenes.
+        """
+        og_path, seg_path = self.paths_for(camera_id, capture_time)
+        self._queue.put((og_path, og_bytes))
+        self._queue.put((seg_path, seg_bytes))
+        return og_path, seg_path
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.files_written += 1
+
+    def _run(self):
+        last_purge = 0.0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.write_errors += 1
+                print(f"Error guardando la imagen {item[0]}: {e}")
+            finally:
+                self._queue.task_done()
+            if (self.retention_days or self.max_bytes) and time.monotonic() - last_purge > self.purge_interval:
+                last_purge = time.monotonic()
+                self.purge()
+
+    def _day_dirs(self):
+        """Carpetas (camara, dia, ruta) del archivo, de la mas vieja a la mas nueva."""
+        days = []
+        for cam_dir in self.root.iterdir():
+            if not cam_dir.is_dir():
+                continue
+            for day_dir in cam_dir.iterdir():
+                try:
+                    day = datetime.strptime(day_dir.name, DAY_FORMAT).date()
+                except ValueError:
+                    continue
+                days.append((day, cam_dir.name, day_dir))
+        days.sort()
+        return days
+
+    def _scan_usage(self, days):
+        self._usage = {}
+        for _, cam, day_dir in days:
+            try:
+                self._usage[(cam, day_dir.name)] = _dir_size(day_dir)
+            except FileNotFoundError:
+                # Otro proceso la acaba de borrar.
+                pass
+
+    def _remove_day(self, cam, day_dir):
+        shutil.rmtree(day_dir, ignore_errors=True)
+        self._usage.pop((cam, day_dir.name), None)
+        print(f"Archivo de imagenes: se elimino {day_dir}")
+
+    def purge(self):
+        """
+        Aplica la retencion por dias y el limite de tamano. Nunca borra el dia actual. El
+        tamano se mide en disco, con lo que escribieron todos los procesos.
+        """
+        today = date.today()
+        days = self._day_dirs()
+        remaining = []
+        for day, cam, day_dir in days:
+            if self.retention_days and day < today - timedelta(days=self.retention_days):
+                self._remove_day(cam, day_dir)
+            else:
+                remaining.append((day, cam, day_dir))
+        if self.max_bytes:
+            self._scan_usage(remaining)
+            total = sum(self._usage.values())
+            for day, cam, day_dir in remaining:
+                if total <= self.max_bytes or day >= today:
+                    break
+                total -= self._usage.get((cam, day_dir.name), 0)
+                self._remove_day(cam, day_dir)
+
+    def close(self):
+        """Escribe las imagenes pendientes y detiene el hilo."""
+        self._queue.put(None)
+        self._thread.join()
@@ -1,27 +1,47 @@
+from celery import signals
 from celery_app import celery_app
 from .process import process_granulometry
+from .batching import InferenceBatcher
+from .dedup import seam_deduplicate
+from .onnx_backend import OnnxSegmentationEngine
+from .preprocess import FramePreprocessor
+from .postprocess import (
+    tile_arrays_from_results, merge_tile_detections, select,
+    boxes_xywh, polygon_areas, ellipse_axes,
+)
 import cv2
 import numpy as np
-import onnx
-import onnxruntime
 from ultralytics import YOLO
 import json
 import pickle
 import traceback
-import base64
 import time
+import os
+import threading
+import socket
 from pyinstaller_utils import resource_path
+import admission
+import blob_store
+from metrics import ReadinessReporter, get_recorder, mark
+from worker_profiles import POOL_ENV_VAR
 
 CONFIG = None
 MODEL = None
+# Ni ultralytics ni el motor de ONNX son seguros entre hilos (ver _predict_slices).
+MODEL_LOCK = threading.Lock()
+BATCHER = None
+PREPROCESSOR = None
+READY = False
+READINESS = None
 
 
 def load_resources():
     """
     This function loads the model and config, but only if they haven't been loaded yet.
-    It will be called by the task.
+    It is called once at worker start-up (see `init_worker_resources`) and again by
+    the task as a fallback; every resource stays resident in the worker process.
     """
-    global MODEL, CONFIG
+    global MODEL, CONFIG, BATCHER
     
     # Load config only once
     if CONFIG is None:
@@ -37,56 +57,176 @@ def load_resources():
     if MODEL is None and CONFIG:
         print("--- Cargando modelo ---")
         try:
-            MODEL = YOLO(CONFIG["MODEL_PATH"], task="segment")
-            print("Modelo cargado exitosamente.")
+            MODEL = load_model(CONFIG)
+            print(f"Modelo cargado exitosamente (backend: {CONFIG.get('BACKEND', 'ultralytics')}).")
         except Exception as e:
             print(f"Error cargando el modelo: {e}")
             MODEL = None
-    if CONFIG["CALIBRATION_PATH"]:
+
+    if BATCHER is None and MODEL is not None and CONFIG.get("BATCH_ENABLED", False):
+        if os.environ.get(POOL_ENV_VAR) == "prefork":
+            # Cada proceso corre una task a la vez: no hay recortes de otras camaras que juntar.
+            print("Inferencia por lotes deshabilitada: el pool prefork corre una task por proceso.")
+            CONFIG["BATCH_ENABLED"] = False
+        else:
+            BATCHER = InferenceBatcher(
+                _predict_slices,
+                max_batch_size=CONFIG.get("BATCH_MAX_SIZE", 32),
+                max_wait_ms=CONFIG.get("BATCH_MAX_WAIT_MS", 50),
+            )
+            print("Inferencia por lotes entre camaras habilitada.")
+
+    # Load calibration only once
+    if CONFIG.get("CALIBRATION_PATH") and "mtx" not in CONFIG:
         with open(CONFIG["CALIBRATION_PATH"], "rb") as f:
             cal = pickle.load(f)
 
         CONFIG["mtx"] = cal["mtx"]
         CONFIG["dist"] = cal["dist"]
         CONFIG["newcameramtx"] = cal["newcameramtx"]
+        print("Se cargo la calibracion de la camara correctamente")
+
+    if PREPROCESSOR is None and "mtx" in CONFIG:
+        get_preprocessor(CONFIG)
+
 
+def warmup():
+    """
+    Corre una inferencia completa sobre WARMUP_IMG_PATH para que la primera imagen real
+    no pague la inicializacion perezosa del modelo (sesion, memoria, kernels).
+    """
+    global READY
+    load_resources()
+    if MODEL is None:
+        print("Warm-up omitido: el modelo no esta cargado.")
+        report_ready(False)
+        return False
+    start_time = time.time()
+    warmup_path = CONFIG.get("WARMUP_IMG_PATH")
+    try:
+        with open(warmup_path, "rb") as f:
+            image_bytes = f.read()
+        frame = pre_process_image(image_bytes, CONFIG)
+        slices, slice_coords = slice_frame(frame)
+        detections = merge_tile_detections(_predict_slices(slices), slice_coords)
+        detections = select(detections, deduplicate(detections))
+        ellipse_axes(detections)
+    except Exception as e:
+        print(f"Error en el warm-up con '{warmup_path}': {e}")
+        report_ready(False)
+        return False
+    READY = True
+    print(f"--- Worker de inferencia LISTO (warm-up en {time.time() - start_time:.2f} s) ---")
+    report_ready(True)
+    return True
+
+
+def report_ready(ready):
+    """Publica el estado del proceso para el gauge f80_worker_ready de /metrics (ver metrics)."""
+    global READINESS
+    if READINESS is None:
+        READINESS = ReadinessReporter(get_recorder().client, f"{socket.gethostname()}:{os.getpid()}")
+    READINESS.set(ready)
+
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def _clear_readiness(**kwargs):
+    if READINESS is not None:
+        READINESS.clear()
+
+
+def _consumes_inference_queue():
+    # run.py exporta las colas del worker antes de arrancarlo.
+    return "inference_queue" in os.environ.get("F80_WORKER_QUEUES", "").split(",")
+
+def init_worker_resources():
+    if os.environ.get("F80_CV_THREADS"):
+        cv2.setNumThreads(int(os.environ["F80_CV_THREADS"]))
+    if _consumes_inference_queue() and not READY:
+        print("--- Precargando modelo, calibracion y config de inferencia ---")
+        warmup()
+
+@signals.worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    # Pool prefork: cada proceso hijo carga sus propios recursos.
+    init_worker_resources()
+
+@signals.worker_ready.connect
+def _on_worker_ready(sender=None, **kwargs):
+    # Pools de un solo proceso (solo, threads, gevent): se carga en el proceso principal.
+    if sender is not None and "prefork" in type(sender.pool).__module__:
+        return
+    init_worker_resources()
+
+
+def load_model(config):
+    """
+    Crea el modelo segun el backend configurado: "ultralytics" (YOLO) o "onnxruntime"
+    (sesion directa de onnxruntime con hilos, nivel de optimizacion e IO binding propios).
+    """
+    if config.get("BACKEND", "ultralytics") == "onnxruntime":
+        return OnnxSegmentationEngine(
+            config["MODEL_PATH"],
+            imgsz=config.get("IMGSZ", 640),
+            # run.py limita los hilos de cada proceso en los pools de CPU (ver worker_profiles).
+            intra_op_threads=int(os.environ.get("F80_ORT_INTRA_OP_THREADS", config.get("ORT_INTRA_OP_THREADS", 0))),
+            inter_op_threads=config.get("ORT_INTER_OP_THREADS", 1),
+            graph_opt_level=config.get("ORT_GRAPH_OPT_LEVEL", "all"),
+            max_batch=config.get("ORT_MAX_BATCH", 16),
+            max_det=config.get("MAX_DET", 300),
+        )
+    return YOLO(config["MODEL_PATH"], task="segment")
 
 ### Funciones auxiliares
+def get_preprocessor(config):
+    """
+    Regresa el FramePreprocessor del worker, creandolo la primera vez con la
+    calibracion del config. Los mapas de correccion se calculan en el primer frame
+    de cada resolucion y se reutilizan en todas las imagenes siguientes.
+    """
+    global PREPROCESSOR
+    if PREPROCESSOR is None:
+        PREPROCESSOR = FramePreprocessor(
+            config["mtx"], config["dist"], config["newcameramtx"],
+            clip_limit=config.get("CLAHE_CLIP_LIMIT", 2.5),
+            tile_grid_size=tuple(config.get("CLAHE_TILE_GRID", (8, 8))),
+        )
+    return PREPROCESSOR
+
 def pre_process_image(img, config):
     frame = cv2.imdecode(np.frombuffer(img, np.uint8), cv2.IMREAD_COLOR)
-    ycrcb = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb)
-    y, cr, cb = cv2.split(ycrcb)
-
-    clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
-    y_clahe = clahe.apply(y)
-
-    merged = cv2.merge((y_clahe, cr, cb))
-    img = cv2.cvtColor(merged, cv2.COLOR_YCrCb2BGR)
     #gaussian_3 = cv2.GaussianBlur(img, (0, 0), 0.2)
-    dst = cv2.undistort(img, config["mtx"], config["dist"], None, config["newcameramtx"])
-    return dst
-
-def non_max_suppression(boxes, scores, threshold):
-    indices = cv2.dnn.NMSBoxes(boxes, scores, threshold, CONFIG["NMS_THRESHOLD"])
-    return indices.flatten() if len(indices) > 0 else []
-
-
+    return get_preprocessor(config)(frame)
 
-### Task del worker
-@celery_app.task(name='workers.inference.perform_inference')
-def perform_inference(camera_id: str, image_data: str, sim, capture_time):
-    load_resources()
-    if MODEL is None:
-        return {"error": "Modelo no cargado"}
+def tile_nms_iou():
+    """
+    Umbral IoU del NMS que hace el modelo dentro de cada recorte. Es independiente del
+    NMS_THRESHOLD de la de-duplicacion: bajarlo cambiaria que detecciones sobreviven.
+    """
+    return CONFIG.get("TILE_NMS_IOU", 0.7)
 
-    print(f"Inferencia por lotes comenzada para camara {camera_id}")
-    start_time = time.time()
+def _predict_slices(slices):
+    # En el pool de hilos y en el modo pipeline varias tareas comparten el mismo modelo.
+    with MODEL_LOCK:
+        if isinstance(MODEL, OnnxSegmentationEngine):
+            return MODEL.predict(slices, conf=CONFIG["CONF"], iou=tile_nms_iou())
+        batch_results = MODEL.predict(slices, conf=CONFIG["CONF"], iou=tile_nms_iou(), verbose=False, task='segment')
+    return tile_arrays_from_results(batch_results)
 
-    image_bytes = base64.b64decode(image_data)
-    frame = pre_process_image(image_bytes, CONFIG)
+def predict_slices(slices):
+    """
+    Corre el modelo sobre los recortes de un frame y regresa, por recorte, una tupla
+    (boxes, scores, poligonos) en coordenadas del recorte, o None si no hubo mascaras.
+    Si la inferencia por lotes esta habilitada, los recortes se juntan con los de otras
+    camaras en una sola pasada.
+    """
+    if BATCHER is not None:
+        return BATCHER.predict(slices)
+    return _predict_slices(slices)
 
-    img_h, img_w, _ = frame.shape
-    total_image_area = float(img_h * img_w)
+def slice_frame(frame):
+    """Divide el frame en recortes de SLICE x SLICE con traslape OVERLAP."""
+    img_h, img_w = frame.shape[:2]
     slice_h = CONFIG["SLICE"]
     slice_w = CONFIG["SLICE"]
     overlap = CONFIG["OVERLAP"]
@@ -102,77 +242,133 @@ def perform_inference(camera_id: str, image_data: str, sim, capture_time):
             x1, x2 = x, min(x + slice_w, img_w)
             slices.append(frame[y1:y2, x1:x2])
             slice_coords.append((x1, y1))
+    return slices, slice_coords
+
+def non_max_suppression(boxes, scores, threshold):
+    indices = cv2.dnn.NMSBoxes(boxes, scores, threshold, CONFIG["NMS_THRESHOLD"])
+    return indices.flatten() if len(indices) > 0 else []
+
+def deduplicate(detections):
+    """
+    Elimina las detecciones duplicadas entre recortes traslapados. Ambos modos dan el
+    mismo resultado: en modo "seam" solo se comparan las cajas que se intersectan (ver
+    workers.dedup); en modo "nms" se hace un solo NMS global sobre todas las cajas.
+    """
+    if CONFIG.get("DEDUP_MODE", "seam") == "seam":
+        return seam_deduplicate(detections.boxes, detections.scores, CONFIG["CONF"], CONFIG["NMS_THRESHOLD"])
+    return non_max_suppression(boxes_xywh(detections), detections.scores, CONFIG["CONF"])
+
 
-    if not slices:
-        return {"status": "Inferencia completa sin detecciones.", "camera_id": camera_id}
 
-    batch_results = MODEL.predict(slices, conf=CONFIG["CONF"], verbose=False, task='segment')
+### Task del worker
+@celery_app.task(name='workers.inference.perform_inference')
+def perform_inference(camera_id: str, image_ref: str, sim, capture_time, trace=None):
+    # `trace` lleva los tiempos de cada etapa del frame (ver metrics); es opcional para
+    # aceptar tareas encoladas por versiones anteriores.
+    try:
+        return run_inference(camera_id, image_ref, sim, capture_time, trace)
+    finally:
+        # La camara puede volver a despachar un frame (ver admission).
+        admission.release(camera_id)
+
+@signals.task_revoked.connect
+def release_revoked_frame(sender=None, request=None, expired=False, **kwargs):
+    """Las tareas que Celery descarta por `expires` tambien liberan su lugar en vuelo."""
+    if getattr(sender, "name", None) != perform_inference.name or not request or not request.args:
+        return
+    camera_id = request.args[0]
+    admission.release(camera_id)
+    if expired:
+        print(f"Frame de la camara {camera_id} descartado por antiguedad.")
+        get_recorder().count_dropped(camera_id, "expired")
+
+def infer_frame(camera_id, image_bytes):
+    """
+    Etapa de inferencia de un frame JPEG: pre-procesamiento, recortes, modelo,
+    deduplicacion y elipses. Regresa un dict con "area_ar", "detections" (% del frame
+    cubierto) y las imagenes original y segmentada en JPEG ("og_jpeg", "seg_jpeg"), o
+    None si no hubo detecciones. La usan la tarea de Celery y el modo pipeline de run.py.
+    """
+    frame = pre_process_image(image_bytes, CONFIG)
 
-    all_boxes = []
-    all_scores = []
-    all_masks = []
+    img_h, img_w, _ = frame.shape
+    total_image_area = float(img_h * img_w)
+
+    slices, slice_coords = slice_frame(frame)
+    if not slices:
+        return None
 
-    for result, (x1, y1) in zip(batch_results, slice_coords):
-        if result.masks is not None:
-            for box, mask in zip(result.boxes, result.masks.xy):
-                global_box = [box.xyxy[0][0] + x1, box.xyxy[0][1] + y1, box.xyxy[0][2] + x1, box.xyxy[0][3] + y1]
-                global_mask = mask + [x1, y1]
-                all_boxes.append([int(b) for b in global_box])
-                all_scores.append(float(box.conf))
-                all_masks.append(global_mask.astype(int).tolist())
+    tile_detections = predict_slices(slices)
+    detections = merge_tile_detections(tile_detections, slice_coords)
 
-    if not all_boxes:
+    if len(detections) == 0:
         print(f"No se encontraron detecciones para la camara: {camera_id}")
-        return {"status": "Inferencia completa sin detecciones.", "camera_id": camera_id}
+        return None
 
-    boxes_for_nms = [[box[0], box[1], box[2] - box[0], box[3] - box[1]] for box in all_boxes]
-    indices = non_max_suppression(boxes_for_nms, all_scores, CONFIG["CONF"])
-    final_masks = [all_masks[i] for i in indices]
+    indices = deduplicate(detections)
+    detections = select(detections, indices)
 
-    area_ar = []
-    for mask_points in final_masks:
-        if len(mask_points) >= 5:
-            ellipse = cv2.fitEllipse(np.array(mask_points))
-            area_ar.append(ellipse[1])
+    area_ar = ellipse_axes(detections).tolist()
 
     res_img = frame.copy()
     overlay = frame.copy()
     alpha = 0.4 
     color_fill = (0, 255, 0) 
 
-    pts_for_poly = [np.array(mask, dtype=np.int32) for mask in final_masks]
-
-    cv2.fillPoly(overlay, pts_for_poly, color_fill)
+    cv2.fillPoly(overlay, detections.polygons(), color_fill)
 
     cv2.addWeighted(overlay, alpha, res_img, 1 - alpha, 0, res_img)
     
     _, buffer = cv2.imencode(".jpg", res_img)
     _, buffer_og = cv2.imencode(".jpg", frame)
-    img_result_encoded = base64.b64encode(buffer).decode('utf-8')
-    frame_encoded = base64.b64encode(buffer_og).decode('utf-8')
-    total_mask_area = 0.0
-    for mask_points in final_masks:
-        contour = np.array(mask_points)
-        total_mask_area += cv2.contourArea(contour)
+    total_mask_area = float(polygon_areas(detections).sum())
 
     detection_percentage = 0.0
     if total_image_area > 0:
         detection_percentage = (total_mask_area / total_image_area) * 100
 
-    results = {
-        "img_result": img_result_encoded,
-        "img_original": frame_encoded,
+    return {
         "area_ar": area_ar,
         "detections": detection_percentage,
+        "og_jpeg": buffer_og.tobytes(),
+        "seg_jpeg": buffer.tobytes(),
+    }
+
+def run_inference(camera_id, image_ref, sim, capture_time, trace=None):
+    """Inferencia de un frame; al terminar encola el calculo de la granulometria."""
+    start_time = time.time()
+    trace = mark(trace if trace is not None else {}, "inference_start", start_time)
+    load_resources()
+    if MODEL is None:
+        return {"error": "Modelo no cargado"}
+
+    print(f"Inferencia por lotes comenzada para camara {camera_id}")
+
+    try:
+        image_bytes = blob_store.get(image_ref)
+    except KeyError as e:
+        print(f"No se pudo leer el frame de la camara {camera_id}: {e}")
+        return {"error": "Frame no disponible", "camera_id": camera_id}
+
+    inference = infer_frame(camera_id, image_bytes)
+    if inference is None:
+        return {"status": "Inferencia completa sin detecciones.", "camera_id": camera_id}
+
+    results = {
+        "img_result": blob_store.put(inference["seg_jpeg"]),
+        "img_original": blob_store.put(inference["og_jpeg"]),
+        "area_ar": inference["area_ar"],
+        "detections": inference["detections"],
         "sim": sim,
-        "capture_time": capture_time
+        "capture_time": capture_time,
+        "trace": trace,
     }
 
+    mark(trace, "inference_end")
     process_granulometry.delay(camera_id, results)
+    get_recorder().observe_trace(camera_id, trace, stages=("inference_queue_wait", "inference"))
 
-    end_time = time.time()
-    print(f"INFERENCE [COMPLETED] for camera: {camera_id} in {end_time - start_time:.2f} seconds.")
+    print(f"INFERENCE [COMPLETED] for camera: {camera_id} in {trace['inference_end'] - start_time:.2f} seconds.")
 
     return {"status": "Inference complete, passed to processing worker.", "camera_id": camera_id}
 
-
@@ -0,0 +1,195 @@
+"""
+Backend de inferencia que corre el modelo de segmentacion YOLO exportado a ONNX
+directamente con onnxruntime, sin pasar por ultralytics.
+
+El pre-procesamiento (letterbox de cada recorte al tamano de entrada), el NMS por
+recorte y la decodificacion de las mascaras a partir de los prototipos se hacen con
+NumPy/OpenCV. Las entradas y salidas del modelo usan buffers preasignados con IO
+binding, asi que no se reservan tensores nuevos en cada lote. Como esos buffers son
+compartidos, `predict()` se serializa con un lock y la sesion se puede usar desde varios
+hilos.
+"""
+import threading
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+GRAPH_OPT_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+PAD_VALUE = 114
+# Strides de las cabezas de deteccion de YOLO y reduccion de los prototipos de mascara.
+STRIDES = (8, 16, 32)
+PROTO_STRIDE = 4
+
+
+class OnnxSegmentationEngine:
+    """
+    Sesion de onnxruntime para un modelo YOLO-seg con salidas
+    (N, 4 + clases + 32, anclas) y prototipos (N, 32, mh, mw).
+
+    `predict()` regresa, por recorte, (boxes xyxy, scores, poligonos) en coordenadas
+    del recorte, el mismo formato que workers.postprocess.tile_arrays_from_results.
+
+    En los modelos exportados con ejes dinamicos (`dynamic=True`) las dimensiones de
+    anclas y de los prototipos son simbolicas; se calculan a partir de `imgsz`.
+    """
+
+    def __init__(self, model_path, imgsz=640, intra_op_threads=0, inter_op_threads=1,
+                 graph_opt_level="all", max_batch=16, max_det=300):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(intra_op_threads)
+        options.inter_op_num_threads = int(inter_op_threads)
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = GRAPH_OPT_LEVELS[graph_opt_level]
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.imgsz = int(imgsz)
+        self.max_det = int(max_det)
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Modelos exportados sin batch dinamico tienen un tamano de lote fijo.
+        fixed_batch = model_input.shape[0]
+        self.dynamic_batch = not (isinstance(fixed_batch, int) and fixed_batch > 0)
+        self.batch_size = int(max_batch) if self.dynamic_batch else fixed_batch
+        self._bound_batch = None
+
+        outputs = self.session.get_outputs()
+        self.output_names = [o.name for o in outputs]
+        self.output_shapes = self._output_shapes(outputs)
+        self.n_masks = self.output_shapes[1][0]
+        self.n_classes = self.output_shapes[0][0] - 4 - self.n_masks
+
+        self.input_buffer = np.empty((self.batch_size, 3, self.imgsz, self.imgsz), dtype=np.float32)
+        self.output_buffers = [np.empty((self.batch_size,) + shape, dtype=np.float32) for shape in self.output_shapes]
+        self.binding = self.session.io_binding()
+        self._lock = threading.Lock()
+
+    def _output_shapes(self, outputs):
+        """Forma de cada salida sin el eje de lote, resolviendo las dimensiones simbolicas."""
+        anchors = sum(int(np.ceil(self.imgsz / stride)) ** 2 for stride in STRIDES)
+        proto = int(np.ceil(self.imgsz / PROTO_STRIDE))
+        shapes = []
+        for output, expected in zip(outputs, ((None, anchors), (None, proto, proto))):
+            dims = output.shape[1:]
+            if len(dims) != len(expected) or not isinstance(dims[0], int):
+                raise ValueError(f"Salida '{output.name}' con forma no soportada: {output.shape}")
+            shapes.append(tuple(d if isinstance(d, int) and d > 0 else e for d, e in zip(dims, expected)))
+        return shapes
+
+    def _bind(self, n):
+        if n == self._bound_batch:
+            return
+        self._bound_batch = n
+        self.binding.bind_input(
+            self.input_name, "cpu", 0, np.float32, (n, 3, self.imgsz, self.imgsz), self.input_buffer.ctypes.data,
+        )
+        for name, buffer in zip(self.output_names, self.output_buffers):
+            self.binding.bind_output(name, "cpu", 0, np.float32, (n,) + buffer.shape[1:], buffer.ctypes.data)
+
+    def _letterbox_into(self, index, tile):
+        """Escala el recorte para caber en imgsz x imgsz, lo centra con relleno y lo copia al buffer."""
+        h, w = tile.shape[:2]
+        r = min(self.imgsz / h, self.imgsz / w)
+        new_w, new_h = int(round(w * r)), int(round(h * r))
+        dw, dh = (self.imgsz - new_w) / 2, (self.imgsz - new_h) / 2
+        left, top = int(round(dw - 0.1)), int(round(dh - 0.1))
+        if (new_w, new_h) != (w, h):
+            tile = cv2.resize(tile, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        canvas = self.input_buffer[index]
+        canvas.fill(PAD_VALUE / 255.0)
+        # BGR HWC uint8 -> RGB CHW float32 en [0, 1]
+        canvas[:, top:top + new_h, left:left + new_w] = tile[:, :, ::-1].transpose(2, 0, 1)
+        canvas[:, top:top + new_h, left:left + new_w] *= 1.0 / 255.0
+        return r, left, top
+
+    def _decode(self, index, letterbox, tile_shape, conf, iou):
+        r, pad_x, pad_y = letterbox
+        tile_h, tile_w = tile_shape[:2]
+        pred = self.output_buffers[0][index].T
+        class_scores = pred[:, 4:4 + self.n_classes]
+        scores = class_scores.max(axis=1)
+        candidates = np.flatnonzero(scores > conf)
+        if len(candidates) == 0:
+            return None
+        pred = pred[candidates]
+        scores = scores[candidates]
+
+        cxcywh = pred[:, :4]
+        boxes = np.empty_like(cxcywh)
+        boxes[:, :2] = cxcywh[:, :2] - cxcywh[:, 2:] / 2
+        boxes[:, 2:] = cxcywh[:, :2] + cxcywh[:, 2:] / 2
+        xywh = np.concatenate([boxes[:, :2], cxcywh[:, 2:]], axis=1)
+        keep = cv2.dnn.NMSBoxes(xywh, scores, conf, iou, top_k=self.max_det)
+        keep = np.asarray(keep, dtype=np.int64).flatten()
+        if len(keep) == 0:
+            return None
+        boxes, scores = boxes[keep], scores[keep]
+        coeffs = pred[keep, 4 + self.n_classes:]
+
+        protos = self.output_buffers[1][index]
+        _, mh, mw = protos.shape
+        logits = (coeffs @ protos.reshape(self.n_masks, -1)).reshape(-1, mh, mw)
+        polygons = self._mask_polygons(logits, boxes, mh, mw)
+
+        # Del espacio letterbox al espacio del recorte.
+        offset = np.array([pad_x, pad_y], dtype=np.float32)
+        boxes = (boxes - np.tile(offset, 2)) / r
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, tile_w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, tile_h)
+        polygons = [((p - offset) / r).clip(0, [tile_w, tile_h]).astype(np.float32) for p in polygons]
+        return boxes.astype(np.float32), scores.astype(np.float32), polygons
+
+    def _mask_polygons(self, logits, boxes, mh, mw):
+        """
+        Para cada deteccion escala a la resolucion de entrada solo la region de su caja
+        en los prototipos, binariza (logit > 0) dentro de la caja y extrae el contorno
+        externo mas grande.
+        """
+        scale = self.imgsz / mw
+        polygons = []
+        for mask_logits, (x1, y1, x2, y2) in zip(logits, boxes):
+            # Region en baja resolucion con un pixel de margen para interpolar bien los bordes.
+            lx1 = max(int(np.floor(x1 / scale)) - 1, 0)
+            ly1 = max(int(np.floor(y1 / scale)) - 1, 0)
+            lx2 = min(int(np.ceil(x2 / scale)) + 1, mw)
+            ly2 = min(int(np.ceil(y2 / scale)) + 1, mh)
+            if lx2 <= lx1 or ly2 <= ly1:
+                polygons.append(np.empty((0, 2), np.float32))
+                continue
+            region = cv2.resize(
+                mask_logits[ly1:ly2, lx1:lx2],
+                (int((lx2 - lx1) * scale), int((ly2 - ly1) * scale)),
+                interpolation=cv2.INTER_LINEAR,
+            )
+            ox, oy = lx1 * scale, ly1 * scale
+            binary = np.zeros(region.shape, dtype=np.uint8)
+            bx1, by1 = max(int(round(x1 - ox)), 0), max(int(round(y1 - oy)), 0)
+            bx2, by2 = int(round(x2 - ox)), int(round(y2 - oy))
+            binary[by1:by2, bx1:bx2] = region[by1:by2, bx1:bx2] > 0
+            contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                polygons.append(np.empty((0, 2), np.float32))
+                continue
+            contour = max(contours, key=len).reshape(-1, 2).astype(np.float32)
+            polygons.append(contour + np.array([ox, oy], dtype=np.float32))
+        return polygons
+
+    def predict(self, slices, conf=0.25, iou=0.7):
+        """Corre el modelo sobre una lista de recortes BGR y regresa sus detecciones por recorte."""
+        tile_detections = []
+        for start in range(0, len(slices), self.batch_size):
+            chunk = slices[start:start + self.batch_size]
+            # Los buffers de entrada/salida son compartidos: un lote a la vez.
+            with self._lock:
+                letterboxes = [self._letterbox_into(i, tile) for i, tile in enumerate(chunk)]
+                # Con lote fijo se corre el lote completo y se ignoran las salidas sobrantes.
+                self._bind(len(chunk) if self.dynamic_batch else self.batch_size)
+                self.session.run_with_iobinding(self.binding)
+                for i, tile in enumerate(chunk):
+                    tile_detections.append(self._decode(i, letterboxes[i], tile.shape, conf, iou))
+        return tile_detections
@@ -0,0 +1,140 @@
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+
+class Detections(NamedTuple):
+    """
+    Detecciones de un frame completo en arreglos de NumPy.
+
+    boxes:   (N, 4) int32 con x1, y1, x2, y2 en coordenadas del frame.
+    scores:  (N,) float32.
+    points:  (M, 2) int32 con los vertices de todos los poligonos concatenados.
+    offsets: (N + 1,) int64; el poligono i son los puntos points[offsets[i]:offsets[i + 1]].
+    """
+    boxes: np.ndarray
+    scores: np.ndarray
+    points: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self):
+        return len(self.scores)
+
+    def polygons(self):
+        """Regresa la lista de poligonos como vistas de `points` (para fillPoly)."""
+        return np.split(self.points, self.offsets[1:-1])
+
+
+def tile_arrays_from_results(batch_results):
+    """
+    Convierte los resultados de ultralytics de cada recorte en (boxes, scores, poligonos)
+    con arreglos de NumPy. Los recortes sin mascaras regresan None.
+    """
+    tiles = []
+    for result in batch_results:
+        if result.masks is None:
+            tiles.append(None)
+            continue
+        boxes = result.boxes.xyxy.cpu().numpy()
+        scores = result.boxes.conf.cpu().numpy()
+        tiles.append((boxes, scores, result.masks.xy))
+    return tiles
+
+
+def merge_tile_detections(tile_detections, slice_coords):
+    """
+    Junta las detecciones de todos los recortes trasladandolas a coordenadas del frame.
+    Las coordenadas se truncan a enteros igual que antes (int()/astype(int)).
+    """
+    all_boxes = []
+    all_scores = []
+    all_points = []
+    all_lengths = []
+    for tile, (x1, y1) in zip(tile_detections, slice_coords):
+        if tile is None:
+            continue
+        boxes, scores, polygons = tile
+        if len(scores) == 0:
+            continue
+        all_boxes.append(np.asarray(boxes, dtype=np.float32) + np.array([x1, y1, x1, y1], dtype=np.float32))
+        all_scores.append(np.asarray(scores, dtype=np.float32))
+        lengths = np.fromiter((len(p) for p in polygons), dtype=np.int64, count=len(polygons))
+        all_lengths.append(lengths)
+        if lengths.sum() > 0:
+            points = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polygons])
+            all_points.append(points + np.array([x1, y1], dtype=np.float64))
+
+    if not all_scores:
+        return Detections(
+            np.empty((0, 4), np.int32), np.empty(0, np.float32),
+            np.empty((0, 2), np.int32), np.zeros(1, np.int64),
+        )
+
+    lengths = np.concatenate(all_lengths)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    points = np.concatenate(all_points) if all_points else np.empty((0, 2), np.float64)
+    return Detections(
+        np.concatenate(all_boxes).astype(np.int32),
+        np.concatenate(all_scores),
+        points.astype(np.int32),
+        offsets,
+    )
+
+
+def select(detections, indices):
+    """Regresa solo las detecciones en `indices`, reacomodando los poligonos sin ciclos."""
+    indices = np.asarray(indices, dtype=np.int64)
+    starts = detections.offsets[indices]
+    lengths = detections.offsets[indices + 1] - starts
+    offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return Detections(
+        detections.boxes[indices],
+        detections.scores[indices],
+        detections.points[gather],
+        offsets,
+    )
+
+
+def boxes_xywh(detections):
+    """Cajas en formato x, y, ancho, alto (el que espera cv2.dnn.NMSBoxes)."""
+    boxes = detections.boxes.copy()
+    boxes[:, 2:] -= boxes[:, :2]
+    return boxes
+
+
+def polygon_areas(detections):
+    """
+    Area de cada poligono con la formula del zapato (shoelace) en bloque. Da el mismo
+    valor que cv2.contourArea sobre los mismos puntos enteros.
+    """
+    n = len(detections)
+    areas = np.zeros(n, dtype=np.float64)
+    lengths = np.diff(detections.offsets)
+    valid = lengths > 0
+    if not valid.any():
+        return areas
+    x = detections.points[:, 0].astype(np.float64)
+    y = detections.points[:, 1].astype(np.float64)
+    starts = detections.offsets[:-1][valid]
+    ends = detections.offsets[1:][valid]
+    nxt = np.arange(1, len(x) + 1)
+    nxt[ends - 1] = starts
+    cross = x * y[nxt] - x[nxt] * y
+    areas[valid] = np.abs(np.add.reduceat(cross, starts)) * 0.5
+    return areas
+
+
+def ellipse_axes(detections, min_points=5):
+    """Ejes de la elipse ajustada (cv2.fitEllipse) de cada poligono con al menos `min_points` puntos."""
+    offsets = detections.offsets
+    lengths = np.diff(offsets)
+    idx = np.flatnonzero(lengths >= min_points)
+    axes = np.empty((len(idx), 2), dtype=np.float64)
+    points = detections.points
+    for row, i in enumerate(idx):
+        axes[row] = cv2.fitEllipse(points[offsets[i]:offsets[i + 1]])[1]
+    return axes
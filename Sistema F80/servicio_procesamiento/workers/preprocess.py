@@ -0,0 +1,62 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class FramePreprocessor:
+    """
+    Ecualizacion CLAHE sobre la luminancia y correccion de distorsion de lente.
+
+    Las tablas de `initUndistortRectifyMap` se calculan una sola vez por resolucion
+    (la calibracion es la misma para todas las camaras) y despues cada frame solo hace
+    `cv2.remap`, que da el mismo resultado que `cv2.undistort` sin recalcular el mapa.
+    El objeto CLAHE y los buffers intermedios se reutilizan; el canal Y se ecualiza
+    sobre el mismo buffer YCrCb en lugar de separar y volver a unir los tres canales.
+    """
+
+    def __init__(self, mtx, dist, newcameramtx, clip_limit=2.5, tile_grid_size=(8, 8)):
+        self.mtx = mtx
+        self.dist = dist
+        self.newcameramtx = newcameramtx
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tile_grid_size
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        self._maps = {}
+        self._buffers = {}
+        # Los buffers intermedios se comparten; el lock evita que dos hilos los usen a la vez.
+        self._lock = threading.Lock()
+
+    def undistort_maps(self, width, height):
+        key = (width, height)
+        maps = self._maps.get(key)
+        if maps is None:
+            maps = cv2.initUndistortRectifyMap(
+                self.mtx, self.dist, None, self.newcameramtx, (width, height), cv2.CV_16SC2,
+            )
+            self._maps[key] = maps
+        return maps
+
+    def _intermediate(self, shape):
+        buffers = self._buffers.get(shape)
+        if buffers is None:
+            buffers = (
+                np.empty(shape, dtype=np.uint8),
+                np.empty(shape[:2], dtype=np.uint8),
+                np.empty(shape, dtype=np.uint8),
+            )
+            self._buffers[shape] = buffers
+        return buffers
+
+    def __call__(self, frame):
+        h, w = frame.shape[:2]
+        with self._lock:
+            ycrcb, luma, bgr = self._intermediate(frame.shape)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb, dst=ycrcb)
+            cv2.extractChannel(ycrcb, 0, dst=luma)
+            self.clahe.apply(luma, dst=luma)
+            cv2.insertChannel(luma, ycrcb, 0)
+            cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2BGR, dst=bgr)
+            map1, map2 = self.undistort_maps(w, h)
+            # El resultado es un arreglo nuevo: el frame sigue en uso despues de regresar.
+            return cv2.remap(bgr, map1, map2, cv2.INTER_LINEAR)
@@ -1,23 +1,24 @@
 import time
 import json
 import numpy as np
-import pandas as pd
 from celery_app import celery_app
-from scipy.interpolate import interp1d
 import redis 
 from pyinstaller_utils import resource_path
+from metrics import get_recorder, mark
 CONFIG = None
 REDIS_CLIENT = None
+HISTORY = None
+PSD_WINDOWS = {}
 
 from .database import save_to_db
+from .psd import PSDWindow
+from .history import RedisHistory
 
-def load_resources():
+def load_config():
     """
     Carga la configuración del proceso especifico
     """
-    global CONFIG, REDIS_CLIENT
-    
-    # Load config only once
+    global CONFIG
     if CONFIG is None:
         try:
             config_file = resource_path("configs/process_config.json")
@@ -27,6 +28,14 @@ def load_resources():
         except Exception as e:
             print(f"Error cargando el config del procesamiento: {e}")
             CONFIG = {} # Prevent retrying on failure
+    return CONFIG
+
+def load_resources():
+    """
+    Carga la configuración y el historial en Redis del worker
+    """
+    global REDIS_CLIENT, HISTORY
+    load_config()
     if REDIS_CLIENT is None:
         try:
             # Conexión a Redis para el historial
@@ -36,80 +45,77 @@ def load_resources():
         except Exception as e:
             print(f"Error conectando a Redis para historial: {e}")
             REDIS_CLIENT = None
+    if HISTORY is None and REDIS_CLIENT is not None and CONFIG:
+        HISTORY = RedisHistory(REDIS_CLIENT, CONFIG.get("window_size", 1))
     
+def get_psd_window(camera_id):
+    """
+    Ventana PSD en memoria de la camara. Se conserva entre tareas para que cada frame
+    solo agregue sus elipses y quite las del frame que sale del historial.
+    """
+    px_mm = CONFIG["px_mm"]
+    window = PSD_WINDOWS.get(camera_id)
+    if window is None or window.px_mm != px_mm:
+        window = PSD_WINDOWS[camera_id] = PSDWindow(px_mm)
+    return window
+
+def compute_granulometry(camera_id, area_ar, history):
+    """
+    Etapa de PSD: agrega las elipses del frame al historial (RedisHistory o
+    MemoryHistory) y calcula los Fs de la ventana, y los ajustados si CALIBRAR esta
+    activo. Regresa (Fs, Fs_ajust) como listas (Fs_ajust None sin calibracion), o None
+    mientras se llena la ventana.
+    """
+    window_size = history.window_size
+    window = history.push_and_window(camera_id, area_ar)
+    current_size = len(window)
+
+    if current_size < window_size:
+        print(f"Historial para {camera_id} tiene {current_size}/{window_size} mediciones. Esperando más datos.")
+        return None
+
+    print(f"Cola para {camera_id} llena ({current_size}/{window_size}). Calculando granulometría suavizada.")
+
+    psd_window = get_psd_window(camera_id)
+    with psd_window.lock:
+        psd_window.sync(window)
+        Fs = psd_window.fs()
+
+    Fs_ajust = None
+    if CONFIG["CALIBRAR"]:
+        calibrations = CONFIG.get("calibrations", {})
+        camera_cal = calibrations.get(camera_id)
+        coeffs = camera_cal.get("coeffs", [1, 0])
+        Fs_ajust = np.polyval(coeffs, Fs)
+
+    return Fs.tolist(), Fs_ajust.tolist() if Fs_ajust is not None else None
+
 @celery_app.task(name="workers.process.process_granulometry")
 def process_granulometry(camera_id: str, inference_data: dict):
     
     """
         Recibe los datos de la inferencia y los procesa. Por ahora nada mas imprime los resultados. Los datos recibidos son:
         results = {
-            "img_result": image_data_string,
+            "img_result": referencia_blob,
+            "img_original": referencia_blob,
             "area_ar": area_ar,
             "detections": detections
         }
+        Las imagenes viajan como referencias del almacen de blobs y se reenvian sin leerlas.
     """
+    trace = mark(inference_data.get("trace") or {}, "process_start")
     load_resources()
-    if not CONFIG or not REDIS_CLIENT:
+    if not CONFIG or not HISTORY:
         return {"status": "Fallo: No se cargaron los recursos (config/redis)."}
 
     try:
-        history_key = f"history:{camera_id}"
-        window_size = CONFIG.get("window_size", 1)
-
-        new_data_json = json.dumps(inference_data["area_ar"])
-        REDIS_CLIENT.lpush(history_key, new_data_json)
-        
-        
-
-        current_size = REDIS_CLIENT.llen(history_key)
-        
-        if current_size < window_size:
-            print(f"Historial para {camera_id} tiene {current_size}/{window_size} mediciones. Esperando más datos.")
-            return {"status": f"Acumulando datos para {camera_id}"}
-        
-        REDIS_CLIENT.ltrim(history_key, 0, window_size - 1)
-        print(f"Cola para {camera_id} llena ({current_size}/{window_size}). Calculando granulometría suavizada.")
-        
-        all_data_json = REDIS_CLIENT.lrange(history_key, 0, -1)
-        
-        combined_ellips_list = []
-        for item_json in all_data_json:
-            area_ar_list = json.loads(item_json)
-            ellipses = [[
-                max(ejes) * CONFIG["px_mm"], 
-                min(ejes) * CONFIG["px_mm"]
-            ] for ejes in area_ar_list]
-            combined_ellips_list.extend(ellipses)
-        
-        rect_df = pd.DataFrame(combined_ellips_list, columns=["eje_M", "eje_m"])
-        rect_df["ell_vol"] = (4/3 * np.pi * (rect_df["eje_M"] / 2) 
-                            * np.power((rect_df["eje_m"] / 2), 2))
-        ellips_df  = rect_df.sort_values("eje_m")
-        histvalues_vol = ellips_df["ell_vol"] \
-            / ellips_df["ell_vol"].sum()*100
-        ellips_df["cumulative"] = np.cumsum(histvalues_vol)
-        psd = interp1d(ellips_df["cumulative"].tolist(), ellips_df["eje_m"].tolist() 
-                    )
-        Fs = psd([10,20,30,40,50,60,70,80,90])
-
-        Fs = np.append(Fs, max(ellips_df["eje_m"]))
+        granulometry = compute_granulometry(camera_id, inference_data["area_ar"], HISTORY)
     except Exception as e:
-        print(f"Error calculando los Fs: {e}")
+        print(f"Error calculando la granulometría: {e}")
         return {"status": "Proceso fallido", "camara": camera_id}
-    Fs_ajust = None
-    
-    if CONFIG["CALIBRAR"]:
-        try:
-            calibrations = CONFIG.get("calibrations", {})
-            camera_cal = calibrations.get(camera_id)
-            coeffs = camera_cal.get("coeffs", [1, 0])
-            Fs_ajust = np.polyval(coeffs, Fs)
-        except Exception as e:
-            print(f"Error ejecutando la calibración {e}")
-            return {"status": "Proceso fallido", "camara": camera_id}
-
-    fs_list = Fs.tolist()
-    fs_ajust_list = Fs_ajust.tolist() if Fs_ajust is not None else None
+    if granulometry is None:
+        return {"status": f"Acumulando datos para {camera_id}"}
+    fs_list, fs_ajust_list = granulometry
 
     results = {
         "Fs": fs_list,
@@ -118,11 +124,14 @@ def process_granulometry(camera_id: str, inference_data: dict):
         "sim": inference_data["sim"],
         "capture_time": inference_data["capture_time"],
         "img_result": inference_data["img_result"],
-        "img_original": inference_data["img_original"]
+        "img_original": inference_data["img_original"],
+        "trace": trace,
     }
 
     print(f"--- Procesado completo para camara: {camera_id} ---")
     
+    mark(trace, "process_end")
     save_to_db.delay(results)
+    get_recorder().observe_trace(camera_id, trace, stages=("processing_queue_wait", "psd"))
     return {"status": "Procesado completo", "camara": camera_id}
 
@@ -0,0 +1,115 @@
+"""
+Curva granulometrica (PSD) de la ventana deslizante de mediciones de una camara.
+
+La ventana guarda, ya ordenadas por eje menor, las elipses de todos los frames que
+contiene. Cuando entra un frame sus elipses se intercalan en el arreglo ordenado y
+cuando sale se eliminan, sin volver a decodificar ni reordenar los frames que siguen
+en la ventana. Los Fs salen directamente del volumen acumulado, con la misma
+interpolacion lineal que `scipy.interpolate.interp1d`.
+"""
+import threading
+from collections import defaultdict
+from itertools import count
+
+import numpy as np
+
+from .history import decode_axes
+
+PERCENTILES = np.array([10, 20, 30, 40, 50, 60, 70, 80, 90], dtype=np.float64)
+
+
+def frame_axes(item, px_mm):
+    """
+    Decodifica un elemento del historial (ejes por elipse en float32, ver
+    workers.history) y regresa (eje_M, eje_m) en mm ordenados por eje menor.
+    """
+    ejes = decode_axes(item)
+    eje_M = ejes.max(axis=1) * px_mm
+    eje_m = ejes.min(axis=1) * px_mm
+    order = np.argsort(eje_m, kind="stable")
+    return eje_M[order], eje_m[order]
+
+
+def interp_linear(x, y, x_new):
+    """
+    Interpolacion lineal con la misma formula y los mismos errores fuera de rango que
+    `interp1d(x, y)` (x ordenado de forma creciente).
+    """
+    if len(x) < 2:
+        raise ValueError("x and y arrays must have at least 2 entries")
+    if (x_new < x[0]).any():
+        raise ValueError(f"A value in x_new is below the interpolation range's minimum value ({x[0]}).")
+    if (x_new > x[-1]).any():
+        raise ValueError(f"A value in x_new is above the interpolation range's maximum value ({x[-1]}).")
+    hi = np.searchsorted(x, x_new).clip(1, len(x) - 1)
+    lo = hi - 1
+    slope = (y[hi] - y[lo]) / (x[hi] - x[lo])
+    return slope * (x_new - x[lo]) + y[lo]
+
+
+class PSDWindow:
+    """
+    Elipses de los frames en la ventana de una camara, mantenidas en arreglos ordenados
+    por eje menor (`eje_m`) junto con su volumen y el frame al que pertenecen.
+
+    Los frames se identifican por el elemento crudo del historial (bytes en Redis), asi
+    que un frame que sigue en la ventana nunca se vuelve a decodificar.
+    """
+
+    def __init__(self, px_mm):
+        self.px_mm = px_mm
+        self.eje_m = np.empty(0, dtype=np.float64)
+        self.vol = np.empty(0, dtype=np.float64)
+        self.owner = np.empty(0, dtype=np.int64)
+        # elemento crudo -> ids de sus apariciones en la ventana
+        self._frames = defaultdict(list)
+        self._ids = count()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._frames.values())
+
+    def _insert(self, item):
+        eje_M, eje_m = frame_axes(item, self.px_mm)
+        frame_id = next(self._ids)
+        vol = 4 / 3 * np.pi * (eje_M / 2) * np.power(eje_m / 2, 2)
+        pos = np.searchsorted(self.eje_m, eje_m, side="right")
+        self.eje_m = np.insert(self.eje_m, pos, eje_m)
+        self.vol = np.insert(self.vol, pos, vol)
+        self.owner = np.insert(self.owner, pos, frame_id)
+        self._frames[item].append(frame_id)
+
+    def _remove(self, item, n):
+        ids = self._frames[item]
+        gone, self._frames[item] = ids[:n], ids[n:]
+        if not self._frames[item]:
+            del self._frames[item]
+        keep = ~np.isin(self.owner, gone)
+        self.eje_m = self.eje_m[keep]
+        self.vol = self.vol[keep]
+        self.owner = self.owner[keep]
+
+    def sync(self, items):
+        """
+        Deja en la ventana exactamente los frames de `items` (elementos crudos del
+        historial). Solo se procesan los frames que entraron o salieron.
+        """
+        wanted = defaultdict(int)
+        for item in items:
+            wanted[item] += 1
+        for item in list(self._frames):
+            extra = len(self._frames[item]) - wanted.get(item, 0)
+            if extra > 0:
+                self._remove(item, extra)
+        for item, n in wanted.items():
+            for _ in range(n - len(self._frames.get(item, ()))):
+                self._insert(item)
+
+    def fs(self):
+        """
+        F10 ... F90 y el eje menor maximo de la ventana (10 valores). Lanza ValueError
+        si la curva no cubre el rango de percentiles, igual que interp1d.
+        """
+        cumulative = np.cumsum(self.vol / self.vol.sum() * 100)
+        fs = interp_linear(cumulative, self.eje_m, PERCENTILES)
+        return np.append(fs, self.eje_m.max())